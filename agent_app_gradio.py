@@ -1,51 +1,76 @@
 # app_gradio.py
 import gradio as gr
-from src.agents import ask, rag_search
+from src.agents import ask_stream_async, rag_search, MAX_CONCURRENT_REQUESTS, LLM_MODEL
+from src import resources
+from src.tracing import serve_metrics
 from pathlib import Path
 
 
-def respond(message, history):
-    """Handle user messages and return conversation history"""
+async def respond(message, history):
+    """Handle user messages and stream the answer into the conversation history"""
     if not message.strip():
-        return history
+        yield history
+        return
     
+    history.append({"role": "user", "content": message})
+    history.append({"role": "assistant", "content": ""})
     try:
-        answer = ask(message)
-        # history = history + [[message, answer]]
-        history.append({"role": "user", "content": message})
-        history.append({"role": "assistant", "content": answer})
+        async for event in ask_stream_async(message):
+            if event["type"] == "token":
+                history[-1]["content"] += event["text"]
+                yield history
+            elif event["sources"]:
+                sources = ", ".join(Path(s).name for s in event["sources"])
+                history[-1]["content"] += f"\n\nSources: {sources}"
+                yield history
     except Exception as e:
         # history = history + [[message, f"Error: {str(e)}"]]
-        history.append({"role": "user", "content": message})
-        history.append({"role": "assistant", "content": f"Error: {str(e)}"})
-    
-    return history
+        history[-1]["content"] = f"Error: {str(e)}"
+        yield history
 
 
 def handle_upload(file_paths):
     """
     When files are uploaded:
-    1. Index them
-    2. Update the global rag_search embeddings
+    1. Queue them for background indexing (parse, split, encode, index off the request thread)
+    2. Report the job's progress until its documents are live — questions keep being
+       answered from the current index meanwhile
     """
     if file_paths is None or len(file_paths) == 0:
-        return "No files uploaded."
-    
-    results = []
-    for file_path in file_paths:
-        file_path = Path(file_path)
-        
-        if not file_path.exists():
-            results.append(f"✗ {file_path.name}: File not found")
-            continue
-        
-        try:
-            rag_search.index_file(str(file_path))
-            results.append(f"✓ {file_path.name}")
-        except Exception as e:
-            results.append(f"✗ {file_path.name}: {str(e)}")
-    
-    return "\n".join(results)
+        yield "No files uploaded."
+        return
+
+    job = resources.get_indexing_queue().submit([str(Path(p)) for p in file_paths])
+    while not job.wait(timeout=0.5):
+        yield job.summary()
+    yield job.summary()
+
+
+def indexing_status():
+    """Recent indexing jobs, newest first"""
+    jobs = resources.get_indexing_queue().jobs()[-10:]
+    return "\n\n".join(job.summary() for job in reversed(jobs)) or "No indexing jobs yet."
+
+
+def list_documents():
+    """Indexed documents for the remove dropdown (label = file name, value = full source path)"""
+    return gr.update(choices=[(Path(s).name, s) for s in rag_search.vectorstore.sources()], value=None)
+
+
+def handle_remove(source):
+    """Drop one document from the knowledge base — its chunks, saved embeddings and upload copy"""
+    if not source:
+        return "No document selected."
+    try:
+        removed = resources.get_indexing_queue().remove(source)
+    except Exception as e:
+        return f"✗ {Path(source).name}: {str(e)}"
+    if not removed:
+        return f"✗ {Path(source).name}: not in the knowledge base"
+    if Path(source).exists():
+        # Not an upload — the file itself is left alone, so the next sync picks it up again
+        return f"✓ Removed {Path(source).name} ({removed} chunks) — delete {source} too to keep it out after the next sync"
+    return f"✓ Removed {Path(source).name} ({removed} chunks)"
 
 
 # === Gradio UI (Compatible with older versions) ===
@@ -78,13 +103,28 @@ with gr.Blocks() as demo:
         label="Status",
         interactive=False
     )
+
+    with gr.Row():
+        documents = gr.Dropdown(label="Indexed documents", choices=[], interactive=True)
+        remove_btn = gr.Button("Remove document")
+        jobs_btn = gr.Button("Indexing status")
     
     # Wire up events
     upload.upload(
         fn=handle_upload,
         inputs=upload,
         outputs=upload_status
-    )
+    ).then(fn=list_documents, inputs=None, outputs=documents)
+
+    jobs_btn.click(fn=indexing_status, inputs=None, outputs=upload_status)
+
+    remove_btn.click(
+        fn=handle_remove,
+        inputs=documents,
+        outputs=upload_status
+    ).then(fn=list_documents, inputs=None, outputs=documents)
+
+    demo.load(fn=list_documents, inputs=None, outputs=documents)
     
     def clear_all():
         return "", []
@@ -108,10 +148,17 @@ with gr.Blocks() as demo:
     )
 
 
+# Questions run concurrently (each request keeps its own graph state)
+demo.queue(default_concurrency_limit=MAX_CONCURRENT_REQUESTS)
+
 # Launch
 if __name__ == "__main__":
     print("Starting Gradio app...")
     print(f"Gradio version: {gr.__version__}")
+    # Load model, FAISS index and LLM client once, in the background, while the UI starts
+    resources.warmup(llm_model=LLM_MODEL)
+    # METRICS_PORT: Prometheus scrape endpoint; TRACE_JSONL: span log (see src/tracing.py)
+    serve_metrics()
     
     try:
         demo.launch(
@@ -1,9 +1,11 @@
 # src/app.py  ← Best version
 from src.search import RAGSearch
-import textwrap
+from src.tracing import serve_metrics
 
 if __name__ == "__main__":
     print("\n[RAG Demo] Starting RAG system...\n")
+    # METRICS_PORT: Prometheus scrape endpoint (see src/tracing.py)
+    serve_metrics()
     
     # Initialize once — handles everything (FAISS + LLM)
     rag = RAGSearch(llm_model="gpt-4.1")   # or "gpt-4o"
@@ -22,11 +24,9 @@ if __name__ == "__main__":
                 continue
 
             print("\nAnswer:")
-            answer = rag.query(query, top_k=6)
-            
-            # Beautiful wrapped output
-            wrapped = textwrap.fill(answer, width=80, replace_whitespace=False)
-            print(wrapped)
+            # Tokens are printed as they arrive
+            for token in rag.query_stream(query, top_k=6):
+                print(token, end="", flush=True)
             print("\n" + "—" * 80)
 
         except KeyboardInterrupt:
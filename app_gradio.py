@@ -1,18 +1,23 @@
 # app_gradio.py
 import gradio as gr
-from src.search import RAGSearch
-from langchain_core.messages import HumanMessage
-from src.prompt import prompt_llm
+from pathlib import Path
+from src.agents import ask_stream_async, MAX_CONCURRENT_REQUESTS, LLM_MODEL
+from src import resources
+from src.tracing import serve_metrics
 
-from src.agents import ask
+# Load model, FAISS index and LLM client once, in the background, while the UI starts
+resources.warmup(llm_model=LLM_MODEL)
 
-# Load your RAG system (loads FAISS + LLM)
-rag = RAGSearch(llm_model="gpt-4.1")   # or "gpt-4.1" if you want
-
-def respond(message, history):
+async def respond(message, history):
     yield "Thinking..."
-    answer = ask(message)
-    yield answer
+    answer = ""
+    async for event in ask_stream_async(message):
+        if event["type"] == "token":
+            answer += event["text"]
+            yield answer
+        elif event["sources"]:
+            sources = "\n".join(f"- {Path(s).name}" for s in event["sources"])
+            yield f"{answer}\n\n**Sources:**\n{sources}"
 
 
 
@@ -32,7 +37,11 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
         ]
     )
 
+# METRICS_PORT: Prometheus scrape endpoint; TRACE_JSONL: span log (see src/tracing.py)
+serve_metrics()
+
 # Launch — SIMPLE AND WORKING
+demo.queue(default_concurrency_limit=MAX_CONCURRENT_REQUESTS)
 demo.launch(
     server_name="127.0.0.1",
     server_port=7860,
@@ -1,85 +1,283 @@
 # src/agents.py
-from typing import Literal
+from typing import Literal, Iterator, AsyncIterator, Dict, List, Optional
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableLambda
 import textwrap
+import time
+import os
+import asyncio
+import threading
+import weakref
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 
-from src.search import RAGSearch
-from src.llm import get_llm
-from src.models import AgentState
+from src.resources import get_rag_search, get_llm_client, on_vector_store_loaded
+from src.models import AgentState, top_dense_score
+from src.answer_cache import SemanticAnswerCache
+from src.router import LocalRouter
+from src.batcher import MicroBatcher
 from src.prompt import ROUTING_PROMPT, RAG_ANSWER_PROMPT, DIRECT_ANSWER_PROMPT
 from src.logger import logger, router_logger, retrieval_logger, answer_logger
+from src.context import count_tokens
+from src.tracing import span, start_span, activate, annotate
 
-# Initialize
-rag_search = RAGSearch(llm_model="gpt-4.1")
-llm = get_llm(model="gpt-4.1")
-retrieved_chunks = []
+# Initialize — cheap: the model, index and LLM client load on first use (or via resources.warmup)
+LLM_MODEL = "gpt-4.1"
+rag_search = get_rag_search(llm_model=LLM_MODEL)
+# Chunks sent to the LLM — with RERANK=1 the reranked top 4 beat the raw top 6, in fewer prompt tokens
+CONTEXT_TOP_K = 4 if rag_search.rerank else 6
 
-def decide_route(state: AgentState) -> AgentState:
-    global retrieved_chunks
-    retrieved_chunks = []
+def _llm():
+    return get_llm_client(LLM_MODEL)
+
+# Near-duplicate questions are answered from cache; any corpus change clears it
+answer_cache = SemanticAnswerCache(threshold=0.95, ttl_s=3600, capacity=1000)
+on_vector_store_loaded(lambda store: store.on_change(answer_cache.invalidate))
+
+# ROUTER_MODE: llm | similarity | classifier | hybrid (local first, LLM only when unsure)
+router = LocalRouter(mode=os.getenv("ROUTER_MODE", "hybrid"))
+
+# SPECULATIVE_RETRIEVAL=1 (opt-in): start retrieval while the LLM router decides, discard it on DIRECT —
+# saves the retrieval time on RAG answers, wastes a retrieval on every DIRECT one
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "0") == "1"
+speculation_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative-retrieve")
+speculation_stats = {"questions": 0, "used": 0, "discarded": 0, "saved_ms": 0.0}
+speculation_lock = threading.Lock()
+
+# MAX_CONCURRENT_REQUESTS: questions ask_async runs at once (the rest wait their turn)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "16"))
+_request_slots = weakref.WeakKeyDictionary()  # event loop → asyncio.Semaphore
 
-    prompt = ROUTING_PROMPT.format(question=state["question"])
-    response = llm.invoke([HumanMessage(content=prompt)])
-    raw = response.content.strip()
-    route = "rag" if "RAG" in raw.upper() else "direct"
+# MICRO_BATCHING=1: concurrent questions arriving within a few ms share one encode + one FAISS search
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "0") == "1"
+retrieval_batcher = MicroBatcher(lambda questions: rag_search.retrieve_batch(questions, top_k=CONTEXT_TOP_K),
+                                 max_batch=32, max_wait_ms=5.0) if MICRO_BATCHING else None
 
-    router_logger.info(f"Question: {state['question']}")
+def _timed_retrieve(question: str, query_vector):
+    t0 = time.perf_counter()
+    retrieval = rag_search.retrieve(question, top_k=CONTEXT_TOP_K, query_vector=query_vector)
+    return retrieval, 1000 * (time.perf_counter() - t0)
+
+def _top1_score(query_vector) -> Optional[float]:
+    """Cosine similarity of the closest chunk — one dense top-1 search"""
+    with span("router.top1"):
+        hits = rag_search.vectorstore.search(query_vector, 1)
+    return hits[0]["score"] if hits else None
+
+# ---------- decide ----------
+# Everything per request lives in AgentState — nodes share no module state,
+# so concurrent questions cannot see each other's context.
+
+def _parse_route(raw: str) -> str:
     router_logger.info(f"LLM Routing Response: {raw}")
-    router_logger.info(f"DECISION → {'RAG (Documents)' if route == 'rag' else 'DIRECT (General Knowledge)'}")
-    
-    return {**state, "route": route}
+    return "rag" if "RAG" in raw.upper() else "direct"
+
+def llm_route(question: str) -> str:
+    prompt = ROUTING_PROMPT.format(question=question)
+    with span("llm.route", prompt_tokens=count_tokens(prompt)):
+        response = _llm().invoke([HumanMessage(content=prompt)])
+    return _parse_route(response.content.strip())
+
+async def allm_route(question: str) -> str:
+    prompt = ROUTING_PROMPT.format(question=question)
+    with span("llm.route", prompt_tokens=count_tokens(prompt)):
+        response = await _llm().ainvoke([HumanMessage(content=prompt)])
+    return _parse_route(response.content.strip())
+
+def _begin_route(state: AgentState):
+    """Pre-routing work shared by the sync and async nodes → (update, top1_score, speculative future)"""
+    question = state["question"]
+    query_vector = state.get("query_vector")
+    if query_vector is None:
+        query_vector = rag_search.encode_query(question)
+
+    update = {"query_vector": query_vector, "context": "", "retrieved_chunks": []}
+    top1_score = None
+    speculative = None
+    if state.get("retrieved_chunks"):
+        # Retrieved up front (ask_batch / micro-batcher) — nothing to fetch or speculate
+        update.update({"context": state["context"], "retrieved_chunks": state["retrieved_chunks"]})
+        if router.mode in ("similarity", "hybrid"):
+            top1_score = top_dense_score(state["retrieved_chunks"])
+        return update, top1_score, speculative
+    if router.mode in ("similarity", "hybrid"):
+        # The similarity router only needs the top dense hit — fusion, rerank and context
+        # building are left to retrieve_context, i.e. to questions that take the RAG branch
+        top1_score = _top1_score(query_vector)
+    if SPECULATIVE_RETRIEVAL and router.needs_llm(query_vector, top1_score):
+        # Retrieval is cheap and usually needed — run it concurrently with the routing call
+        # (in similarity / hybrid mode only when the score falls between the thresholds and the
+        # LLM has to decide; a local decision is instant, there is nothing to overlap with)
+        # copy_context: the speculative search is traced under this request's span
+        speculative = speculation_pool.submit(contextvars.copy_context().run, _timed_retrieve, question, query_vector)
+    return update, top1_score, speculative
+
+def _finish_route(state: AgentState, update: dict, route: str, source: str, top1_score,
+                  route_ms: float, speculation=None) -> AgentState:
+    """speculation: (retrieval, retrieve_ms, critical_ms) when a speculative retrieval was used"""
+    question = state["question"]
+    if speculation is not None:
+        retrieval, retrieve_ms, critical_ms = speculation
+        saved_ms = route_ms + retrieve_ms - critical_ms
+        update.update({"context": retrieval.context, "retrieved_chunks": retrieval.chunks})
+        router_logger.info(f"Speculative retrieval: route {route_ms:.0f}ms | retrieve {retrieve_ms:.0f}ms | "
+                           f"critical path {critical_ms:.0f}ms (saved {saved_ms:.0f}ms)")
+        with speculation_lock:
+            speculation_stats["questions"] += 1
+            speculation_stats["used"] += 1
+            speculation_stats["saved_ms"] += saved_ms
+
+    router_logger.info(f"Question: {question}")
+    if top1_score is not None:
+        router_logger.info(f"Top-1 corpus similarity: {top1_score:.3f}")
+    router_logger.info(f"DECISION → {'RAG (Documents)' if route == 'rag' else 'DIRECT (General Knowledge)'} via {source.upper()}")
+    if router.decisions % 50 == 0:
+        router_logger.info(f"Router stats: {router.stats()} | speculation: {speculation_stats}")
+
+    return {**state, **update, "route": route, "route_source": source}
+
+def _discard_speculation(speculative):
+    speculative.cancel()  # a search already running just finishes unused
+    with speculation_lock:
+        speculation_stats["questions"] += 1
+        speculation_stats["discarded"] += 1
+
+def decide_route(state: AgentState) -> AgentState:
+    question = state["question"]
+    with span("decide_route", router=router.mode) as s:
+        update, top1_score, speculative = _begin_route(state)
+
+        t0 = time.perf_counter()
+        route, source = router.route(question, update["query_vector"], top1_score, lambda: llm_route(question))
+        route_ms = 1000 * (time.perf_counter() - t0)
+
+        speculation = None
+        if speculative is not None:
+            if route == "rag":
+                retrieval, retrieve_ms = speculative.result()
+                speculation = (retrieval, retrieve_ms, 1000 * (time.perf_counter() - t0))
+            else:
+                _discard_speculation(speculative)
+        s.set(route=route, route_source=source, top1_score=top1_score, route_ms=route_ms,
+              speculative="used" if speculation else "discarded" if speculative else None)
+        return _finish_route(state, update, route, source, top1_score, route_ms, speculation)
+
+async def adecide_route(state: AgentState) -> AgentState:
+    question = state["question"]
+    with span("decide_route", router=router.mode) as s:
+        update, top1_score, speculative = await asyncio.to_thread(_begin_route, state)
+
+        t0 = time.perf_counter()
+        route, source = await router.aroute(question, update["query_vector"], top1_score,
+                                            lambda: allm_route(question))
+        route_ms = 1000 * (time.perf_counter() - t0)
+
+        speculation = None
+        if speculative is not None:
+            if route == "rag":
+                retrieval, retrieve_ms = await asyncio.wrap_future(speculative)
+                speculation = (retrieval, retrieve_ms, 1000 * (time.perf_counter() - t0))
+            else:
+                _discard_speculation(speculative)
+        s.set(route=route, route_source=source, top1_score=top1_score, route_ms=route_ms,
+              speculative="used" if speculation else "discarded" if speculative else None)
+        return _finish_route(state, update, route, source, top1_score, route_ms, speculation)
+
+# ---------- retrieve ----------
+_SCORE_PARTS = (("dense", "dense_score"), ("bm25", "bm25_score"), ("rerank", "rerank_score"))
 
 def retrieve_context(state: AgentState) -> AgentState:
-    global retrieved_chunks
-    context = rag_search.get_context(state["question"], top_k=6)
-    
-    # Get structured results
-    structured = rag_search._get_structured_context(state["question"], top_k=6)
-    retrieved_chunks = structured
+    with span("retrieve_context", prefetched=bool(state.get("retrieved_chunks"))) as s:
+        if state.get("retrieved_chunks"):
+            # Already retrieved while routing
+            context = state["context"]
+            retrieved_chunks = state["retrieved_chunks"]
+        else:
+            # One encode + one search gives both the prompt context and the chunks for logging
+            retrieval = rag_search.retrieve(state["question"], top_k=CONTEXT_TOP_K,
+                                            query_vector=state.get("query_vector"))
+            context = retrieval.context
+            retrieved_chunks = retrieval.chunks
+        s.set(chunks=len(retrieved_chunks))
 
     retrieval_logger.info(f"Retrieved {len(retrieved_chunks)} chunks for: {state['question']}")
     for i, chunk in enumerate(retrieved_chunks, 1):
         src = chunk.get("source", "Unknown")
         score = chunk.get("score", 0.0)
         snippet = chunk["text"].replace("\n", " ")[:200] + "..."
-        retrieval_logger.info(f"  [{i}] Score: {score:.3f} | Source: {src}")
+        parts = [f"{name} {chunk[key]:.3f}" for name, key in _SCORE_PARTS if chunk.get(key) is not None]
+        detail = f" ({', '.join(parts)})" if parts else ""
+        retrieval_logger.info(f"  [{i}] Score: {score:.3f}{detail} | Source: {src}")
         retrieval_logger.debug(f"      → {snippet}")
 
     return {**state, "context": context, "retrieved_chunks": retrieved_chunks}
 
-def generate_answer(state: AgentState) -> AgentState:
-    question = state["question"]
-    route = state["route"]
-
-    if route == "rag" and retrieved_chunks:
-        prompt = RAG_ANSWER_PROMPT.format(context=state["context"], question=question)
-        source_info = f"{len(retrieved_chunks)} document(s)"
-    else:
-        prompt = DIRECT_ANSWER_PROMPT.format(question=question)
-        source_info = "General knowledge"
+async def aretrieve_context(state: AgentState) -> AgentState:
+    # FAISS releases the GIL — searching on a worker thread keeps the event loop free
+    return await asyncio.to_thread(retrieve_context, state)
 
-    response = ""
-    for chunk in llm.stream([HumanMessage(content=prompt)]):
-        response += chunk.content
-    answer = response.strip()
+# ---------- generate ----------
+def _answer_prompt(state: AgentState):
+    question = state["question"]
+    retrieved_chunks = state.get("retrieved_chunks") or []
+    with span("prompt_build") as s:
+        if state["route"] == "rag" and retrieved_chunks:
+            prompt = RAG_ANSWER_PROMPT.format(context=state["context"], question=question)
+            source_info = f"{len(retrieved_chunks)} document(s)"
+        else:
+            prompt = DIRECT_ANSWER_PROMPT.format(question=question)
+            source_info = "General knowledge"
+        s.set(prompt_tokens=count_tokens(prompt))
+    return prompt, source_info
 
+def _log_answer(answer: str, source_info: str):
     answer_logger.info(f"Answer generated via: {source_info.upper()}")
     answer_logger.info(f"Final Answer:\n{textwrap.fill(answer, 100)}")
 
     logger.info("═" * 80)  # Visual separator in log
 
+def generate_answer(state: AgentState) -> AgentState:
+    with span("generate_answer", route=state["route"]) as s:
+        prompt, source_info = _answer_prompt(state)
+
+        response, n_tokens = "", 0
+        for chunk in _llm().stream([HumanMessage(content=prompt)]):
+            if chunk.content:
+                s.mark("ttft")
+                n_tokens += 1
+            response += chunk.content
+        answer = response.strip()
+        s.set(completion_tokens=n_tokens)
+
+    _log_answer(answer, source_info)
+    return {**state, "answer": answer}
+
+async def agenerate_answer(state: AgentState) -> AgentState:
+    with span("generate_answer", route=state["route"]) as s:
+        prompt, source_info = _answer_prompt(state)
+
+        response, n_tokens = "", 0
+        async for chunk in _llm().astream([HumanMessage(content=prompt)]):
+            if chunk.content:
+                s.mark("ttft")
+                n_tokens += 1
+            response += chunk.content
+        answer = response.strip()
+        s.set(completion_tokens=n_tokens)
+
+    _log_answer(answer, source_info)
     return {**state, "answer": answer}
 
 # Routing
 def choose_path(state: AgentState) -> Literal["retrieve", "generate"]:
     return "retrieve" if state["route"] == "rag" else "generate"
 
-# Build graph (same as before)
+# Build graph — every node has a sync and an async implementation (invoke / ainvoke)
 workflow = StateGraph(AgentState)
-workflow.add_node("decide", decide_route)
-workflow.add_node("retrieve", retrieve_context)
-workflow.add_node("generate", generate_answer)
+workflow.add_node("decide", RunnableLambda(decide_route, afunc=adecide_route))
+workflow.add_node("retrieve", RunnableLambda(retrieve_context, afunc=aretrieve_context))
+workflow.add_node("generate", RunnableLambda(generate_answer, afunc=agenerate_answer))
 workflow.set_entry_point("decide")
 workflow.add_conditional_edges("decide", choose_path, {"retrieve": "retrieve", "generate": "generate"})
 workflow.add_edge("retrieve", "generate")
@@ -87,13 +285,244 @@ workflow.add_edge("generate", END)
 
 agentic_rag = workflow.compile()
 
-def ask(question: str) -> str:
-    initial_state = {
+# decide → retrieve only: the streaming entry points generate the answer themselves, token by token
+prepare_workflow = StateGraph(AgentState)
+prepare_workflow.add_node("decide", RunnableLambda(decide_route, afunc=adecide_route))
+prepare_workflow.add_node("retrieve", RunnableLambda(retrieve_context, afunc=aretrieve_context))
+prepare_workflow.set_entry_point("decide")
+prepare_workflow.add_conditional_edges("decide", choose_path, {"retrieve": "retrieve", "generate": END})
+prepare_workflow.add_edge("retrieve", END)
+
+prepare_graph = prepare_workflow.compile()
+
+def _initial_state(question: str, query_vector, retrieval=None) -> AgentState:
+    return {
         "question": question,
-        "context": "", "answer": "", "route": "direct", "retrieved_chunks": []
+        "context": retrieval.context if retrieval else "",
+        "answer": "", "route": "direct", "route_source": "",
+        "retrieved_chunks": retrieval.chunks if retrieval else [],
+        "query_vector": query_vector,
     }
-    result = agentic_rag.invoke(initial_state)
-    return result["answer"]
+
+def _cached_answer(question: str, query_vector, kb_version: int):
+    cached = answer_cache.lookup(query_vector, kb_version)
+    annotate(answer_cache_hits=int(cached is not None), answer_cache_misses=int(cached is None))
+    if cached is not None:
+        logger.info(f"Answer cache HIT (sim {cached['similarity']:.3f}) for: {question} "
+                    f"→ cached question: {cached['question']} | {answer_cache.stats()}")
+        return cached["answer"]
+    return None
+
+def _cache_result(question: str, query_vector, kb_version: int, result: AgentState, started: float):
+    # answer call (+ routing call when the local router had to fall back)
+    llm_calls = 1 + (result.get("route_source") == "llm")
+    answer_cache.store(question, query_vector, result["answer"], kb_version,
+                       llm_calls=llm_calls, latency_s=time.perf_counter() - started, route=result["route"])
+
+def ask(question: str) -> str:
+    with span("ask", mode="sync") as s:
+        t0 = time.perf_counter()
+        retrieval = retrieval_batcher(question) if retrieval_batcher else None
+        query_vector = retrieval.query_vector if retrieval else rag_search.encode_query(question)
+        kb_version = rag_search.vectorstore.version
+
+        cached = _cached_answer(question, query_vector, kb_version)
+        if cached is not None:
+            s.set(route="cache")
+            return cached
+
+        result = agentic_rag.invoke(_initial_state(question, query_vector, retrieval))
+        _cache_result(question, query_vector, kb_version, result, t0)
+        s.set(route=result["route"])
+        return result["answer"]
+
+def ask_batch(questions: List[str], max_concurrency: int = MAX_CONCURRENT_REQUESTS) -> List[str]:
+    """
+    Answer many questions at once (offline evaluation, bulk jobs):
+    one encode + one FAISS search for all of them, then the graphs — and so the
+    LLM calls — run concurrently, at most max_concurrency at a time.
+    """
+    with span("ask_batch", questions=len(questions)):
+        t0 = time.perf_counter()
+        kb_version = rag_search.vectorstore.version
+        retrievals = rag_search.retrieve_batch(questions, top_k=CONTEXT_TOP_K)
+
+        answers = [None] * len(questions)
+        todo = []
+        for i, (question, retrieval) in enumerate(zip(questions, retrievals)):
+            cached = _cached_answer(question, retrieval.query_vector, kb_version)
+            if cached is not None:
+                answers[i] = cached
+            else:
+                todo.append(i)
+
+        states = [_initial_state(questions[i], retrievals[i].query_vector, retrievals[i]) for i in todo]
+        results = agentic_rag.batch(states, config={"max_concurrency": max_concurrency})
+        for i, result in zip(todo, results):
+            answers[i] = result["answer"]
+            _cache_result(questions[i], retrievals[i].query_vector, kb_version, result, t0)
+
+    elapsed = time.perf_counter() - t0
+    logger.info(f"ask_batch: {len(questions)} questions ({len(questions) - len(todo)} cached) in {elapsed:.1f}s "
+                f"→ {len(questions) / max(elapsed, 1e-9):.2f} q/s")
+    return answers
+
+async def _aretrieve_up_front(question: str):
+    """→ (retrieval or None, query_vector); with micro-batching the retrieval joins the current batch"""
+    if retrieval_batcher:
+        retrieval = await asyncio.wrap_future(retrieval_batcher.submit(question))
+        return retrieval, retrieval.query_vector
+    return None, await asyncio.to_thread(rag_search.encode_query, question)
+
+async def ask_async(question: str) -> str:
+    """Concurrency-safe async ask — LLM calls are awaited, at most MAX_CONCURRENT_REQUESTS run at once"""
+    loop = asyncio.get_running_loop()
+    slots = _request_slots.setdefault(loop, asyncio.Semaphore(MAX_CONCURRENT_REQUESTS))
+    async with slots:
+        with span("ask", mode="async") as s:
+            t0 = time.perf_counter()
+            retrieval, query_vector = await _aretrieve_up_front(question)
+            kb_version = rag_search.vectorstore.version
+
+            cached = _cached_answer(question, query_vector, kb_version)
+            if cached is not None:
+                s.set(route="cache")
+                return cached
+
+            result = await agentic_rag.ainvoke(_initial_state(question, query_vector, retrieval))
+            _cache_result(question, query_vector, kb_version, result, t0)
+            s.set(route=result["route"])
+            return result["answer"]
+
+# ---------- streaming ----------
+# Events: {"type": "token", "text": ...} for every streamed chunk, then one
+# {"type": "final", "answer", "route", "sources", "ttft_ms", "tokens_per_s"}
+
+def _sources(state: AgentState):
+    if state["route"] != "rag":
+        return []
+    return list(dict.fromkeys(c["source"] for c in state.get("retrieved_chunks") or []))
+
+def _final_event(question: str, answer: str, state: AgentState, started: float,
+                 first_token_at: float, n_tokens: int) -> Dict:
+    finished = time.perf_counter()
+    ttft_ms = 1000 * ((first_token_at or finished) - started)
+    gen_s = finished - (first_token_at or finished)
+    tokens_per_s = n_tokens / gen_s if gen_s > 0 else 0.0
+    answer_logger.info(f"Streaming stats: TTFT {ttft_ms:.0f}ms | {n_tokens} tokens | {tokens_per_s:.1f} tok/s | "
+                       f"total {1000 * (finished - started):.0f}ms | {question}")
+    return {"type": "final", "answer": answer, "route": state["route"], "sources": _sources(state),
+            "ttft_ms": ttft_ms, "tokens_per_s": tokens_per_s}
+
+def _cached_events(question: str, answer: str, started: float):
+    state = {"route": "cache", "retrieved_chunks": []}
+    yield {"type": "token", "text": answer}
+    yield _final_event(question, answer, state, started, time.perf_counter(), 1)
+
+def ask_stream(question: str) -> Iterator[Dict]:
+    """Like ask(), but yields answer tokens as the LLM produces them"""
+    # Generators must not hold the current span across yields (the consumer may resume them from
+    # another thread / context) — spans are activated around the non-yielding parts only
+    root = start_span("ask", mode="stream")
+    gen = None
+    try:
+        with activate(root):
+            t0 = time.perf_counter()
+            retrieval = retrieval_batcher(question) if retrieval_batcher else None
+            query_vector = retrieval.query_vector if retrieval else rag_search.encode_query(question)
+            kb_version = rag_search.vectorstore.version
+
+            cached = _cached_answer(question, query_vector, kb_version)
+        if cached is not None:
+            root.set(route="cache")
+            yield from _cached_events(question, cached, t0)
+            return
+
+        with activate(root):
+            state = prepare_graph.invoke(_initial_state(question, query_vector, retrieval))
+            root.set(route=state["route"])
+            gen = start_span("generate_answer", route=state["route"])
+            with activate(gen):
+                prompt, source_info = _answer_prompt(state)
+
+        parts, first_token_at = [], None
+        for chunk in _llm().stream([HumanMessage(content=prompt)]):
+            if not chunk.content:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                gen.mark("ttft")
+            parts.append(chunk.content)
+            yield {"type": "token", "text": chunk.content}
+        gen.set(completion_tokens=len(parts)).end()
+
+        answer = "".join(parts).strip()
+        _log_answer(answer, source_info)
+        state = {**state, "answer": answer}
+        _cache_result(question, query_vector, kb_version, state, t0)
+        event = _final_event(question, answer, state, t0, first_token_at, len(parts))
+        root.set(ttft_ms=event["ttft_ms"])
+        yield event
+    except Exception as e:  # not GeneratorExit: a client leaving early is no error
+        root.error = repr(e)
+        raise
+    finally:
+        if gen is not None:
+            gen.end()
+        root.end()
+
+async def ask_stream_async(question: str) -> AsyncIterator[Dict]:
+    """Async twin of ask_stream — shares ask_async's concurrency limit"""
+    loop = asyncio.get_running_loop()
+    slots = _request_slots.setdefault(loop, asyncio.Semaphore(MAX_CONCURRENT_REQUESTS))
+    async with slots:
+        root = start_span("ask", mode="stream_async")
+        gen = None
+        try:
+            with activate(root):
+                t0 = time.perf_counter()
+                retrieval, query_vector = await _aretrieve_up_front(question)
+                kb_version = rag_search.vectorstore.version
+
+                cached = _cached_answer(question, query_vector, kb_version)
+            if cached is not None:
+                root.set(route="cache")
+                for event in _cached_events(question, cached, t0):
+                    yield event
+                return
+
+            with activate(root):
+                state = await prepare_graph.ainvoke(_initial_state(question, query_vector, retrieval))
+                root.set(route=state["route"])
+                gen = start_span("generate_answer", route=state["route"])
+                with activate(gen):
+                    prompt, source_info = _answer_prompt(state)
+
+            parts, first_token_at = [], None
+            async for chunk in _llm().astream([HumanMessage(content=prompt)]):
+                if not chunk.content:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    gen.mark("ttft")
+                parts.append(chunk.content)
+                yield {"type": "token", "text": chunk.content}
+            gen.set(completion_tokens=len(parts)).end()
+
+            answer = "".join(parts).strip()
+            _log_answer(answer, source_info)
+            state = {**state, "answer": answer}
+            _cache_result(question, query_vector, kb_version, state, t0)
+            event = _final_event(question, answer, state, t0, first_token_at, len(parts))
+            root.set(ttft_ms=event["ttft_ms"])
+            yield event
+        except Exception as e:  # not GeneratorExit: a client leaving early is no error
+            root.error = repr(e)
+            raise
+        finally:
+            if gen is not None:
+                gen.end()
+            root.end()
 
 # Test
 if __name__ == "__main__":
@@ -108,4 +537,7 @@ if __name__ == "__main__":
             break
         if not q:
             continue
-        ask(q)
\ No newline at end of file
+        for event in ask_stream(q):
+            if event["type"] == "token":
+                print(event["text"], end="", flush=True)
+        print()
@@ -0,0 +1,87 @@
+# src/answer_cache.py
+import time
+import threading
+import numpy as np
+from typing import Dict, Optional
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache in front of the agent graph, keyed on the query embedding.
+
+    A lookup hits when cosine similarity to a stored question ≥ threshold, the entry
+    is younger than ttl_s and was answered against the current knowledge-base version.
+    Capacity is enforced by evicting the least-recently-used entry. Vectors live in one
+    preallocated matrix, so a lookup is a single (capacity × dim) @ (dim,) product.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl_s: float = 3600, capacity: int = 1000):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._vectors = None                         # (capacity, dim) float32, lazily sized
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._created = np.zeros(capacity)
+        self._last_used = np.zeros(capacity)
+        self._entries = [None] * capacity
+
+        self.hits = self.misses = 0
+        self.llm_calls_avoided = 0
+        self.latency_saved_s = 0.0
+
+    def lookup(self, query_vector: np.ndarray, kb_version: int) -> Optional[Dict]:
+        t0 = time.perf_counter()
+        with self._lock:
+            if self._vectors is None or not self._valid.any():
+                self.misses += 1
+                return None
+            now = time.time()
+            self._valid &= (now - self._created) < self.ttl_s  # expire lazily
+
+            sims = self._vectors @ query_vector.reshape(-1).astype(np.float32)
+            sims[~self._valid] = -np.inf
+            slot = int(np.argmax(sims))
+            entry = self._entries[slot]
+            if sims[slot] < self.threshold or entry["kb_version"] != kb_version:
+                self.misses += 1
+                return None
+
+            self._last_used[slot] = now
+            self.hits += 1
+            self.llm_calls_avoided += entry["llm_calls"]
+            self.latency_saved_s += max(entry["latency_s"] - (time.perf_counter() - t0), 0.0)
+            return {**entry, "similarity": float(sims[slot])}
+
+    def store(self, question: str, query_vector: np.ndarray, answer: str, kb_version: int,
+              llm_calls: int, latency_s: float, **extra):
+        vector = query_vector.reshape(-1).astype(np.float32)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+            free = np.flatnonzero(~self._valid)
+            slot = int(free[0]) if len(free) else int(np.argmin(self._last_used))  # LRU eviction
+            self._vectors[slot] = vector
+            self._valid[slot] = True
+            self._created[slot] = self._last_used[slot] = time.time()
+            self._entries[slot] = {
+                "question": question, "answer": answer, "kb_version": kb_version,
+                "llm_calls": llm_calls, "latency_s": latency_s, **extra,
+            }
+
+    def invalidate(self, *_):
+        """Drop everything — registered as a FAISSVectorStore.on_change listener"""
+        with self._lock:
+            self._valid[:] = False
+            self._entries = [None] * self.capacity
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": int(self._valid.sum()),
+            "llm_calls_avoided": self.llm_calls_avoided,
+            "latency_saved_s": round(self.latency_saved_s, 3),
+        }
@@ -0,0 +1,327 @@
+# src/benchmark.py
+"""
+Benchmark harness: python -m src.benchmark --out bench.json [--compare previous.json]
+
+Stages (pick with --stages):
+    ingest   load_all_documents + EmbeddingPipeline on a synthetic corpus → files/s, chunks/s
+    build    FAISSVectorStore.build_from_embeddings over that corpus
+    search   FAISSVectorStore.search p50/p95/p99 + QPS on synthetic vectors at --sizes chunks
+    ask      agents.ask() end to end against StubLLM → latency percentiles, retrieval hit rate
+
+Everything runs inside --workdir (a fresh temp dir by default), so the repo's data/,
+faiss_store/ and logs/ are never touched. --embedder hash (default) needs no model download;
+--embedder model uses the real SentenceTransformer. Results are one JSON document; --compare
+prints the change against an earlier run and flags regressions.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+LLM_MODEL = "gpt-4.1"
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+def percentiles(samples_ms: List[float]) -> Dict:
+    a = np.asarray(samples_ms, dtype=np.float64)
+    if not len(a):
+        return {}
+    return {
+        "p50_ms": round(float(np.percentile(a, 50)), 3),
+        "p95_ms": round(float(np.percentile(a, 95)), 3),
+        "p99_ms": round(float(np.percentile(a, 99)), 3),
+        "mean_ms": round(float(a.mean()), 3),
+        "max_ms": round(float(a.max()), 3),
+    }
+
+
+def _meta(args) -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, timeout=10).stdout.strip()
+    except Exception:
+        commit = ""
+    import faiss
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "faiss": faiss.__version__,
+        "numpy": np.__version__,
+        "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+    }
+
+
+# ---------- stages ----------
+def bench_ingest(corpus_dir: str, workers: Optional[int]) -> Dict:
+    from src.data_loader import load_all_documents
+    from src.resources import get_embedding_pipeline
+
+    t0 = time.perf_counter()
+    docs = load_all_documents(corpus_dir, workers=workers or 1)
+    parse_s = time.perf_counter() - t0
+
+    pipeline = get_embedding_pipeline(EMBEDDING_MODEL)
+    t0 = time.perf_counter()
+    changes = pipeline.run_on_new_files("data", workers=workers)
+    embed_s = time.perf_counter() - t0
+    n_files = len(changes["new"]) + len(changes["modified"])
+    n_chunks = pipeline.archive.live_rows()
+    return {
+        "files": n_files,
+        "pages": len(docs),
+        "chunks": n_chunks,
+        "parse_s": round(parse_s, 3),
+        "pipeline_s": round(embed_s, 3),
+        "files_per_s": round(n_files / embed_s, 2),
+        "chunks_per_s": round(n_chunks / embed_s, 1),
+        "embedding_cache": pipeline.cache.stats(),
+    }
+
+
+def bench_build(index_type: Optional[str], index_params: Optional[Dict]) -> Dict:
+    from src.resources import rss_mb
+    from src.vectorstore import FAISSVectorStore
+
+    store = FAISSVectorStore("faiss_store", index_type=index_type, index_params=index_params)
+    rss0, t0 = rss_mb(), time.perf_counter()
+    store.build_from_embeddings("data/embeddings")
+    return {
+        "chunks": len(store.chunks),
+        "index_type": store.index_type,
+        "build_s": round(time.perf_counter() - t0, 3),
+        "index_bytes": store.index_path.stat().st_size,
+        "rss_delta_mb": round(rss_mb() - rss0, 1),
+    }
+
+
+def _search_timings(store, queries: np.ndarray, top_k: int) -> Dict:
+    for q in queries[:20]:  # warm caches / pages
+        store.search(q[None, :], top_k)
+    samples = []
+    t_all = time.perf_counter()
+    for q in queries:
+        t0 = time.perf_counter()
+        store.search(q[None, :], top_k)
+        samples.append(1000 * (time.perf_counter() - t0))
+    single_s = time.perf_counter() - t_all
+    t0 = time.perf_counter()
+    store.search_batch(queries, top_k)
+    batch_s = time.perf_counter() - t0
+    return {**percentiles(samples), "qps": round(len(queries) / single_s, 1),
+            "batch_qps": round(len(queries) / batch_s, 1)}
+
+
+def bench_search(n_chunks: int, dim: int, n_queries: int, top_k: int, index_type: Optional[str],
+                 index_params: Optional[Dict], keep: bool) -> Dict:
+    """Synthetic vectors → archive → build_from_embeddings (streamed, like production) → search"""
+    from src.embedding_archive import EmbeddingArchive
+    from src.resources import rss_mb
+    from src.synthetic import synthetic_queries, synthetic_vectors
+    from src.vectorstore import FAISSVectorStore
+
+    root = Path(f"scale_{n_chunks}")
+    shutil.rmtree(root, ignore_errors=True)
+    archive = EmbeddingArchive(root / "embeddings" / "archive")
+    t0 = time.perf_counter()
+    first, row = None, 0
+    for batch in synthetic_vectors(n_chunks, dim):
+        first = batch if first is None else first
+        for start in range(0, len(batch), 1000):  # 1000 chunks per synthetic "file"
+            vectors = batch[start:start + 1000]
+            name = f"synthetic/file_{(row + start) // 1000:06d}.txt"
+            archive.add_file(name, name, [f"synthetic chunk {row + start + i}" for i in range(len(vectors))],
+                             [{}] * len(vectors), vectors)
+        row += len(batch)
+    archive.flush()
+    generate_s = time.perf_counter() - t0
+
+    store = FAISSVectorStore(str(root / "store"), index_type=index_type, index_params=index_params)
+    rss0, t0 = rss_mb(), time.perf_counter()
+    store.build_from_embeddings(str(root / "embeddings"))
+    build_s = time.perf_counter() - t0
+    result = {
+        "n_chunks": n_chunks,
+        "dim": dim,
+        "index_type": store.index_type,
+        "generate_s": round(generate_s, 3),
+        "build_s": round(build_s, 3),
+        "index_bytes": store.index_path.stat().st_size,
+        "rss_delta_mb": round(rss_mb() - rss0, 1),
+        "top_k": top_k,
+        **_search_timings(store, synthetic_queries(first, n_queries), top_k),
+    }
+    del store, archive
+    if not keep:
+        shutil.rmtree(root, ignore_errors=True)
+    return result
+
+
+def bench_ask(queries: List[Dict], n_questions: int) -> Dict:
+    import src.agents as agents
+
+    # Mostly document questions, plus every general-knowledge one so both routes are timed
+    direct = [q for q in queries if not q["source"]][:n_questions]
+    queries = [q for q in queries if q["source"]][:n_questions - len(direct)] + direct
+    # Retrieval alone first: does the known source come back in the context chunks?
+    hits, retrieval_ms = 0, []
+    rag_queries = [q for q in queries if q["source"]]
+    for q in rag_queries:
+        t0 = time.perf_counter()
+        retrieval = agents.rag_search.retrieve(q["question"], top_k=agents.CONTEXT_TOP_K)
+        retrieval_ms.append(1000 * (time.perf_counter() - t0))
+        hits += any(c["source"] == q["source"] for c in retrieval.chunks)
+
+    llm = agents._llm()
+    calls_before = getattr(llm, "calls", 0)
+    ask_ms = []
+    for q in queries:
+        t0 = time.perf_counter()
+        agents.ask(q["question"])
+        ask_ms.append(1000 * (time.perf_counter() - t0))
+    return {
+        "questions": len(queries),
+        "retrieval": {**percentiles(retrieval_ms), f"hit@{agents.CONTEXT_TOP_K}":
+                      round(hits / len(rag_queries), 4) if rag_queries else None},
+        "ask": {**percentiles(ask_ms), "qps": round(len(ask_ms) / (sum(ask_ms) / 1000), 2)},
+        "llm_calls": getattr(llm, "calls", 0) - calls_before,
+        "router": agents.router.stats(),
+        "answer_cache": agents.answer_cache.stats(),
+    }
+
+
+# ---------- comparison ----------
+def _flatten(result: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in result.items():
+        if key in ("meta", "errors", "comparison"):
+            continue
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + "."))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    flat.update(_flatten(item, f"{path}[{item.get('n_chunks', len(flat))}]."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def _higher_is_better(metric: str) -> Optional[bool]:
+    name = metric.rsplit(".", 1)[-1]
+    if name.startswith("max_"):
+        return None  # a single outlier — too noisy to call a regression
+    if name.endswith(("_per_s", "qps")) or name.startswith(("hit@", "hit_rate")):
+        return True
+    if name.endswith(("_ms", "_s", "_mb", "_bytes")):
+        return False
+    return None
+
+
+def compare(old: Dict, new: Dict, threshold: float = 0.10) -> List[Dict]:
+    """Metric-by-metric change between two result files; worse by more than threshold = regression"""
+    old_flat, new_flat = _flatten(old), _flatten(new)
+    rows = []
+    for metric in sorted(old_flat.keys() & new_flat.keys()):
+        direction = _higher_is_better(metric)
+        before, after = old_flat[metric], new_flat[metric]
+        if direction is None or not before:
+            continue
+        change = (after - before) / abs(before)
+        worse = -change if direction else change
+        rows.append({"metric": metric, "before": before, "after": after, "change": round(change, 4),
+                     "regression": worse > threshold})
+    print(f"\n{'metric':<48} {'before':>12} {'after':>12} {'change':>8}")
+    for r in rows:
+        flag = "  REGRESSION" if r["regression"] else ""
+        print(f"{r['metric']:<48} {r['before']:>12} {r['after']:>12} {r['change']:>+8.1%}{flag}")
+    return rows
+
+
+# ---------- main ----------
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Ingestion / build / search / ask benchmarks")
+    parser.add_argument("--stages", default="ingest,build,search,ask")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier result file to diff against")
+    parser.add_argument("--workdir", help="scratch directory (default: a new temp dir, removed afterwards)")
+    parser.add_argument("--docs", type=int, default=200, help="synthetic documents for ingest / build / ask")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="chunk counts for the search stage")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=1000, help="search queries per size")
+    parser.add_argument("--questions", type=int, default=50, help="ask() calls")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--index-type", default=None)
+    parser.add_argument("--index-params", default=None, help='JSON, e.g. \'{"rescore": 4}\'')
+    parser.add_argument("--embedder", choices=("hash", "model"), default="hash")
+    parser.add_argument("--workers", type=int, default=None, help="document parsing processes")
+    parser.add_argument("--llm-ttft-ms", type=float, default=150.0)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=80.0)
+    parser.add_argument("--keep", action="store_true", help="keep the workdir and scale stores")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    index_params = json.loads(args.index_params) if args.index_params else None
+    out_path = Path(args.out).resolve()
+    compare_path = Path(args.compare).resolve() if args.compare else None
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="rag-bench-")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)  # before importing anything that opens data/, faiss_store/ or logs/
+    print(f"[Benchmark] Working in {workdir}")
+
+    from src import resources
+    from src.synthetic import HashEmbedder, StubLLM, generate_corpus
+    resources.provide(f"llm:{LLM_MODEL}", StubLLM(args.llm_ttft_ms, args.llm_tokens_per_s))
+    if args.embedder == "hash":
+        resources.provide(f"embedding_model:{EMBEDDING_MODEL}", HashEmbedder(args.dim))
+
+    results: Dict = {"meta": _meta(args), "errors": {}}
+    queries = []
+    if {"ingest", "build", "ask"} & set(stages):
+        _, queries = generate_corpus("data/corpus", n_docs=args.docs)
+
+    def run(stage: str, fn, *fn_args):
+        print(f"\n[Benchmark] === {stage} ===")
+        try:
+            return fn(*fn_args)
+        except Exception as e:  # one broken stage shouldn't lose the others' numbers
+            print(f"[Benchmark] {stage} failed: {e!r}")
+            results["errors"][stage] = repr(e)
+            return None
+
+    if "ingest" in stages or "build" in stages or "ask" in stages:
+        results["ingest"] = run("ingest", bench_ingest, "data/corpus", args.workers)
+    if "build" in stages or "ask" in stages:
+        results["build"] = run("build", bench_build, args.index_type, index_params)
+    if "search" in stages:
+        results["search"] = [r for r in (run(f"search {n}", bench_search, n, args.dim, args.queries, args.top_k,
+                                             args.index_type, index_params, args.keep)
+                                         for n in (int(s) for s in args.sizes.split(","))) if r]
+    if "ask" in stages:
+        results["ask"] = run("ask", bench_ask, queries, args.questions)
+
+    out_path.write_text(json.dumps(results, indent=2, default=str))
+    print(f"\n[Benchmark] Results → {out_path}")
+    if compare_path:
+        results["comparison"] = compare(json.loads(compare_path.read_text()), results)
+        out_path.write_text(json.dumps(results, indent=2, default=str))
+    if not args.keep and not args.workdir:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+# src/chunkstore.py
+import os
+import json
+import mmap
+import time
+import shutil
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+
+class ChunkStore:
+    """
+    Columnar, memory-mapped chunk metadata (replaces metadata.pkl).
+
+    chunks/
+        text.bin        all chunk texts, utf-8, back to back
+        offsets.bin     int64 end offset of every row in text.bin
+        source_ids.bin  int32 per row → index into sources.json
+        sources.json    interned source table
+        added_at.bin    float64 per row, ingestion time (unix seconds)
+        meta_ids.bin    int32 per row → line of metas.jsonl
+        metas.jsonl     interned loader metadata dicts (page, author, ...); line 0 is {}
+        ids.bin         int64 per row, the chunk's stable id (ascending; survives compaction)
+        vectors.bin     optional float32 [rows, dim] embeddings, kept for rescoring compressed indexes
+        state.json      {"next_id": ..., "dim": ...} — ids are never reused, even after the tail is deleted
+
+    Nothing is unpickled at startup: the columns are mmap'd, so a lookup only
+    materialises the rows it returns and worker processes share the pages via
+    the OS page cache. Appends are O(new rows).
+
+    Filters (rows_where) go through per-attribute posting lists — value id → sorted rows —
+    built lazily from the int32 columns and extended incrementally on append.
+    """
+
+    def __init__(self, store_dir: Path):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.text_path = self.store_dir / "text.bin"
+        self.offsets_path = self.store_dir / "offsets.bin"
+        self.source_ids_path = self.store_dir / "source_ids.bin"
+        self.sources_path = self.store_dir / "sources.json"
+        self.added_at_path = self.store_dir / "added_at.bin"
+        self.meta_ids_path = self.store_dir / "meta_ids.bin"
+        self.metas_path = self.store_dir / "metas.jsonl"
+        self.ids_path = self.store_dir / "ids.bin"
+        self.vectors_path = self.store_dir / "vectors.bin"
+        self.state_path = self.store_dir / "state.json"
+
+        for path in (self.text_path, self.offsets_path, self.source_ids_path):
+            path.touch(exist_ok=True)
+        self.sources = json.loads(self.sources_path.read_text()) if self.sources_path.exists() else []
+        self._source_index = {s: i for i, s in enumerate(self.sources)}
+        if not self.metas_path.exists():
+            self.metas_path.write_text("{}\n")
+        self.metas = [json.loads(line) for line in self.metas_path.read_text().splitlines() if line]
+        self._meta_index = {json.dumps(m, sort_keys=True): i for i, m in enumerate(self.metas)}
+        self._attr_index: Dict[str, tuple] = {}
+        self._attr_lock = threading.Lock()  # concurrent searches extend the posting lists
+        state = json.loads(self.state_path.read_text()) if self.state_path.exists() else {}
+        self._next_id_floor = state.get("next_id", 0)
+        self.dim = state.get("dim")
+        self._map()
+        self._backfill_columns()
+
+    # ---------- mapping ----------
+    def _map(self):
+        self._offsets = self._memmap(self.offsets_path, np.int64)
+        self._source_ids = self._memmap(self.source_ids_path, np.int32)
+        self._added_at = self._memmap(self.added_at_path, np.float64)
+        self._meta_ids = self._memmap(self.meta_ids_path, np.int32)
+        self._ids = self._memmap(self.ids_path, np.int64)
+        self._vectors = self._memmap(self.vectors_path, np.float32).reshape(-1, self.dim or 0) \
+            if self.dim else np.empty((0, 0), dtype=np.float32)
+        size = self.text_path.stat().st_size
+        if size:
+            with open(self.text_path, "rb") as f:
+                self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._text = b""
+
+    @staticmethod
+    def _memmap(path: Path, dtype) -> np.ndarray:
+        if not path.exists() or path.stat().st_size == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r")
+
+    def _backfill_columns(self):
+        """Stores written before added_at / meta_ids / ids existed: unknown time (0), empty metadata
+        and id = row (what positional FAISS ids and old tombstones already meant)"""
+        n = min(len(self._offsets), len(self._source_ids))
+        missing = False
+        for path, column, fill in ((self.added_at_path, self._added_at, lambda k: np.zeros(k)),
+                                   (self.meta_ids_path, self._meta_ids, lambda k: np.zeros(k, dtype=np.int32)),
+                                   (self.ids_path, self._ids, lambda k: np.arange(n - k, n, dtype=np.int64))):
+            if len(column) < n:
+                with open(path, "ab") as f:
+                    f.write(fill(n - len(column)).tobytes())
+                missing = True
+        if missing:
+            self._map()
+
+    def __len__(self) -> int:
+        # offsets is written last on append → it defines the committed row count
+        return min(len(self._offsets), len(self._source_ids), len(self._added_at), len(self._meta_ids),
+                   len(self._ids))
+
+    @property
+    def next_id(self) -> int:
+        n = len(self)
+        return max(int(self._ids[n - 1]) + 1 if n else 0, self._next_id_floor)
+
+    # ---------- reads ----------
+    def text(self, row: int) -> str:
+        start = int(self._offsets[row - 1]) if row > 0 else 0
+        return bytes(self._text[start:int(self._offsets[row])]).decode("utf-8")
+
+    def source(self, row: int) -> str:
+        return self.sources[int(self._source_ids[row])]
+
+    def metadata(self, row: int) -> Dict:
+        return self.metas[int(self._meta_ids[row])]
+
+    def added_at(self, row: int) -> float:
+        return float(self._added_at[row])
+
+    def get(self, row: int) -> Dict:
+        return {"text": self.text(row), "source": self.source(row), "metadata": self.metadata(row)}
+
+    def get_many(self, rows: Iterable[int]) -> List[Dict]:
+        return [self.get(int(r)) for r in rows]
+
+    @property
+    def has_vectors(self) -> bool:
+        """Every row has its float32 vector (stores written without them, or before, don't)"""
+        return self.dim is not None and len(self._vectors) >= len(self)
+
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        """float32 vectors of the given rows — only those pages are read from disk"""
+        return np.asarray(self._vectors[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+
+    # ---------- ids ----------
+    def ids_for_rows(self, rows: np.ndarray) -> np.ndarray:
+        return np.asarray(self._ids[:len(self)])[np.asarray(rows, dtype=np.int64)]
+
+    def rows_for_ids(self, ids: np.ndarray) -> np.ndarray:
+        """Stable ids → current rows (binary search — ids are ascending); -1 for ids not in the store"""
+        ids = np.asarray(ids, dtype=np.int64)
+        column = np.asarray(self._ids[:len(self)])
+        rows = np.searchsorted(column, ids)
+        found = rows < len(column)
+        found[found] = column[rows[found]] == ids[found]
+        return np.where(found, rows, -1)
+
+    def rows_for_source(self, source: str) -> np.ndarray:
+        """All rows of one source, from the source posting lists — no text touched"""
+        sid = self._source_index.get(source)
+        return self._rows_for_ids("source", self._source_ids, [sid] if sid is not None else [])
+
+    # ---------- attribute index ----------
+    def _postings(self, name: str, column: np.ndarray) -> Dict[int, np.ndarray]:
+        """value id → sorted rows for an int32 column; only rows appended since the last call are indexed"""
+        n = len(self)
+        with self._attr_lock:
+            postings, done = self._attr_index.get(name, ({}, 0))
+            if done < n:
+                tail = np.asarray(column[done:n])
+                order = np.argsort(tail, kind="stable")
+                values, starts = np.unique(tail[order], return_index=True)
+                for value, rows in zip(values.tolist(), np.split(order.astype(np.int64) + done, starts[1:])):
+                    postings[value] = np.concatenate([postings[value], rows]) if value in postings else rows
+                self._attr_index[name] = (postings, n)
+            return postings
+
+    def _rows_for_ids(self, name: str, column: np.ndarray, ids: Iterable[int]) -> np.ndarray:
+        postings = self._postings(name, column)
+        parts = [postings[i] for i in ids if i in postings]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+
+    def rows_where(self, sources: Optional[Iterable[str]] = None, file_types: Optional[Iterable[str]] = None,
+                   added_after: Optional[float] = None, added_before: Optional[float] = None,
+                   metadata: Optional[Dict] = None) -> np.ndarray:
+        """
+        Sorted rows matching every given condition:
+        sources      exact source paths
+        file_types   extensions (".pdf" or "pdf"), matched against the source path
+        added_after / added_before   ingestion time range (unix seconds)
+        metadata     {key: value or [values]} over the loader metadata (e.g. {"page": [0, 1]})
+        """
+        candidates = []
+        if sources is not None:
+            candidates.append(self._rows_for_ids(
+                "source", self._source_ids, [self._source_index[s] for s in sources if s in self._source_index]))
+        if file_types is not None:
+            exts = {("." + t.lower().lstrip(".")) for t in file_types}
+            candidates.append(self._rows_for_ids(
+                "source", self._source_ids, [i for i, s in enumerate(self.sources) if Path(s).suffix.lower() in exts]))
+        for key, wanted in (metadata or {}).items():
+            wanted = list(wanted) if isinstance(wanted, (list, tuple, set)) else [wanted]
+            candidates.append(self._rows_for_ids(
+                "meta", self._meta_ids, [i for i, m in enumerate(self.metas) if key in m and m[key] in wanted]))
+
+        if candidates:
+            candidates.sort(key=len)
+            rows = candidates[0]
+            for other in candidates[1:]:
+                rows = np.intersect1d(rows, other, assume_unique=True)
+        else:
+            rows = np.arange(len(self), dtype=np.int64)
+
+        if added_after is not None or added_before is not None:
+            added = np.asarray(self._added_at)[rows]
+            keep = np.ones(len(rows), dtype=bool)
+            if added_after is not None:
+                keep &= added >= added_after
+            if added_before is not None:
+                keep &= added < added_before
+            rows = rows[keep]
+        return rows
+
+    # ---------- writes ----------
+    def _intern(self, source: str) -> int:
+        if source not in self._source_index:
+            self._source_index[source] = len(self.sources)
+            self.sources.append(source)
+        return self._source_index[source]
+
+    def _intern_meta(self, metadata: Dict) -> int:
+        key = json.dumps(metadata, sort_keys=True, default=str)
+        if key not in self._meta_index:
+            self._meta_index[key] = len(self.metas)
+            self.metas.append(json.loads(key))
+            with open(self.metas_path, "a") as f:
+                f.write(key + "\n")
+        return self._meta_index[key]
+
+    def _save_sources(self):
+        tmp = self.sources_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.sources))
+        os.replace(tmp, self.sources_path)
+
+    def append(self, records: List[Dict]) -> np.ndarray:
+        """Append rows ({"text", "source"}, optional "metadata" / "added_at" / "id" / "vector") → their ids.
+        Columns first, offsets last as the commit."""
+        if not records:
+            return np.empty(0, dtype=np.int64)
+        n_sources = len(self.sources)
+        now = time.time()
+        next_id = self.next_id
+        ids = np.array([r["id"] if "id" in r else next_id + i for i, r in enumerate(records)], dtype=np.int64)
+        encoded = [r["text"].encode("utf-8") for r in records]
+        source_ids = np.array([self._intern(r["source"]) for r in records], dtype=np.int32)
+        meta_ids = np.array([self._intern_meta(r.get("metadata") or {}) for r in records], dtype=np.int32)
+        added_at = np.array([r.get("added_at", now) for r in records], dtype=np.float64)
+        if len(self.sources) != n_sources:
+            self._save_sources()
+
+        text_end = int(self._offsets[len(self) - 1]) if len(self) else 0
+        offsets = text_end + np.cumsum([len(b) for b in encoded], dtype=np.int64)
+        # Vectors only while the column covers every row so far — it must stay aligned with them
+        vectors = None
+        if all("vector" in r for r in records) and len(self._vectors) == len(self) and (self.dim or not len(self)):
+            vectors = np.asarray([r["vector"] for r in records], dtype=np.float32)
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._save_state()
+
+        # Drop any torn tail left by a crash before appending
+        self._truncate_files(len(self), text_end)
+        with open(self.text_path, "ab") as f:
+            f.write(b"".join(encoded))
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.source_ids_path, "ab") as f:
+            f.write(source_ids.tobytes())
+        with open(self.added_at_path, "ab") as f:
+            f.write(added_at.tobytes())
+        with open(self.meta_ids_path, "ab") as f:
+            f.write(meta_ids.tobytes())
+        with open(self.ids_path, "ab") as f:
+            f.write(ids.tobytes())
+        if vectors is not None:
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+        with open(self.offsets_path, "ab") as f:
+            f.write(offsets.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._map()
+        return ids
+
+    def truncate(self, n_rows: int):
+        """Keep only the first n_rows rows (crash recovery)"""
+        if n_rows >= len(self):
+            return
+        text_end = int(self._offsets[n_rows - 1]) if n_rows > 0 else 0
+        self._truncate_files(n_rows, text_end)
+        self._map()
+
+    def _truncate_files(self, n_rows: int, text_end: int):
+        self._text = b""
+        self._offsets = self._source_ids = self._added_at = self._meta_ids = self._ids = self._vectors = None
+        self._attr_index = {}
+        for path, size in ((self.offsets_path, n_rows * 8), (self.source_ids_path, n_rows * 4),
+                           (self.added_at_path, n_rows * 8), (self.meta_ids_path, n_rows * 4),
+                           (self.ids_path, n_rows * 8), (self.vectors_path, n_rows * 4 * (self.dim or 0)),
+                           (self.text_path, text_end)):
+            if path.exists() and path.stat().st_size > size:
+                os.truncate(path, size)
+
+    @classmethod
+    def write(cls, store_dir: Path, records: Iterable[Dict], next_id: int = 0):
+        """Write a fresh store into an empty directory; ids continue from next_id unless records carry them"""
+        store_dir = Path(store_dir)
+        shutil.rmtree(store_dir, ignore_errors=True)
+        store = cls(store_dir)
+        store._set_next_id(next_id)
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= 10_000:
+                store.append(batch)
+                batch = []
+        store.append(batch)
+        store._set_next_id(store.next_id)
+        store.close()
+
+    @classmethod
+    def rebuild(cls, store_dir: Path, records: Iterable[Dict], next_id: int = 0) -> "ChunkStore":
+        """Write a fresh store next to the old one, then swap directories"""
+        store_dir = Path(store_dir)
+        tmp_dir = store_dir.with_name(store_dir.name + ".tmp")
+        cls.write(tmp_dir, records, next_id)
+        shutil.rmtree(store_dir, ignore_errors=True)
+        os.replace(tmp_dir, store_dir)
+        return cls(store_dir)
+
+    def _set_next_id(self, next_id: int):
+        self._next_id_floor = next_id
+        self._save_state()
+
+    def _save_state(self):
+        self.state_path.write_text(json.dumps({"next_id": self._next_id_floor, "dim": self.dim}))
+
+    def close(self):
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        self._text = b""
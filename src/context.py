@@ -0,0 +1,118 @@
+# src/context.py
+import re
+from typing import Dict, List, Tuple
+
+# Token counts: tiktoken when available (it comes with langchain_openai), else ~4 chars per token
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_encoding.encode(text, disallowed_special=()))
+except Exception:
+    def count_tokens(text: str) -> int:
+        return (len(text) + 3) // 4
+
+_WORD = re.compile(r"\w+")
+SEPARATOR = "\n\n"
+
+
+def _overlap(a: str, b: str, max_overlap: int) -> int:
+    """Length of the longest suffix of a that is also a prefix of b (the splitter's chunk_overlap).
+    Only whole words count — "...ends" + "second..." sharing an "s" is not an overlap."""
+    for size in range(min(len(a), len(b), max_overlap), 0, -1):
+        if a.endswith(b[:size]) and (size == len(a) or not a[-size - 1].isalnum()) \
+                and (size == len(b) or not b[size].isalnum()):
+            return size
+    return 0
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < n:
+        return {tuple(words)}
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def build_context(chunks: List[Dict], max_tokens: int = 1500, dup_threshold: float = 0.85,
+                  max_overlap: int = 400) -> Tuple[str, Dict]:
+    """
+    Chunks (best first) → (context string, stats).
+
+    1. neighbouring rows of the same source are stitched together, with the splitter's
+       overlap removed, so the LLM reads one passage instead of two half-repeated ones
+    2. passages whose word 3-grams are mostly (>= dup_threshold) contained in a better passage
+       are dropped — the same paragraph in two copies of a paper
+    3. passages are packed best-first until max_tokens; the first one that doesn't fit
+       is cut down, everything after it is left out
+    """
+    if not chunks:
+        return "", {"chunks": 0, "passages": 0, "merged": 0, "duplicates": 0, "dropped": 0,
+                    "raw_tokens": 0, "context_tokens": 0, "saved_tokens": 0}
+
+    # 1. merge adjacent rows (row ids are assigned in file order, so id + 1 = next chunk of the file)
+    by_id = {c["id"]: (rank, c) for rank, c in enumerate(chunks)}
+    seen, passages = set(), []
+    for rank, chunk in enumerate(chunks):
+        if chunk["id"] in seen:
+            continue
+        start = chunk["id"]
+        while start - 1 in by_id and by_id[start - 1][1]["source"] == chunk["source"]:
+            start -= 1
+        text, row, best = "", start, rank
+        while row in by_id and by_id[row][1]["source"] == chunk["source"]:
+            r, part = by_id[row]
+            if not text:
+                text = part["text"]
+            else:
+                cut = _overlap(text, part["text"], max_overlap)
+                # No shared overlap (splitter overlap 0, or it ended on whitespace) — keep the words apart
+                sep = "" if cut or text[-1:].isspace() or part["text"][:1].isspace() else "\n"
+                text = text + sep + part["text"][cut:]
+            best = min(best, r)
+            seen.add(row)
+            row += 1
+        passages.append({"rank": best, "text": text, "rows": row - start})
+    passages.sort(key=lambda p: p["rank"])
+    merged = len(chunks) - len(passages)
+
+    # 2. near-duplicate removal, keeping the better-ranked copy
+    kept, kept_shingles = [], []
+    for passage in passages:
+        sh = _shingles(passage["text"])
+        if any(len(sh & other) / max(len(sh), 1) >= dup_threshold for other in kept_shingles):
+            continue
+        kept.append(passage)
+        kept_shingles.append(sh)
+    duplicates = len(passages) - len(kept)
+
+    # 3. pack into the token budget
+    parts, used = [], 0
+    sep_tokens = count_tokens(SEPARATOR)
+    for passage in kept:
+        cost = count_tokens(passage["text"]) + (sep_tokens if parts else 0)
+        if used + cost <= max_tokens:
+            parts.append(passage["text"])
+            used += cost
+            continue
+        room = max_tokens - used - (sep_tokens if parts else 0)
+        if room > 50:  # a useful fragment still fits — cut at a word boundary
+            text = passage["text"]
+            cut = text[:max(room * len(text) // max(count_tokens(text), 1), 1)]
+            cut = cut.rsplit(" ", 1)[0] if " " in cut else cut
+            parts.append(cut)
+        break
+
+    context = SEPARATOR.join(parts)
+    raw_tokens = count_tokens(SEPARATOR.join(c["text"] for c in chunks))
+    context_tokens = count_tokens(context)
+    return context, {
+        "chunks": len(chunks),
+        "passages": len(parts),
+        "merged": merged,
+        "duplicates": duplicates,
+        "dropped": len(kept) - len(parts),
+        "raw_tokens": raw_tokens,
+        "context_tokens": context_tokens,
+        "saved_tokens": raw_tokens - context_tokens,
+    }
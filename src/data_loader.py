@@ -1,55 +1,91 @@
+import os
 from pathlib import Path
-from typing import List, Any
+from typing import List, Any, Iterator, Tuple
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, CSVLoader
 from langchain_community.document_loaders import Docx2txtLoader
 from langchain_community.document_loaders.excel import UnstructuredExcelLoader
 from langchain_community.document_loaders import JSONLoader
 
-def load_all_documents(data_input: str | List[str]) -> List[Any]:
+def resolve_paths(data_input: str | List[str]) -> List[Path]:
+    # If it's a list of files (like ["data/pdfs/paper.pdf"])
+    if isinstance(data_input, (list, tuple)):
+        return [Path(p) for p in data_input]
+    # It's a folder → find all files recursively
+    data_path = Path(data_input).resolve()
+    return [p for p in data_path.rglob("*") if p.is_file()]
+
+def load_document(file_path: str | Path) -> List[Any]:
+    """Load a single file → list of pages/rows. Top-level so worker processes can pickle it."""
+    file_path = Path(file_path).resolve()
+    try:
+        if file_path.suffix.lower() == ".pdf":
+            loader = PyPDFLoader(str(file_path))
+        elif file_path.suffix.lower() in [".txt", ".md"]:
+            loader = TextLoader(str(file_path), encoding="utf-8")
+        elif file_path.suffix.lower() == ".csv":
+            loader = CSVLoader(str(file_path))
+        elif file_path.suffix.lower() in [".xlsx", ".xls"]:
+            loader = UnstructuredExcelLoader(str(file_path))
+        elif file_path.suffix.lower() == ".docx":
+            loader = Docx2txtLoader(str(file_path))
+        elif file_path.suffix.lower() == ".json":
+            loader = JSONLoader(str(file_path), jq_schema=".[]", text_content=False)
+        else:
+            print(f"[Skip] Unsupported file type: {file_path}")
+            return []
+
+        docs = loader.load()
+        for doc in docs:
+            doc.metadata["source"] = str(file_path)  # important for tracking
+        print(f"[Loaded] {file_path.name} → {len(docs)} pages/rows")
+        return docs
+
+    except Exception as e:
+        print(f"[ERROR] Failed {file_path}: {e}")
+        return []
+
+def iter_documents(data_input: str | List[str], workers: int = None, max_pending: int = None) -> Iterator[Tuple[Path, List[Any]]]:
+    """
+    Stream (file_path, docs) as files finish parsing.
+    Parsing runs in a process pool; at most max_pending files are in flight,
+    so memory stays flat no matter how many files the folder holds.
+    """
+    file_paths = resolve_paths(data_input)
+    workers = workers or os.cpu_count() or 1
+
+    if workers <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            yield file_path, load_document(file_path)
+        return
+
+    max_pending = max_pending or workers * 2
+    paths = iter(file_paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(load_document, p): p for p in islice(paths, max_pending)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path = pending.pop(future)
+                next_path = next(paths, None)
+                if next_path is not None:
+                    pending[pool.submit(load_document, next_path)] = next_path
+                yield file_path, future.result()
+
+def load_all_documents(data_input: str | List[str], workers: int = 1) -> List[Any]:
     """
     Accepts either:
     - a folder path (str) → loads all files inside
     - a list of file paths → loads only those files
+    workers > 1 parses files in parallel processes
     """
     documents = []
-
-    # If it's a list of files (like ["data/pdfs/paper.pdf"])
-    if isinstance(data_input, (list, tuple)):
-        file_paths = [Path(p) for p in data_input]
-    else:
-        # It's a folder → find all files recursively
-        data_path = Path(data_input).resolve()
-        file_paths = [p for p in data_path.rglob("*") if p.is_file()]
-
+    file_paths = resolve_paths(data_input)
     print(f"[INFO] Loading {len(file_paths)} file(s)...")
 
-    for file_path in file_paths:
-        file_path = file_path.resolve()
-        try:
-            if file_path.suffix.lower() == ".pdf":
-                loader = PyPDFLoader(str(file_path))
-            elif file_path.suffix.lower() in [".txt", ".md"]:
-                loader = TextLoader(str(file_path), encoding="utf-8")
-            elif file_path.suffix.lower() == ".csv":
-                loader = CSVLoader(str(file_path))
-            elif file_path.suffix.lower() in [".xlsx", ".xls"]:
-                loader = UnstructuredExcelLoader(str(file_path))
-            elif file_path.suffix.lower() == ".docx":
-                loader = Docx2txtLoader(str(file_path))
-            elif file_path.suffix.lower() == ".json":
-                loader = JSONLoader(str(file_path), jq_schema=".[]", text_content=False)
-            else:
-                print(f"[Skip] Unsupported file type: {file_path}")
-                continue
-
-            docs = loader.load()
-            for doc in docs:
-                doc.metadata["source"] = str(file_path)  # important for tracking
-            documents.extend(docs)
-            print(f"[Loaded] {file_path.name} → {len(docs)} pages/rows")
-
-        except Exception as e:
-            print(f"[ERROR] Failed {file_path}: {e}")
+    for _, docs in iter_documents(file_paths, workers=workers):
+        documents.extend(docs)
 
     print(f"[Success] Total loaded: {len(documents)} document pages")
     return documents
@@ -57,6 +93,6 @@ def load_all_documents(data_input: str | List[str]) -> List[Any]:
     
 # Example usage
 if __name__ == "__main__":
-    docs = load_all_documents("data")
+    docs = load_all_documents("data", workers=os.cpu_count())
     print(f"Loaded {len(docs)} documents.")
-    print("Example document:", docs[0] if docs else None)
\ No newline at end of file
+    print("Example document:", docs[0] if docs else None)
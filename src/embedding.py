@@ -1,18 +1,22 @@
 # src/embedding.py
 import os
-import pickle
+import time
 from pathlib import Path
-from typing import List
+from typing import List, Dict, Iterator, Tuple
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
+from langchain_core.documents import Document
 import numpy as np
-from src.data_loader import load_all_documents
+from src.data_loader import iter_documents
+from src.embedding_archive import EmbeddingArchive
+from src.manifest import EmbeddingManifest
+from src.resources import get_embedding_model, get_embedding_cache
 
 class EmbeddingPipeline:
 
     #chunking
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2", chunk_size: int = 1000, chunk_overlap: int = 200):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", chunk_size: int = 1000, chunk_overlap: int = 200,
+                 archive_dtype: str = "float32"):
+        self.model_name = model_name
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
@@ -21,49 +25,174 @@ class EmbeddingPipeline:
         )
         self.embed_dir = Path("data/embeddings")
         self.embed_dir.mkdir(exist_ok=True)
+        # All embeddings live in one archive (float16 halves it on disk); old per-file .pkl are imported once.
+        # Archive before manifest: the import records the files it brought in there
+        self.archive = EmbeddingArchive(self.embed_dir / "archive", dtype=archive_dtype, legacy_dir=self.embed_dir)
+        self.manifest = EmbeddingManifest(self.embed_dir / "manifest.json")
 
     #embeddings : for embedding we will use hugging face's sentence transformer model    
 
-    def get_embed_path(self, file_path: str) -> Path:
-        # example: data/docs/paper.pdf → data/embeddings/paper.pdf.pkl
-        stem = Path(file_path).relative_to("data").with_suffix(".pkl")
-        return self.embed_dir / stem
+    # Model and cache come from the process-wide registry: loaded on first use, shared by every pipeline
+    @property
+    def model(self):
+        return get_embedding_model(self.model_name)
+
+    @property
+    def cache(self):
+        return get_embedding_cache(self.model_name)
+
+    def encode(self, texts: List[str], batch_size: int = 64, query: bool = False) -> np.ndarray:
+        """Every encode goes through the (model, text hash) cache — query=True also uses the hot tier"""
+        return self.cache.encode(self.model, texts, batch_size=batch_size, query=query)
 
     def file_already_embedded(self, file_path: str) -> bool:
-        return self.get_embed_path(file_path).exists()
+        return self.archive.has_file(file_path)
 
     def save_embeddings(self, file_path: str, chunks: List, embeddings: np.ndarray):
-        pkl_path = self.get_embed_path(file_path)
-        pkl_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(pkl_path, "wb") as f:
-            pickle.dump({"chunks": chunks, "embeddings": embeddings}, f)
-        print(f"[Saved] {file_path} → {pkl_path}")
+        source = chunks[0].metadata.get("source", file_path) if chunks else file_path
+        self.archive.add_file(file_path, source, [c.page_content for c in chunks],
+                              [dict(c.metadata) for c in chunks], embeddings)
+        print(f"[Saved] {file_path} → {self.archive.root}")
+
+    def iter_chunks(self, file_paths: List[str], workers: int = None) -> Iterator[Tuple[str, List]]:
+        """Stream (file_path, chunks) — files are parsed in worker processes, split here.
+        file_path is given back as passed in (only the chunks' source is resolved), so it matches the manifest"""
+        for path, docs in iter_documents(file_paths, workers=workers):
+            yield str(path), self.splitter.split_documents(docs)
+
+    def _saved_vectors(self, file_path: str) -> Dict[str, np.ndarray]:
+        """chunk hash → vector from the file's previous embeddings (if any)"""
+        saved = self.archive.load_file(file_path)
+        if saved is None:
+            return {}
+        _, texts, _, vectors = saved
+        return {self.manifest.chunk_hash(t): np.asarray(v, dtype=np.float32) for t, v in zip(texts, vectors)}
 
-    def run_on_new_files(self, data_folder: str = "data"):
+    def _apply_rename(self, old_path: str, new_path: str, vectorstore=None):
+        """Same content, new path → repoint the archived embeddings, no re-encode"""
+        entry = self.manifest.files.pop(old_path)
+        self.manifest.files[new_path] = entry
+        self.manifest.record(new_path, entry["sha256"], entry["chunk_hashes"])
+        if "error" in entry:
+            self.manifest.files[new_path]["error"] = entry["error"]
+        if not self.archive.has_file(old_path):  # never indexed (it failed to parse) — nothing else to move
+            print(f"[Renamed] {old_path} → {new_path}")
+            return
+        new_source = str(Path(new_path).resolve())
+        self.archive.rename_file(old_path, new_path, new_source)
+        if vectorstore is not None:
+            _, texts, metadatas, vectors = self.archive.load_file(new_path)
+            vectorstore.remove_sources([str(Path(old_path).resolve())])
+            vectorstore.add_embeddings(texts, np.asarray(vectors, dtype=np.float32),
+                                       [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)])
+        print(f"[Renamed] {old_path} → {new_path}")
+
+    def _apply_delete(self, file_path: str, vectorstore=None):
+        self.archive.remove_file(file_path)
+        self.manifest.forget(file_path)
+        if vectorstore is not None:
+            vectorstore.remove_sources([str(Path(file_path).resolve())])
+        print(f"[Deleted] {file_path}")
+
+    def run_on_new_files(self, data_folder: str = "data", workers: int = None, batch_size: int = 64, vectorstore=None):
+        """
+        Incremental sync of data_folder against the manifest:
+        - unchanged files (size/mtime, then content hash) are skipped
+        - renamed files reuse their embeddings, deleted files are dropped
+        - new/modified files are parsed in a process pool; only chunks whose hash is
+          not in the file's previous embeddings are encoded, in fixed-size batches that
+          span file boundaries. Each file is saved as soon as its last chunk is ready.
+        - a file that yields no chunks (parse error, unsupported type) is recorded as failed and
+          skipped until it changes again; if it was indexed before, that version stays
+        If a FAISSVectorStore is passed, it is updated in place (removed sources are tombstoned,
+        changed ones swapped with replace_sources once their new vectors are ready) instead of
+        needing a full rebuild.
+        """
         all_files = [str(p) for p in Path(data_folder).rglob("*") if p.is_file() and not str(p).startswith("data/embeddings")]
-        new_files = 0
+        changes = self.manifest.scan(all_files)
+        print(f"[Sync] {len(changes['new'])} new | {len(changes['modified'])} modified | "
+              f"{len(changes['renamed'])} renamed | {len(changes['deleted'])} deleted | "
+              f"{len(changes['unchanged'])} unchanged")
 
-        for file_path in all_files:
-            if self.file_already_embedded(file_path):
-                print(f"[Skip] Already embedded: {file_path}")
-                continue
+        for old_path, new_path in changes["renamed"]:
+            self._apply_rename(old_path, new_path, vectorstore)
+        for file_path in changes["deleted"]:
+            self._apply_delete(file_path, vectorstore)
 
-            print(f"[Processing] {file_path}")
-            docs = load_all_documents([file_path])  # load only this one file
-            chunks = self.splitter.split_documents(docs)
+        to_process = changes["new"] + changes["modified"]
+        start = time.perf_counter()
+        encode_time = 0.0
+        total_chunks = 0
+        reused_chunks = 0
+        saved_files = 0
+        failed_files = 0
+        pending = []    # (file_path, row, chunk) waiting for the next encode batch
+        in_flight = {}  # file_path → {"chunks", "hashes", "vectors", "remaining"}
+
+        def finish(file_path):
+            nonlocal saved_files
+            state = in_flight.pop(file_path)
+            embeddings = np.vstack(state["vectors"]).astype("float32")
+            self.save_embeddings(file_path, state["chunks"], embeddings)
+            digest = changes["hashes"].get(file_path) or self.manifest.file_hash(file_path)
+            self.manifest.record(file_path, digest, state["hashes"])
+            if vectorstore is not None:
+                # Old chunks of a modified file go out in the same commit the new ones come in
+                vectorstore.replace_sources([str(Path(file_path).resolve())], [c.page_content for c in state["chunks"]],
+                                            embeddings.copy(), state["chunks"])
+            saved_files += 1
+
+        def encode_batch(batch):
+            nonlocal encode_time
+            t0 = time.perf_counter()
+            vectors = self.encode([c.page_content for _, _, c in batch], batch_size=batch_size)
+            encode_time += time.perf_counter() - t0
+
+            for (file_path, row, _), vector in zip(batch, vectors):
+                state = in_flight[file_path]
+                state["vectors"][row] = vector
+                state["remaining"] -= 1
+                if state["remaining"] == 0:
+                    finish(file_path)
+
+        for file_path, chunks in self.iter_chunks(to_process, workers=workers):
+            print(f"[Processing] {file_path} → {len(chunks)} chunks")
             if not chunks:
+                # Keep whatever was indexed before; don't parse it again until the file changes
+                digest = changes["hashes"].get(file_path) or self.manifest.file_hash(file_path)
+                self.manifest.record_failure(file_path, digest, "no chunks (parse error or unsupported type)")
+                failed_files += 1
+                print(f"[Failed] {file_path} — no chunks; any earlier version stays indexed, retried once the file changes")
                 continue
+            # Unchanged chunks (same text hash) keep their old vectors
+            previous = self._saved_vectors(file_path)
+            hashes = [self.manifest.chunk_hash(c.page_content) for c in chunks]
+            vectors = [previous.get(h) for h in hashes]
+            missing = [i for i, v in enumerate(vectors) if v is None]
+            total_chunks += len(chunks)
+            reused_chunks += len(chunks) - len(missing)
 
-            embeddings = self.model.encode(
-                [c.page_content for c in chunks],
-                show_progress_bar=False,
-                normalize_embeddings=True
-            ).astype('float32')
-
-            self.save_embeddings(file_path, chunks, embeddings)
-            new_files += 1
+            in_flight[file_path] = {"chunks": chunks, "hashes": hashes, "vectors": vectors, "remaining": len(missing)}
+            if not missing:
+                finish(file_path)
+                continue
+            pending.extend((file_path, i, chunks[i]) for i in missing)
+            while len(pending) >= batch_size:
+                encode_batch(pending[:batch_size])
+                del pending[:batch_size]
+        if pending:
+            encode_batch(pending)
 
-        print(f"\n[Done] Processed {new_files} new files. All embeddings are up to date!")
+        # Archive first: a file the manifest lists must already have its embeddings on disk
+        self.archive.flush()
+        self.archive.maybe_compact()
+        self.manifest.save()
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        print(f"\n[Done] Processed {saved_files} new/modified files ({failed_files} failed). All embeddings are up to date!")
+        print(f"[Throughput] {len(to_process) / elapsed:.2f} files/s | {total_chunks / elapsed:.1f} chunks/s | "
+              f"{total_chunks} chunks ({reused_chunks} reused) in {elapsed:.1f}s (encoding {encode_time:.1f}s)")
+        print(f"[EmbeddingCache] {self.cache.stats()}")
+        return changes
 
 # Run this every time – it’s safe and fast
 if __name__ == "__main__":
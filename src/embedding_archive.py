@@ -0,0 +1,284 @@
+# src/embedding_archive.py
+import os
+import json
+import time
+import pickle
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class EmbeddingArchive:
+    """
+    Consolidated, pickle-free store of every embedded chunk (replaces one .pkl per source file).
+
+    data/embeddings/archive/
+        meta.json                  dim, dtype, shard list, file → (shard, start, count, source, added_at),
+                                   legacy_imported once the old .pkl files were imported
+        shard_000001.npy           L2-normalised vectors, float32 / float16 / int8 (x127) — np.load(mmap_mode="r")
+        shard_000001.chunks.jsonl  one {"text", "metadata"} row per vector
+
+    Files are buffered and written as one shard per flush (not one file per document).
+    meta.json is replaced last, so it is the commit point: a shard it doesn't list is
+    leftover from a crash and gets deleted. Deleting or re-embedding a file only drops
+    it from meta.json; compact() rewrites the shards once most rows are dead.
+    Readers stream shard by shard — nothing ever holds the whole corpus in memory.
+    """
+
+    SHARD_ROWS = 50_000
+    COMPACT_DEAD_RATIO = 0.5
+
+    def __init__(self, root: Path, dtype: str = "float32", legacy_dir: Optional[Path] = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.meta_path = self.root / "meta.json"
+        if self.meta_path.exists():
+            self.meta = json.loads(self.meta_path.read_text())
+        else:
+            self.meta = {"dim": None, "dtype": dtype, "next_shard": 1, "shards": {}, "files": {}}
+        self._buffer: List[Tuple[str, str, List[Dict], np.ndarray, float]] = []
+        self._remove_orphans()
+        if legacy_dir is not None and not self.meta.get("legacy_imported"):
+            # Once per archive: an archive that already has files went through it before this flag
+            # existed, and deleting every document later must not bring the pickles back
+            if not self.meta["files"]:
+                self.import_pickles(Path(legacy_dir))
+            self.meta["legacy_imported"] = True
+            self._save_meta()
+
+    # ---------- layout ----------
+    def _vectors_path(self, shard: str) -> Path:
+        return self.root / f"{shard}.npy"
+
+    def _chunks_path(self, shard: str) -> Path:
+        return self.root / f"{shard}.chunks.jsonl"
+
+    def _remove_orphans(self):
+        for path in self.root.glob("shard_*"):
+            if path.name.split(".")[0] not in self.meta["shards"]:
+                path.unlink(missing_ok=True)
+
+    def _save_meta(self):
+        tmp = self.meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.meta))
+        os.replace(tmp, self.meta_path)
+
+    # ---------- writes ----------
+    def add_file(self, file_path: str, source: str, texts: List[str], metadatas: List[Dict], embeddings: np.ndarray,
+                 added_at: Optional[float] = None):
+        """Buffer one file's chunks; written on flush() (automatically once SHARD_ROWS are buffered)"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        rows = [{"text": t, "metadata": {k: v for k, v in m.items() if k != "source"}}
+                for t, m in zip(texts, metadatas)]
+        self._buffer.append((file_path, source, rows, vectors, added_at or time.time()))
+        if sum(len(b[2]) for b in self._buffer) >= self.SHARD_ROWS:
+            self.flush()
+
+    def flush(self):
+        """Write buffered files as one shard, then commit meta.json"""
+        if not self._buffer:
+            return
+        buffer, self._buffer = self._buffer, []
+        shard = f"shard_{self.meta['next_shard']:06d}"
+        vectors = np.vstack([b[3] for b in buffer])
+        if self.meta["dtype"] == "int8":
+            # Unit vectors → components in [-1, 1], scaled to the int8 range (4x smaller than float32)
+            vectors = np.round(vectors * 127)
+        vectors = vectors.astype(self.meta["dtype"])
+        self.meta["dim"] = int(vectors.shape[1])
+
+        tmp = self.root / f"{shard}.tmp.npy"
+        np.save(tmp, vectors)
+        os.replace(tmp, self._vectors_path(shard))
+        tmp = self.root / f"{shard}.tmp.jsonl"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for _, _, rows, _, _ in buffer:
+                for row in rows:
+                    f.write(json.dumps(row, default=str) + "\n")
+        os.replace(tmp, self._chunks_path(shard))
+
+        start = 0
+        for file_path, source, rows, _, added_at in buffer:
+            self.meta["files"][file_path] = {"shard": shard, "start": start, "count": len(rows),
+                                             "source": source, "added_at": added_at}
+            start += len(rows)
+        self.meta["shards"][shard] = {"rows": start, "created": time.time()}
+        self.meta["next_shard"] += 1
+        self._save_meta()
+        self._drop_unused_shards()
+
+    def remove_file(self, file_path: str):
+        self._buffer = [b for b in self._buffer if b[0] != file_path]
+        if self.meta["files"].pop(file_path, None) is not None:
+            self._save_meta()
+            self._drop_unused_shards()
+
+    def rename_file(self, old_path: str, new_path: str, new_source: str):
+        """Same vectors and chunks, new path — only meta.json changes"""
+        entry = self.meta["files"].pop(old_path)
+        self.meta["files"][new_path] = {**entry, "source": new_source}
+        self._save_meta()
+
+    def _drop_unused_shards(self):
+        used = {entry["shard"] for entry in self.meta["files"].values()}
+        unused = [s for s in self.meta["shards"] if s not in used]
+        if not unused:
+            return
+        for shard in unused:
+            del self.meta["shards"][shard]
+        self._save_meta()
+        self._remove_orphans()
+
+    def dead_ratio(self) -> float:
+        total = sum(s["rows"] for s in self.meta["shards"].values())
+        return 1 - self.live_rows() / total if total else 0.0
+
+    def maybe_compact(self):
+        if self.dead_ratio() >= self.COMPACT_DEAD_RATIO:
+            self.compact()
+
+    def compact(self):
+        """Rewrite live files into fresh shards, streaming one file at a time"""
+        self.flush()
+        t0 = time.perf_counter()
+        before = sum(s["rows"] for s in self.meta["shards"].values())
+        # iter_files works from a snapshot of meta.json, so re-adding (and flushing) as we go is safe
+        for file_path, source, texts, metadatas, vectors in self.iter_files():
+            self.add_file(file_path, source, texts, metadatas, vectors, added_at=self.added_at(file_path))
+        self.flush()
+        print(f"[EmbeddingArchive] Compacted {before} → {self.live_rows()} rows in {time.perf_counter() - t0:.1f}s")
+
+    # ---------- reads ----------
+    def has_file(self, file_path: str) -> bool:
+        return file_path in self.meta["files"] or any(b[0] == file_path for b in self._buffer)
+
+    def files_for_source(self, source: str) -> List[str]:
+        """Archived (or still buffered) file paths whose chunks carry this source"""
+        files = [f for f, entry in self.meta["files"].items() if entry["source"] == source]
+        return list(dict.fromkeys(files + [b[0] for b in self._buffer if b[1] == source]))
+
+    def live_rows(self) -> int:
+        return sum(entry["count"] for entry in self.meta["files"].values())
+
+    def _shard_vectors(self, shard: str) -> np.ndarray:
+        return np.load(self._vectors_path(shard), mmap_mode="r")
+
+    def _decode(self, vectors: np.ndarray) -> np.ndarray:
+        """Stored rows → float-valued vectors (float32/float16 memmap slices pass through as they are)"""
+        if vectors.dtype == np.int8:
+            # Rounding to 1/127 steps moves the norm off 1 — re-normalise so inner products stay cosines
+            vectors = vectors.astype(np.float32)
+            return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def _shard_rows(self, shard: str) -> List[Dict]:
+        with open(self._chunks_path(shard), encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def _files_by_shard(self, files: Optional[List[str]] = None) -> Dict[str, List[Tuple[str, Dict]]]:
+        by_shard: Dict[str, List[Tuple[str, Dict]]] = {}
+        files = set(files) if files is not None else None
+        for file_path, entry in self.meta["files"].items():
+            if files is None or file_path in files:
+                by_shard.setdefault(entry["shard"], []).append((file_path, entry))
+        for entries in by_shard.values():
+            entries.sort(key=lambda e: e[1]["start"])
+        return dict(sorted(by_shard.items()))
+
+    def iter_files(self, files: Optional[List[str]] = None,
+                   with_chunks: bool = True) -> Iterator[Tuple[str, str, List[str], List[Dict], np.ndarray]]:
+        """
+        (file_path, source, texts, metadatas, vectors) in storage order — one shard's chunk table in
+        memory at a time. vectors is a memmap slice (int8 is decoded); with_chunks=False skips the chunk
+        table and yields None for texts / metadatas.
+        """
+        for shard, entries in self._files_by_shard(files).items():
+            vectors = self._shard_vectors(shard)
+            rows = self._shard_rows(shard) if with_chunks else None
+            for file_path, entry in entries:
+                lo, hi = entry["start"], entry["start"] + entry["count"]
+                if rows is None:
+                    yield file_path, entry["source"], None, None, self._decode(vectors[lo:hi])
+                    continue
+                yield (file_path, entry["source"], [r["text"] for r in rows[lo:hi]],
+                       [{**r["metadata"], "source": entry["source"]} for r in rows[lo:hi]],
+                       self._decode(vectors[lo:hi]))
+
+    def added_at(self, file_path: str) -> float:
+        """When the file was embedded — the ingestion time the vector store records (kept across compaction)"""
+        entry = self.meta["files"][file_path]
+        return entry.get("added_at") or self.meta["shards"][entry["shard"]]["created"]
+
+    def load_file(self, file_path: str) -> Optional[Tuple[str, List[str], List[Dict], np.ndarray]]:
+        for _, source, texts, metadatas, vectors in self.iter_files([file_path]):
+            return source, texts, metadatas, vectors
+        return None
+
+    def sample(self, n: int, files: Optional[List[str]] = None, seed: int = 42) -> np.ndarray:
+        """Up to n live vectors drawn evenly across shards (index training) — reads only the sampled rows"""
+        by_shard = self._files_by_shard(files)
+        total = sum(e["count"] for entries in by_shard.values() for _, e in entries)
+        if not total:
+            return np.empty((0, self.meta["dim"] or 0), dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        parts = []
+        for shard, entries in by_shard.items():
+            rows = np.concatenate([np.arange(e["start"], e["start"] + e["count"]) for _, e in entries])
+            take = min(len(rows), max(1, round(n * len(rows) / total)))
+            picked = np.sort(rng.choice(rows, take, replace=False))
+            parts.append(np.asarray(self._decode(self._shard_vectors(shard)[picked]), dtype=np.float32))
+        return np.vstack(parts)
+
+    # ---------- legacy ----------
+    @staticmethod
+    def _legacy_data_file(embed_dir: Path, pkl_file: Path, source: str) -> Optional[Path]:
+        """The data file a .pkl was embedded from, if it is still on disk — the old layout was
+        data/<dir>/<name>.<ext> → data/embeddings/<dir>/<name>.pkl"""
+        folder = embed_dir.parent / pkl_file.relative_to(embed_dir).parent
+        # The pickled source may be another machine's path (D:\...) — only its file name is any use
+        by_name = folder / source.replace("\\", "/").rsplit("/", 1)[-1]
+        if by_name.is_file():
+            return by_name
+        by_stem = [p for p in folder.glob("*") if p.is_file() and p.stem == pkl_file.stem and p.suffix != ".pkl"]
+        return by_stem[0] if len(by_stem) == 1 else None
+
+    def import_pickles(self, embed_dir: Path):
+        """
+        One-off conversion of the old per-file .pkl embeddings (the last time anything is unpickled).
+        A .pkl whose data file is still on disk is keyed by that file's path (and its source resolved
+        like a fresh parse), and the file goes into the manifest as embedded — so the next sync
+        skips it, as the old pipeline did, instead of embedding it a second time.
+        """
+        from src.manifest import EmbeddingManifest
+        embed_dir = Path(embed_dir)
+        pkl_files = sorted(embed_dir.rglob("*.pkl"))
+        if not pkl_files:
+            return
+        print(f"[EmbeddingArchive] Importing {len(pkl_files)} legacy .pkl files → {self.root}")
+        manifest = EmbeddingManifest(embed_dir / "manifest.json")
+        seeded = 0
+        for pkl_file in pkl_files:
+            with open(pkl_file, "rb") as f:
+                data = pickle.load(f)
+            chunks = data["chunks"]
+            if not chunks:
+                continue
+            source = chunks[0].metadata.get("source", str(pkl_file.stem))
+            texts = [c.page_content for c in chunks]
+            data_file = self._legacy_data_file(embed_dir, pkl_file, source)
+            if data_file is not None:
+                file_path, source = str(data_file), str(data_file.resolve())
+                if file_path not in manifest.files:
+                    manifest.record(file_path, manifest.file_hash(file_path), [manifest.chunk_hash(t) for t in texts])
+                    seeded += 1
+            else:
+                # Data file gone: kept searchable as before, under its old source
+                file_path = os.path.relpath(source) if Path(source).is_absolute() else source
+            self.add_file(file_path, source, texts, [dict(c.metadata) for c in chunks], data["embeddings"],
+                          added_at=pkl_file.stat().st_mtime)
+        self.flush()
+        # Archive first: a file the manifest lists must already have its embeddings on disk
+        if seeded:
+            manifest.save()
+            print(f"[EmbeddingArchive] {seeded} imported files recorded in {manifest.path}")
@@ -0,0 +1,177 @@
+# src/embedding_cache.py
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List
+
+from src.tracing import annotate
+
+
+def text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Shared on-disk embedding cache keyed by (model name, text hash).
+
+    - SQLite tier: survives restarts, shared by ingestion, uploads and queries,
+      LRU-evicted (by last use) once it holds more than max_entries vectors. Hits only note
+      their time in memory; last_used is written in one batch on the next put, or once
+      TOUCH_FLUSH_ROWS / TOUCH_FLUSH_S pile up — a lookup never commits
+    - hot tier: small in-memory LRU for query embeddings (repeated questions)
+    """
+
+    TOUCH_FLUSH_ROWS = 10_000
+    TOUCH_FLUSH_S = 60.0
+
+    def __init__(self, model_name: str, path: str = "data/embeddings/embedding_cache.sqlite",
+                 max_entries: int = 1_000_000, hot_size: int = 4096):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hot_size = hot_size
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                vec BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._touched: Dict[str, float] = {}  # hash → last hit, not yet written
+        self._touched_since = time.time()
+
+        self._hot: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._hot_lock = threading.Lock()
+        self.hits = self.misses = self.hot_hits = 0
+
+    # ---------- lookup ----------
+    def _get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for i in range(0, len(unique), 500):  # stay under SQLite's variable limit
+                batch = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [self.model_name, *batch]
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                self._touched.update(dict.fromkeys(found, now))
+                if len(self._touched) >= self.TOUCH_FLUSH_ROWS or now - self._touched_since >= self.TOUCH_FLUSH_S:
+                    self._flush_touched()
+                    self._conn.commit()
+        return found
+
+    def _flush_touched(self):
+        """Write the pending last_used times (caller holds _lock and commits)"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                [(t, self.model_name, h) for h, t in self._touched.items()]
+            )
+            self._touched = {}
+        self._touched_since = time.time()
+
+    def _put_many(self, items: Dict[str, np.ndarray]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._flush_touched()  # eviction below must see recent hits
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vec, last_used) VALUES (?, ?, ?, ?)",
+                [(self.model_name, h, v.astype(np.float32).tobytes(), now) for h, v in items.items()]
+            )
+            self._count += len(items)
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # drop least-recently-used rows down to 90% of capacity
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._count - int(self.max_entries * 0.9)
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            self._count -= excess
+            print(f"[EmbeddingCache] Evicted {excess} least-recently-used vectors")
+
+    def _hot_put(self, h: str, vector: np.ndarray):
+        self._hot[h] = vector
+        self._hot.move_to_end(h)
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    # ---------- public ----------
+    def encode(self, model, texts: List[str], batch_size: int = 64, query: bool = False) -> np.ndarray:
+        """model.encode through the cache → normalized float32 (len(texts), dim)"""
+        if not texts:
+            return np.empty((0, model.get_sentence_embedding_dimension()), dtype="float32")
+        hashes = [text_hash(t) for t in texts]
+        vectors: Dict[str, np.ndarray] = {}
+
+        if query:
+            with self._hot_lock:
+                for h in hashes:
+                    if h in self._hot:
+                        self._hot.move_to_end(h)
+                        vectors[h] = self._hot[h]
+            self.hot_hits += len(vectors)
+
+        lookup = [h for h in hashes if h not in vectors]
+        if lookup:
+            stored = self._get_many(lookup)
+            self.hits += len(stored)
+            vectors.update(stored)
+
+        todo = list(dict.fromkeys(h for h in hashes if h not in vectors))
+        if todo:
+            self.misses += len(todo)
+            text_for = dict(zip(hashes, texts))
+            encoded = model.encode(
+                [text_for[h] for h in todo],
+                batch_size=batch_size,
+                show_progress_bar=False,
+                normalize_embeddings=True
+            ).astype("float32")
+            fresh = dict(zip(todo, encoded))
+            self._put_many(fresh)
+            vectors.update(fresh)
+
+        if query:
+            with self._hot_lock:
+                for h in hashes:
+                    self._hot_put(h, vectors[h])
+        annotate(embedding_cache_hits=len(hashes) - len(todo), embedding_cache_misses=len(todo))
+        return np.vstack([vectors[h] for h in hashes]).astype("float32")
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses + self.hot_hits
+        return {
+            "hot_hits": self.hot_hits,
+            "disk_hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.hot_hits) / lookups if lookups else 0.0,
+            "entries": self._count,
+            "hot_entries": len(self._hot),
+        }
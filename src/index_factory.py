@@ -0,0 +1,313 @@
+# src/index_factory.py
+import time
+import faiss
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16", "sq8", "binary")
+
+# Compressed types keep only codes in RAM: fp16 = 2 bytes/dim, sq8 = 1 byte/dim, binary = 1 bit/dim.
+# "rescore": N fetches N * top_k candidates and re-ranks them with the exact float32 vectors
+# (read from disk, see ChunkStore.vectors); "truncate_dim": index only the first dims of
+# Matryoshka-trained embeddings (re-normalised), with any index type.
+
+# Below this many vectors IVF training is meaningless — fall back to flat
+MIN_TRAIN_POINTS_PER_LIST = 39
+
+
+def default_params(index_type: str, dim: int, n_vectors: int) -> Dict:
+    """Sensible defaults for an index type given corpus size"""
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = int(4 * np.sqrt(max(n_vectors, 1)))
+        nlist = max(1, min(nlist, n_vectors // MIN_TRAIN_POINTS_PER_LIST or 1))
+        params = {"nlist": nlist, "nprobe": max(1, min(16, nlist))}
+        if index_type == "ivf_pq":
+            # sub-quantizers must divide dim; aim for ~8 dims per code byte
+            m = next(m for m in range(max(1, dim // 8), 0, -1) if dim % m == 0)
+            params.update({"pq_m": m, "pq_nbits": 8 if n_vectors >= 256 * MIN_TRAIN_POINTS_PER_LIST else 6})
+        return params
+    if index_type == "hnsw":
+        return {"hnsw_m": 32, "ef_construction": 200, "ef_search": 64}
+    if index_type == "sq8":
+        return {"rescore": 2}
+    if index_type == "binary":
+        return {"rescore": 10}  # sign bits alone reorder neighbours a lot
+    return {}
+
+
+def make_index(index_type: str, dim: int, params: Dict) -> faiss.Index:
+    """Create an (untrained) inner-product index of the requested type"""
+    metric = faiss.METRIC_INNER_PRODUCT
+    truncate_dim = params.get("truncate_dim")
+    if truncate_dim and truncate_dim < dim:
+        # Vectors keep their full dim everywhere else; the index sees the first truncate_dim, re-normalised
+        inner = make_index(index_type, truncate_dim, {k: v for k, v in params.items() if k != "truncate_dim"})
+        index = faiss.IndexPreTransform(faiss.NormalizationTransform(truncate_dim), inner)
+        index.prepend_transform(faiss.RemapDimensionsTransform(dim, truncate_dim, False))
+        return index
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+    if index_type == "ivf_flat":
+        quantizer = faiss.IndexFlatIP(dim)
+        return faiss.IndexIVFFlat(quantizer, dim, params["nlist"], metric)
+    if index_type == "ivf_pq":
+        quantizer = faiss.IndexFlatIP(dim)
+        return faiss.IndexIVFPQ(quantizer, dim, params["nlist"], params["pq_m"], params["pq_nbits"], metric)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"], metric)
+        index.hnsw.efConstruction = params["ef_construction"]
+        return index
+    if index_type == "sq_fp16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, metric)
+    if index_type == "sq8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, metric)
+    if index_type == "binary":
+        # One sign bit per dimension, searched by Hamming distance (lower = closer)
+        return faiss.IndexLSH(dim, dim, False, False)
+    raise ValueError(f"Unknown index type: {index_type} (choose from {INDEX_TYPES})")
+
+
+def train_index(index: faiss.Index, embeddings: np.ndarray, sample_size: int = 100_000, seed: int = 42):
+    """Train on a random sample — IVF/PQ only need a representative subset"""
+    if index.is_trained:
+        return
+    if len(embeddings) > sample_size:
+        rng = np.random.default_rng(seed)
+        sample = embeddings[np.sort(rng.choice(len(embeddings), sample_size, replace=False))]
+    else:
+        sample = embeddings
+    t0 = time.perf_counter()
+    index.train(np.ascontiguousarray(sample, dtype="float32"))
+    print(f"[IndexFactory] Trained on {len(sample)} vectors in {time.perf_counter() - t0:.2f}s")
+
+
+def build_index(index_type: str, embeddings: np.ndarray, params: Optional[Dict] = None,
+                n_vectors: Optional[int] = None):
+    """Factory entry point → (index, resolved_type, resolved_params).
+    embeddings may be just a training sample when n_vectors gives the real corpus size."""
+    n, dim = embeddings.shape
+    n = n_vectors or n
+    params = params or {}
+    resolved = dict(default_params(index_type, params.get("truncate_dim") or dim, n))
+    if params.get("truncate_dim"):
+        resolved["rescore"] = max(resolved.get("rescore", 0), 4)
+    resolved.update(params)
+    if index_type in ("ivf_flat", "ivf_pq") and n < resolved["nlist"] * MIN_TRAIN_POINTS_PER_LIST:
+        print(f"[IndexFactory] Only {n} vectors — too few to train {index_type}, using flat")
+        keep = {k: params[k] for k in ("truncate_dim", "rescore") if k in params}
+        return build_index("flat", embeddings, keep, n_vectors=n)
+    index = make_index(index_type, dim, resolved)
+    train_index(index, embeddings)
+    return index, index_type, resolved
+
+
+def with_ids(index: faiss.Index, ids: Optional[np.ndarray] = None) -> faiss.IndexIDMap2:
+    """
+    Wrap an index so it is searched / removed / reconstructed by stable 64-bit ids.
+    An already populated index (stores saved before ids existed) gets ids — default: its
+    positions — attached in place instead of being re-added.
+    """
+    n = index.ntotal
+    index.ntotal = 0  # IndexIDMap2 insists on an empty index; the vectors stay where they are
+    wrapped = faiss.IndexIDMap2(index)
+    index.ntotal = wrapped.ntotal = n
+    if n:
+        ids = np.arange(n, dtype=np.int64) if ids is None else np.ascontiguousarray(ids, dtype=np.int64)
+        faiss.copy_array_to_vector(ids, wrapped.id_map)
+        wrapped.construct_rev_map()
+    return wrapped
+
+
+def empty_clone(index: faiss.Index) -> faiss.Index:
+    """Same type, parameters and training (IVF centroids, PQ codebooks), no vectors"""
+    try:
+        clone = faiss.clone_index(index)
+    except RuntimeError:
+        # Some transforms (truncate_dim) can't be cloned — a serialise round trip copies anything
+        clone = faiss.deserialize_index(faiss.serialize_index(index))
+    clone.reset()
+    return clone
+
+
+def search_params(index_type: str, params: Dict, nprobe: Optional[int] = None,
+                  ef_search: Optional[int] = None, sel: Optional[faiss.IDSelector] = None) -> Optional[faiss.SearchParameters]:
+    """Per-call search knobs — passed to index.search so concurrent queries don't clash"""
+    extra = {"sel": sel} if sel is not None else {}
+    if index_type in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(nprobe=nprobe or params.get("nprobe", 8), **extra)
+    if index_type == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search or params.get("ef_search", 64), **extra)
+    return faiss.SearchParameters(**extra) if extra else None
+
+
+def supports_selector(index_type: str) -> bool:
+    """IndexLSH (binary) rejects any SearchParameters — it can't skip removed / filtered-out ids itself"""
+    return index_type != "binary"
+
+
+def masked_search(index: faiss.Index, queries: np.ndarray, top_k: int, keep, fetch: int):
+    """
+    Search without a selector and drop the ids keep(ids) rejects afterwards, fetching more
+    (×4 each round, up to the whole index) until every query has top_k kept hits
+    → (scores, ids) like index.search, -1 in empty slots
+    """
+    n = index.ntotal
+    fetch = max(top_k, min(fetch, n))
+    while True:
+        scores, ids = index.search(queries, max(fetch, 1))
+        kept = (ids >= 0) & keep(ids)
+        if fetch >= n or (kept.sum(axis=1) >= top_k).all():
+            break
+        fetch = min(n, fetch * 4)
+    # Kept hits first, in the index's order
+    order = np.argsort(~kept, axis=1, kind="stable")[:, :top_k]
+    scores = np.take_along_axis(scores, order, axis=1)
+    ids = np.where(np.take_along_axis(kept, order, axis=1), np.take_along_axis(ids, order, axis=1), -1)
+    return scores, ids
+
+
+def to_similarity(index_type: str, index: faiss.Index, scores: np.ndarray) -> np.ndarray:
+    """Binary indexes return Hamming distances — map them onto [-1, 1] like cosine (1 = identical bits)"""
+    if index_type != "binary":
+        return scores
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexPreTransform):  # truncate_dim
+        inner = faiss.downcast_index(inner.index)
+    return 1 - 2 * scores / inner.d
+
+
+def rescore(queries: np.ndarray, ids: np.ndarray, vectors_for, top_k: int):
+    """
+    Re-rank each query's candidate ids (-1 = empty slot) by exact inner product with the
+    float32 vectors vectors_for(ids) returns → (scores, ids), top_k per query, best first
+    """
+    n_queries, n_candidates = ids.shape
+    valid = ids >= 0
+    sims = np.full(ids.shape, -np.inf, dtype=np.float32)
+    if valid.any():
+        vectors = np.zeros((n_queries, n_candidates, queries.shape[1]), dtype=np.float32)
+        vectors[valid] = vectors_for(ids[valid])
+        sims = np.einsum("qkd,qd->qk", vectors, queries).astype(np.float32)
+        sims[~valid] = -np.inf
+    order = np.argsort(-sims, axis=1, kind="stable")[:, :top_k]
+    scores = np.take_along_axis(sims, order, axis=1)
+    ids = np.where(np.isfinite(scores), np.take_along_axis(ids, order, axis=1), -1)
+    return scores, ids
+
+
+def recall_latency_report(embeddings: np.ndarray, queries: np.ndarray, top_k: int = 10,
+                          index_types: List[str] = ("flat", "ivf_flat", "ivf_pq", "hnsw"), sweeps: Optional[Dict] = None) -> List[Dict]:
+    """
+    Build every index type over the same vectors and compare with exact (flat) search.
+    sweeps: {"ivf_flat": {"nprobe": [1, 8, 32]}, "hnsw": {"ef_search": [16, 64]}} — search knobs to try
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    sweeps = sweeps or {
+        "ivf_flat": {"nprobe": [1, 4, 16, 64]},
+        "ivf_pq": {"nprobe": [1, 4, 16, 64]},
+        "hnsw": {"ef_search": [16, 32, 64, 128]},
+    }
+
+    exact = faiss.IndexFlatIP(embeddings.shape[1])
+    exact.add(embeddings)
+    _, truth = exact.search(queries, top_k)
+
+    rows = []
+    for index_type in index_types:
+        t0 = time.perf_counter()
+        index, resolved_type, params = build_index(index_type, embeddings)
+        index.add(embeddings)
+        build_s = time.perf_counter() - t0
+
+        knob, values = next(iter(sweeps.get(resolved_type, {None: [None]}).items()))
+        for value in values:
+            sp = search_params(resolved_type, params, **({knob: value} if knob else {}))
+            t0 = time.perf_counter()
+            _, found = index.search(queries, top_k, params=sp) if sp else index.search(queries, top_k)
+            elapsed = time.perf_counter() - t0
+
+            hits = sum(len(set(f[f != -1]) & set(t)) for f, t in zip(found, truth))
+            rows.append({
+                "index_type": resolved_type,
+                "knob": f"{knob}={value}" if knob else "-",
+                "build_s": round(build_s, 3),
+                f"recall@{top_k}": round(hits / truth.size, 4),
+                "latency_ms": round(1000 * elapsed / len(queries), 4),
+                "qps": round(len(queries) / elapsed, 1),
+            })
+
+    print(f"\n{'index':<10} {'knob':<14} {'build_s':>8} {'recall@' + str(top_k):>10} {'ms/query':>9} {'qps':>10}")
+    for r in rows:
+        print(f"{r['index_type']:<10} {r['knob']:<14} {r['build_s']:>8} {r[f'recall@{top_k}']:>10} "
+              f"{r['latency_ms']:>9} {r['qps']:>10}")
+    return rows
+
+
+def quantization_report(embeddings: np.ndarray, queries: np.ndarray, top_k: int = 10,
+                        configs: Optional[List[Tuple[str, Dict]]] = None) -> List[Dict]:
+    """
+    Memory per 1M chunks and recall@k against the float32 flat baseline for reduced-precision
+    indexes, with and without float32 rescoring. Memory is the serialised index (codes + id map),
+    i.e. what FAISSVectorStore keeps in RAM; rescoring vectors stay on disk.
+    configs: [(index_type, params)], e.g. ("binary", {"rescore": 20}), ("flat", {"truncate_dim": 128})
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    dim = embeddings.shape[1]
+    configs = configs or [
+        ("flat", {}), ("sq_fp16", {}), ("sq8", {}), ("binary", {}), ("binary", {"rescore": 20}),
+        ("flat", {"truncate_dim": max(dim // 2, 1)}), ("sq8", {"truncate_dim": max(dim // 4, 1)}),
+    ]
+    exact = faiss.IndexFlatIP(dim)
+    exact.add(embeddings)
+    _, truth = exact.search(queries, top_k)
+    vectors_for = lambda ids: embeddings[ids]
+
+    rows = []
+    for index_type, params in configs:
+        index, resolved_type, resolved = build_index(index_type, embeddings, params)
+        index = with_ids(index)
+        index.add_with_ids(embeddings, np.arange(len(embeddings), dtype=np.int64))
+        bytes_per_vector = faiss.serialize_index(index).nbytes / len(embeddings)
+        label = resolved_type + "".join(f" {k}={v}" for k, v in params.items())
+
+        for factor in sorted({0, resolved.get("rescore", 0)}):
+            t0 = time.perf_counter()
+            if factor:
+                _, candidates = index.search(queries, top_k * factor)
+                _, found = rescore(queries, candidates, vectors_for, top_k)
+            else:
+                _, found = index.search(queries, top_k)
+            elapsed = time.perf_counter() - t0
+            hits = sum(len(set(f[f != -1]) & set(t)) for f, t in zip(found, truth))
+            rows.append({
+                "index": label,
+                "rescore": factor,
+                "bytes_per_vector": round(bytes_per_vector, 1),
+                "mb_per_1m": round(bytes_per_vector * 1e6 / 2 ** 20, 1),
+                f"recall@{top_k}": round(hits / truth.size, 4),
+                "latency_ms": round(1000 * elapsed / len(queries), 4),
+            })
+
+    print(f"\n{'index':<28} {'rescore':>7} {'MB/1M':>9} {'recall@' + str(top_k):>10} {'ms/query':>9}")
+    for r in rows:
+        print(f"{r['index']:<28} {r['rescore']:>7} {r['mb_per_1m']:>9} {r[f'recall@{top_k}']:>10} {r['latency_ms']:>9}")
+    return rows
+
+
+# Pick a mode per deployment: python -m src.index_factory
+if __name__ == "__main__":
+    from src.embedding_archive import EmbeddingArchive
+
+    # Up to 200k vectors from the archive are enough to compare index types
+    corpus = EmbeddingArchive("data/embeddings/archive", legacy_dir="data/embeddings").sample(200_000)
+
+    # Queries: perturbed corpus vectors so every query has true neighbours
+    rng = np.random.default_rng(0)
+    queries = corpus[rng.choice(len(corpus), min(200, len(corpus)), replace=False)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype("float32")
+    faiss.normalize_L2(queries)
+
+    recall_latency_report(corpus, queries, top_k=5)
+    quantization_report(corpus, queries, top_k=5)
@@ -0,0 +1,349 @@
+# src/indexing_queue.py
+import time
+import uuid
+import queue
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.resources import get_embedding_pipeline, get_vector_store
+from src.tracing import span
+
+
+class IndexJob:
+    """One upload: its files, where it is in the pipeline (queued → parsing → encoding → indexing →
+    done / failed), and what happened to each file"""
+
+    def __init__(self, file_paths: List[str]):
+        self.id = uuid.uuid4().hex[:12]
+        self.files = [str(p) for p in file_paths]
+        self.status = "queued"
+        self.results: Dict[str, str] = {}  # file name → "✓ 12 chunks" / "✗ reason"
+        self.files_parsed = 0
+        self.chunks_total = 0
+        self.chunks_encoded = 0
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._done = threading.Event()
+        # file path → private copy parsed in its place, moved there at commit (None: parse the file itself)
+        self._staged: Dict[str, Optional[str]] = {}
+        # Filled by the worker: (file path, chunk list) of each parsed file, then their vectors
+        self._parsed: List = []
+        self._vectors: List[np.ndarray] = []
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def progress(self) -> float:
+        """0..1 — parsing counts 30%, encoding 60%, the index commit the last 10%"""
+        if self.done:
+            return 1.0
+        parsed = self.files_parsed / len(self.files) if self.files else 1.0
+        encoded = self.chunks_encoded / self.chunks_total if self.chunks_total else float(self.status == "indexing")
+        return 0.3 * parsed + 0.6 * encoded
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _finish(self, status: str, error: Optional[str] = None):
+        self.status, self.error = status, error
+        self.finished = time.time()
+        self._parsed, self._vectors = [], []
+        for staged in self._staged.values():  # copies that were never moved into place
+            if staged:
+                Path(staged).unlink(missing_ok=True)
+        self._done.set()
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id, "status": self.status, "progress": round(self.progress, 3),
+            "files": self.files, "results": dict(self.results), "error": self.error,
+            "files_parsed": self.files_parsed, "chunks_total": self.chunks_total,
+            "chunks_encoded": self.chunks_encoded,
+            "queued_s": round((self.started or time.time()) - self.created, 3),
+            "elapsed_s": round((self.finished or time.time()) - (self.started or time.time()), 3),
+        }
+
+    def summary(self) -> str:
+        """Status text for the UI"""
+        lines = [f"Job {self.id}: {self.status} ({100 * self.progress:.0f}%)"]
+        if self.status == "encoding":
+            lines[0] += f" — {self.chunks_encoded}/{self.chunks_total} chunks encoded"
+        for name in (Path(f).name for f in self.files):
+            if name in self.results:
+                lines.append(self.results[name])
+        if self.error:
+            lines.append(f"✗ {self.error}")
+        return "\n".join(lines)
+
+
+class IndexingQueue:
+    """
+    Background indexing for uploaded files — the request thread only submits and polls.
+
+    - submit(paths) → IndexJob right away; worker thread(s) parse, split, encode and index
+    - jobs waiting in the queue are taken together (up to max_files files), so their chunks share
+      encode calls of encode_batch texts instead of one model call per small file
+    - uploads are indexed as upload_dir/<file name>: the per-request temp path differs on every
+      upload, that path (and so the chunks' source) doesn't. Each upload is first copied to a
+      private staging file and only moved to upload_dir/<file name> when its job commits, so two
+      uploads of the same name never overwrite each other's bytes mid-job
+    - each job is committed with one replace_sources call: searches keep seeing the previous
+      corpus until the job's documents appear all at once, and re-uploading a file replaces it
+    - then the files go into the embedding archive and manifest like run_on_new_files would
+      record them, so build_from_embeddings keeps them and the next sync skips them — one archive
+      flush (one shard) and manifest write per batch of jobs, not per job
+    - remove(source) takes a document out of the index, archive, manifest and upload_dir
+    - get(job_id) / jobs() for status polling; finished jobs are kept for keep_jobs submissions
+    """
+
+    def __init__(self, workers: int = 1, max_files: int = 32, encode_batch: int = 256, keep_jobs: int = 200,
+                 persist_dir: str = "faiss_store", upload_dir: str = "data/uploads"):
+        self.max_files = max_files
+        self.encode_batch = encode_batch
+        self.keep_jobs = keep_jobs
+        self.persist_dir = persist_dir
+        self.upload_dir = Path(upload_dir)
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        # Outside the data folder, so a sync never picks up a half-processed upload
+        self.staging_dir = Path(tempfile.mkdtemp(prefix="index_queue_"))
+        self._queue: "queue.Queue[IndexJob]" = queue.Queue()
+        self._jobs: "OrderedDict[str, IndexJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()  # archive + manifest writes, shared by the workers
+        self.batches = 0
+        self.files_indexed = 0
+        self.chunks_indexed = 0
+        self._threads = [threading.Thread(target=self._run, name=f"indexer-{i}", daemon=True) for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    # ---------- API ----------
+    def submit(self, file_paths: List[str]) -> IndexJob:
+        staged = [self._stage(p) for p in file_paths]
+        job = IndexJob([file_path for file_path, _ in staged])
+        job._staged = dict(staged)
+        with self._lock:
+            self._jobs[job.id] = job
+            # Forget the oldest finished jobs (running / queued ones are always kept)
+            finished = [job_id for job_id, j in self._jobs.items() if j.done]
+            for job_id in finished[:max(0, len(self._jobs) - self.keep_jobs)]:
+                del self._jobs[job_id]
+        self._queue.put(job)
+        print(f"[IndexQueue] Job {job.id} queued: {len(job.files)} file(s), {self._queue.qsize()} job(s) waiting")
+        return job
+
+    def _stage(self, file_path: str):
+        """Copy an upload to a private staging file → (upload_dir/<file name>, the copy).
+        The copy is moved to the first path only when the job commits."""
+        src = Path(file_path)
+        if not src.exists():
+            return str(src), None  # fails in the worker
+        dest = self.upload_dir / src.name
+        if src.resolve() == dest.resolve():
+            return str(dest), None  # already in place (re-indexing an upload)
+        staged = self.staging_dir / f"{uuid.uuid4().hex[:12]}_{src.name}"
+        shutil.copyfile(src, staged)
+        return str(dest), str(staged)
+
+    def remove(self, source: str) -> int:
+        """
+        Take a document out of the knowledge base → chunks removed. Besides the index chunks, its
+        archived embeddings, manifest entry and (for an upload) the copy in upload_dir go too —
+        otherwise the next build_from_embeddings or sync brings it back.
+        """
+        pipeline = get_embedding_pipeline()
+        manifest = pipeline.manifest
+        with self._commit_lock:
+            removed = get_vector_store(self.persist_dir).delete_source(source)
+            file_paths = pipeline.archive.files_for_source(source)
+            file_paths += [f for f in manifest.files if str(Path(f).resolve()) == source and f not in file_paths]
+            for file_path in file_paths:
+                pipeline.archive.remove_file(file_path)
+                manifest.forget(file_path)
+            manifest.save()
+            upload = Path(source)
+            if upload.parent == self.upload_dir.resolve():
+                upload.unlink(missing_ok=True)
+        print(f"[IndexQueue] Removed {source}: {removed} chunks, {len(file_paths)} archived file(s)")
+        return removed
+
+    def get(self, job_id: str) -> Optional[IndexJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[IndexJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def pending(self) -> int:
+        return sum(not job.done for job in self.jobs())
+
+    def stats(self) -> Dict:
+        return {
+            "pending_jobs": self.pending(),
+            "batches": self.batches,
+            "files_indexed": self.files_indexed,
+            "chunks_indexed": self.chunks_indexed,
+        }
+
+    # ---------- worker ----------
+    def _take_batch(self) -> List[IndexJob]:
+        """Block for one job, then add whatever else is already waiting (up to max_files files)"""
+        batch = [self._queue.get()]
+        n_files = len(batch[0].files)
+        while n_files < self.max_files:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(job)
+            n_files += len(job.files)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                self._process(batch)
+            except Exception as e:  # model / store failed to load — fail the jobs, keep the worker
+                for job in batch:
+                    if not job.done:
+                        job._finish("failed", str(e))
+                print(f"[IndexQueue] Batch of {len(batch)} job(s) failed: {e}")
+
+    def _parse(self, pipeline, file_path: str, source: str) -> List:
+        """Load + split one file; chunks carry source (the path it is indexed as) whatever file was read"""
+        from src.data_loader import load_document
+        chunks = pipeline.splitter.split_documents(load_document(file_path))
+        for chunk in chunks:
+            chunk.metadata["source"] = source
+        return chunks
+
+    def _process(self, batch: List[IndexJob]):
+        pipeline = get_embedding_pipeline()
+        t0 = time.perf_counter()
+        archived = []  # (file path, chunks) archived by this batch's commits, recorded at the end
+        with span("index_batch", jobs=len(batch), files=sum(len(job.files) for job in batch)) as s:
+            # 1. Parse + split every file
+            for job in batch:
+                job.status, job.started = "parsing", time.time()
+                for file_path in job.files:
+                    name = Path(file_path).name
+                    read_path = job._staged.get(file_path) or file_path
+                    try:
+                        if not Path(read_path).exists():
+                            raise ValueError("File not found")
+                        chunks = self._parse(pipeline, read_path, str(Path(file_path).resolve()))
+                        if not chunks:
+                            raise ValueError("No chunks generated from document")
+                        job._parsed.append((file_path, chunks))
+                        job.chunks_total += len(chunks)
+                    except Exception as e:
+                        job.results[name] = f"✗ {name}: {e}"
+                    job.files_parsed += 1
+                job.status = "encoding" if job._parsed else "indexing"
+
+            # 2. Encode all jobs' chunks together; commit each job as soon as its chunks are encoded
+            texts, owners = [], []
+            for job in batch:
+                for _, chunks in job._parsed:
+                    texts.extend(c.page_content for c in chunks)
+                    owners.extend([job] * len(chunks))
+            s.set(chunks=len(texts))
+            try:
+                for job in batch:
+                    if not job._parsed:
+                        self._commit(job, archived)
+                for start in range(0, len(texts), self.encode_batch):
+                    vectors = pipeline.encode(texts[start:start + self.encode_batch])
+                    for job, lo, hi in self._runs(owners, start, start + len(vectors)):
+                        job._vectors.append(vectors[lo - start:hi - start])
+                        job.chunks_encoded += hi - lo
+                        if job.chunks_encoded == job.chunks_total:
+                            self._commit(job, archived)
+            finally:
+                # 3. One archive shard + manifest write for the whole batch
+                self._record(archived)
+
+        self.batches += 1
+        elapsed = time.perf_counter() - t0
+        print(f"[IndexQueue] {len(batch)} job(s), {sum(len(j.files) for j in batch)} file(s), "
+              f"{len(texts)} chunks in {elapsed:.1f}s")
+
+    @staticmethod
+    def _runs(owners: List[IndexJob], start: int, end: int):
+        """(job, lo, hi) for each job's consecutive rows in owners[start:end]"""
+        lo = start
+        while lo < end:
+            job, hi = owners[lo], lo
+            while hi < end and owners[hi] is job:
+                hi += 1
+            yield job, lo, hi
+            lo = hi
+
+    def _commit(self, job: IndexJob, archived: List):
+        """Move the job's uploads into place and swap its documents into the index in one step (old
+        versions of the same files go out), then buffer their embeddings in the archive — added to
+        archived, recorded by _record once the batch is through"""
+        job.status = "indexing"
+        if not job._parsed:
+            job._finish("failed", "no file could be indexed")
+            return
+        chunks = [c for _, file_chunks in job._parsed for c in file_chunks]
+        texts = [c.page_content for c in chunks]
+        vectors = np.vstack(job._vectors).astype("float32")
+        sources = list(dict.fromkeys(c.metadata.get("source", "uploaded_file") for c in chunks))
+        try:
+            with span("index_commit", chunks=len(chunks), sources=len(sources)), self._commit_lock:
+                # Jobs for the same file name commit one at a time: the file on disk, the index and
+                # the archive all end up with the last one
+                for file_path, _ in job._parsed:
+                    staged = job._staged.pop(file_path, None)
+                    if staged:
+                        shutil.move(staged, file_path)
+                get_vector_store(self.persist_dir).replace_sources(sources, texts, vectors.copy(), chunks)
+                self._archive(job, vectors, archived)
+        except Exception as e:
+            job._finish("failed", f"index update failed: {e}")
+            return
+        for file_path, file_chunks in job._parsed:
+            name = Path(file_path).name
+            job.results[name] = f"✓ {name} ({len(file_chunks)} chunks)"
+        self.files_indexed += len(job._parsed)
+        self.chunks_indexed += len(chunks)
+        job._finish("done")
+        print(f"[IndexQueue] Job {job.id} done: {len(sources)} file(s), {len(chunks)} chunks")
+
+    def _archive(self, job: IndexJob, vectors: np.ndarray, archived: List):
+        """Buffer the job's embeddings in the archive (caller holds _commit_lock)"""
+        pipeline = get_embedding_pipeline()
+        row = 0
+        for file_path, file_chunks in job._parsed:
+            file_vectors = vectors[row:row + len(file_chunks)]
+            row += len(file_chunks)
+            pipeline.save_embeddings(file_path, file_chunks, file_vectors)
+            archived.append((file_path, file_chunks))
+
+    def _record(self, archived: List):
+        """Archive first, manifest last (as in run_on_new_files). After the index commits: a crash in
+        between leaves the files unrecorded, and the next sync re-indexes them with replace_sources."""
+        if not archived:
+            return
+        pipeline = get_embedding_pipeline()
+        manifest = pipeline.manifest
+        with self._commit_lock:
+            pipeline.archive.flush()
+            for file_path, file_chunks in archived:
+                manifest.record(file_path, manifest.file_hash(file_path),
+                                [manifest.chunk_hash(c.page_content) for c in file_chunks])
+            manifest.save()
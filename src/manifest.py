@@ -0,0 +1,96 @@
+# src/manifest.py
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, List
+
+
+class EmbeddingManifest:
+    """
+    data/embeddings/manifest.json — what was embedded, keyed by file path:
+        {"sha256", "size", "mtime", "chunk_hashes": [...]}   (+ "error" if its last parse failed)
+
+    size + mtime is the fast path; the content hash decides whether a file really
+    changed and lets a renamed file reuse its old embeddings.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.files: Dict[str, Dict] = {}
+        if self.path.exists():
+            self.files = json.loads(self.path.read_text()).get("files", {})
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"files": self.files}, indent=1))
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        h = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    @staticmethod
+    def chunk_hash(text: str) -> str:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def scan(self, file_paths: List[str]) -> Dict[str, List]:
+        """
+        Classify files against the manifest:
+            new / modified / unchanged → lists of paths
+            renamed → (old_path, new_path) pairs with identical content
+            deleted → paths in the manifest that no longer exist
+            hashes  → {path: sha256} for every file that had to be hashed
+        """
+        changes = {"new": [], "modified": [], "unchanged": [], "renamed": [], "deleted": [], "hashes": {}}
+        current = set(file_paths)
+        missing = {p: e for p, e in self.files.items() if p not in current}
+        missing_by_hash = {e["sha256"]: p for p, e in missing.items()}
+
+        for file_path in file_paths:
+            stat = os.stat(file_path)
+            entry = self.files.get(file_path)
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                changes["unchanged"].append(file_path)
+                continue
+
+            digest = self.file_hash(file_path)
+            changes["hashes"][file_path] = digest
+            if entry and entry["sha256"] == digest:
+                entry["mtime"] = stat.st_mtime  # touched, not edited
+                changes["unchanged"].append(file_path)
+            elif entry:
+                changes["modified"].append(file_path)
+            elif digest in missing_by_hash:
+                old_path = missing_by_hash.pop(digest)
+                del missing[old_path]
+                changes["renamed"].append((old_path, file_path))
+            else:
+                changes["new"].append(file_path)
+
+        changes["deleted"] = list(missing)
+        return changes
+
+    def record(self, file_path: str, sha256: str, chunk_hashes: List[str]):
+        stat = os.stat(file_path)
+        self.files[file_path] = {
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "chunk_hashes": chunk_hashes,
+        }
+
+    def record_failure(self, file_path: str, sha256: str, error: str):
+        """A file that produced no chunks: its size/mtime are remembered so scan() skips it until it
+        changes again. A version indexed earlier keeps its chunk hashes (its embeddings stay archived)."""
+        chunk_hashes = self.files.get(file_path, {}).get("chunk_hashes", [])
+        self.record(file_path, sha256, chunk_hashes)
+        self.files[file_path]["error"] = error
+
+    def forget(self, file_path: str):
+        self.files.pop(file_path, None)
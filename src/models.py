@@ -1,7 +1,45 @@
-from typing import TypedDict, Literal, List
+from dataclasses import dataclass, field
+from typing import TypedDict, Literal, List, Dict, Optional
+import numpy as np
 
 class AgentState(TypedDict):
     question: str
     context: str
     answer: str
-    route: Literal["rag", "direct"]
\ No newline at end of file
+    route: Literal["rag", "direct"]
+    route_source: str
+    retrieved_chunks: List[Dict]
+    query_vector: Optional[np.ndarray]
+
+@dataclass
+class RetrievalResult:
+    """Everything one retrieval produced — one encode, one search."""
+    question: str
+    chunks: List[Dict] = field(default_factory=list)
+    context: str = ""
+    query_vector: np.ndarray = None
+    context_stats: Dict = field(default_factory=dict)  # tokens before/after build_context
+
+    @property
+    def scores(self) -> List[float]:
+        return [c["score"] for c in self.chunks]
+
+    @property
+    def top_score(self) -> Optional[float]:
+        return top_dense_score(self.chunks)
+
+    @property
+    def sources(self) -> List[str]:
+        return [c["source"] for c in self.chunks]
+
+    @property
+    def texts(self) -> List[str]:
+        return [c["text"] for c in self.chunks]
+
+
+def top_dense_score(chunks: List[Dict]) -> Optional[float]:
+    """Best cosine similarity among the chunks — fused (hybrid) scores are ranks, not similarities,
+    so BM25-only hits don't count"""
+    dense = [c.get("dense_score", c["score"]) for c in chunks]
+    dense = [s for s in dense if s is not None]
+    return max(dense) if dense else None
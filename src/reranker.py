@@ -0,0 +1,94 @@
+# src/reranker.py
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from src.embedding_cache import text_hash
+from src.tracing import annotate
+
+
+class CrossEncoderReranker:
+    """
+    Second-stage reranker: scores (question, chunk) pairs with a local cross-encoder
+    and reorders the over-fetched candidates.
+
+    - pairs are scored in batches, most promising (first-stage order) first
+    - scores are cached per (query hash, chunk id), so repeated questions rerank for free
+    - budget_ms caps the time spent per call: once it runs out, the candidates not yet
+      scored keep their first-stage order behind the scored ones (under load this degrades
+      to plain retrieval instead of queueing up behind the model)
+    """
+
+    def __init__(self, model, batch_size: int = 16, budget_ms: float = 150.0, cache_size: int = 50_000):
+        self.model = model
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.calls = self.pairs_scored = self.cache_hits = self.budget_cutoffs = 0
+
+    def _cached(self, qh: str, ids: List[int]) -> Dict[int, float]:
+        found = {}
+        with self._lock:
+            for chunk_id in ids:
+                score = self._cache.get((qh, chunk_id))
+                if score is not None:
+                    self._cache.move_to_end((qh, chunk_id))
+                    found[chunk_id] = score
+        return found
+
+    def _store(self, qh: str, scores: Dict[int, float]):
+        with self._lock:
+            for chunk_id, score in scores.items():
+                self._cache[(qh, chunk_id)] = score
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, *_):
+        """Drop all cached scores (e.g. after swapping the cross-encoder model)"""
+        with self._lock:
+            self._cache.clear()
+
+    def rerank(self, question: str, candidates: List[Dict], top_k: int,
+               budget_ms: Optional[float] = None) -> List[Dict]:
+        """candidates in first-stage order → top_k, each with a "rerank_score" (None if the budget ran out)"""
+        if not candidates:
+            return []
+        budget_s = (self.budget_ms if budget_ms is None else budget_ms) / 1000
+        t0 = time.perf_counter()
+        qh = text_hash(question)
+        scores = self._cached(qh, [c["id"] for c in candidates])
+        todo = [c for c in candidates if c["id"] not in scores]
+
+        fresh = {}
+        for start in range(0, len(todo), self.batch_size):
+            if fresh and time.perf_counter() - t0 > budget_s:
+                self.budget_cutoffs += 1
+                break
+            batch = todo[start:start + self.batch_size]
+            batch_scores = self.model.predict([(question, c["text"]) for c in batch], batch_size=self.batch_size)
+            for chunk, score in zip(batch, batch_scores):
+                fresh[chunk["id"]] = float(score)
+        self._store(qh, fresh)
+        scores.update(fresh)
+
+        self.calls += 1
+        self.pairs_scored += len(fresh)
+        self.cache_hits += len(candidates) - len(todo)
+        annotate(rerank_cache_hits=len(candidates) - len(todo), rerank_cache_misses=len(fresh))
+
+        # Scored candidates by cross-encoder score, then the rest in first-stage order
+        scored = sorted((c for c in candidates if c["id"] in scores), key=lambda c: scores[c["id"]], reverse=True)
+        rest = [c for c in candidates if c["id"] not in scores]
+        return [{**c, "rerank_score": scores.get(c["id"])} for c in (scored + rest)[:top_k]]
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "pairs_scored": self.pairs_scored,
+            "cache_hits": self.cache_hits,
+            "budget_cutoffs": self.budget_cutoffs,
+            "cache_size": len(self._cache),
+        }
@@ -0,0 +1,176 @@
+# src/resources.py
+"""
+Process-wide registry for expensive resources: the SentenceTransformer model, the
+embedding cache, the FAISS store, the reranker, LLM clients and the upload indexing queue. Each is created on first use and
+shared by everyone after that, so a process loads the model and index exactly once.
+Heavy imports happen inside the factories — importing this module is free.
+"""
+import os
+import json
+import time
+import threading
+from typing import Any, Callable, Dict, List
+
+from src.logger import logger
+
+_lock = threading.RLock()                      # guards the dicts below, held only briefly
+_key_locks: Dict[str, threading.RLock] = {}    # one per key, held while its factory runs
+_instances: Dict[str, Any] = {}
+_load_times: Dict[str, float] = {}
+_on_load: Dict[str, List[Callable]] = {}
+
+
+def rss_mb() -> float:
+    """Current resident set size (Linux /proc), falling back to peak RSS elsewhere"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _get(key: str, factory: Callable[[], Any]) -> Any:
+    instance = _instances.get(key)
+    if instance is not None:
+        return instance
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.RLock())
+    # Only callers of the same key wait for its factory (a minutes-long index build doesn't hold
+    # up the LLM client); re-entrant so a factory may ask for other resources
+    with key_lock:
+        if key not in _instances:
+            t0, rss0 = time.perf_counter(), rss_mb()
+            instance = factory()
+            with _lock:
+                _instances[key] = instance
+                _load_times[key] = time.perf_counter() - t0
+                callbacks = _on_load.pop(key, [])
+            logger.info(f"[Resources] Loaded {key} in {_load_times[key]:.2f}s (RSS {rss0:.0f} → {rss_mb():.0f} MB)")
+            for callback in callbacks:
+                callback(instance)
+        return _instances[key]
+
+
+def provide(key: str, instance: Any):
+    """Install a ready-made instance under a registry key ("llm:gpt-4.1", "embedding_model:...") —
+    benchmarks swap in offline stand-ins this way. Must happen before anyone asks for the key."""
+    with _lock:
+        _instances[key] = instance
+        _load_times[key] = 0.0
+        for callback in _on_load.pop(key, []):
+            callback(instance)
+
+
+def when_loaded(key: str, callback: Callable[[Any], None]):
+    """Run callback(instance) once the resource exists — immediately if it already does"""
+    with _lock:
+        if key in _instances:
+            callback(_instances[key])
+        else:
+            _on_load.setdefault(key, []).append(callback)
+
+
+def get_embedding_model(model_name: str = "all-MiniLM-L6-v2"):
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    return _get(f"embedding_model:{model_name}", load)
+
+
+def get_embedding_cache(model_name: str = "all-MiniLM-L6-v2"):
+    def load():
+        from src.embedding_cache import EmbeddingCache
+        return EmbeddingCache(model_name)
+    return _get(f"embedding_cache:{model_name}", load)
+
+
+def get_embedding_pipeline(model_name: str = "all-MiniLM-L6-v2"):
+    def load():
+        from src.embedding import EmbeddingPipeline
+        # EMBED_ARCHIVE_DTYPE=float16 / int8: smaller saved embeddings (float32 by default)
+        return EmbeddingPipeline(model_name, archive_dtype=os.getenv("EMBED_ARCHIVE_DTYPE", "float32"))
+    return _get(f"embedding_pipeline:{model_name}", load)
+
+
+def get_vector_store(persist_dir: str = "faiss_store"):
+    def load():
+        # VECTOR_SHARDS=N: partition by source over N shards; SHARD_WORKERS=1: one process per shard
+        n_shards = int(os.getenv("VECTOR_SHARDS", "1"))
+        # INDEX_TYPE=sq8 / binary / ..., INDEX_PARAMS='{"truncate_dim": 128, "rescore": 4}' — for new
+        # builds; an existing index keeps the type it was built with until the next full build
+        index_type = os.getenv("INDEX_TYPE") or None
+        index_params = json.loads(os.getenv("INDEX_PARAMS", "{}")) or None
+        if n_shards > 1:
+            from src.sharded_store import ShardedVectorStore
+            store = ShardedVectorStore(persist_dir, n_shards=n_shards, index_type=index_type, index_params=index_params,
+                                       workers=os.getenv("SHARD_WORKERS", "0") == "1")
+        else:
+            from src.vectorstore import FAISSVectorStore
+            store = FAISSVectorStore(persist_dir, index_type=index_type, index_params=index_params)
+        # Auto-build if no index
+        if not store.has_index:
+            print("[RAG] Building vector store from saved embeddings...")
+            store.build_from_embeddings()
+        return store
+    return _get(f"vector_store:{persist_dir}", load)
+
+
+def on_vector_store_loaded(callback: Callable[[Any], None], persist_dir: str = "faiss_store"):
+    when_loaded(f"vector_store:{persist_dir}", callback)
+
+
+def get_reranker(model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
+    def load():
+        from sentence_transformers import CrossEncoder
+        from src.reranker import CrossEncoderReranker
+        # Chunk ids are never reused, so cached scores stay valid across corpus changes
+        return CrossEncoderReranker(CrossEncoder(model_name))
+    return _get(f"reranker:{model_name}", load)
+
+
+def get_llm_client(model: str = "gpt-4.1"):
+    def load():
+        from src.llm import get_llm
+        return get_llm(model=model)
+    return _get(f"llm:{model}", load)
+
+
+def get_rag_search(llm_model: str = "gpt-4.1"):
+    def load():
+        from src.search import RAGSearch
+        return RAGSearch(llm_model=llm_model)
+    return _get(f"rag_search:{llm_model}", load)
+
+
+def get_indexing_queue(persist_dir: str = "faiss_store"):
+    def load():
+        from src.indexing_queue import IndexingQueue
+        # INDEX_WORKERS: uploads parsed / encoded / indexed in parallel (one keeps the model to itself)
+        return IndexingQueue(workers=int(os.getenv("INDEX_WORKERS", "1")), persist_dir=persist_dir)
+    return _get(f"indexing_queue:{persist_dir}", load)
+
+
+def warmup(llm_model: str = "gpt-4.1", background: bool = True):
+    """Load model, index and LLM client ahead of the first request"""
+    def run():
+        t0, rss0 = time.perf_counter(), rss_mb()
+        get_embedding_model()
+        get_embedding_cache()
+        get_vector_store()
+        get_llm_client(llm_model)
+        logger.info(f"[Resources] Warm-up done in {time.perf_counter() - t0:.2f}s "
+                    f"(RSS {rss0:.0f} → {rss_mb():.0f} MB) | {startup_report()}")
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="resource-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def startup_report() -> Dict:
+    return {
+        "loaded": {key: round(seconds, 3) for key, seconds in _load_times.items()},
+        "rss_mb": round(rss_mb(), 1),
+    }
@@ -0,0 +1,176 @@
+# src/router.py
+import os
+import json
+import time
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+ROUTER_MODES = ("llm", "similarity", "classifier", "hybrid")
+# Where the classifier used to be saved — inside the data folder, where every sync tried to ingest it
+LEGACY_MODEL_PATH = Path("data/router_classifier.npz")
+
+
+class LocalRouter:
+    """
+    Decide RAG vs DIRECT without an LLM round trip when the answer is obvious.
+
+    similarity  top-1 FAISS score of the question against the corpus:
+                ≥ rag_threshold → RAG, ≤ direct_threshold → DIRECT, otherwise unsure
+    classifier  logistic regression on the query embedding, trained on logged
+                LLM router decisions (python -m src.router); unsure below min_confidence
+    hybrid      similarity, then classifier, then LLM
+    llm         always the LLM (the original behaviour)
+
+    Every LLM decision is appended to decisions_path so the classifier can be retrained.
+    """
+
+    def __init__(self, mode: str = "hybrid", rag_threshold: float = 0.50, direct_threshold: float = 0.25,
+                 min_confidence: float = 0.85, decisions_path: str = "logs/router_decisions.jsonl",
+                 model_path: str = "data/embeddings/router_classifier.npz"):
+        if mode not in ROUTER_MODES:
+            raise ValueError(f"Unknown router mode: {mode} (choose from {ROUTER_MODES})")
+        self.mode = mode
+        self.rag_threshold = rag_threshold
+        self.direct_threshold = direct_threshold
+        self.min_confidence = min_confidence
+        self.decisions_path = Path(decisions_path)
+        self.model_path = Path(model_path)
+        if not self.model_path.exists() and LEGACY_MODEL_PATH.exists():
+            self.model_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(LEGACY_MODEL_PATH, self.model_path)
+        self.weights, self.bias = self._load_classifier()
+
+        self._lock = threading.Lock()
+        self.decisions = 0
+        self.fallbacks = 0
+        self.by_source: Dict[str, Dict] = {}
+
+    # ---------- deciders ----------
+    def _by_similarity(self, top1_score: Optional[float]) -> Optional[str]:
+        if top1_score is None:
+            return None
+        if top1_score >= self.rag_threshold:
+            return "rag"
+        if top1_score <= self.direct_threshold:
+            return "direct"
+        return None
+
+    def _by_classifier(self, query_vector: np.ndarray) -> Optional[str]:
+        if self.weights is None:
+            return None
+        p_rag = float(_sigmoid(query_vector.reshape(-1) @ self.weights + self.bias))
+        if max(p_rag, 1 - p_rag) < self.min_confidence:
+            return None
+        return "rag" if p_rag >= 0.5 else "direct"
+
+    def _local_route(self, query_vector: np.ndarray, top1_score: Optional[float]) -> Tuple[Optional[str], Optional[str]]:
+        if self.mode in ("similarity", "hybrid"):
+            route = self._by_similarity(top1_score)
+            if route is not None:
+                return route, "similarity"
+        if self.mode in ("classifier", "hybrid"):
+            route = self._by_classifier(query_vector)
+            if route is not None:
+                return route, "classifier"
+        return None, None
+
+    def needs_llm(self, query_vector: np.ndarray, top1_score: Optional[float]) -> bool:
+        """True when neither local decider is sure — route() will make the LLM call"""
+        return self._local_route(query_vector, top1_score)[0] is None
+
+    def route(self, question: str, query_vector: np.ndarray, top1_score: Optional[float],
+              llm_route: Callable[[], str]) -> Tuple[str, str]:
+        """→ (route, source) where source is the decider that answered"""
+        t0 = time.perf_counter()
+        route, source = self._local_route(query_vector, top1_score)
+        if route is None:
+            route, source = llm_route(), "llm"
+            self._log_decision(question, route)
+        self._record(source, time.perf_counter() - t0)
+        return route, source
+
+    async def aroute(self, question: str, query_vector: np.ndarray, top1_score: Optional[float],
+                     allm_route: Callable[[], Awaitable[str]]) -> Tuple[str, str]:
+        """Async twin of route — the LLM fallback is awaited"""
+        t0 = time.perf_counter()
+        route, source = self._local_route(query_vector, top1_score)
+        if route is None:
+            route, source = await allm_route(), "llm"
+            self._log_decision(question, route)
+        self._record(source, time.perf_counter() - t0)
+        return route, source
+
+    # ---------- bookkeeping ----------
+    def _record(self, source: str, elapsed: float):
+        with self._lock:
+            self.decisions += 1
+            if source == "llm" and self.mode != "llm":
+                self.fallbacks += 1
+            s = self.by_source.setdefault(source, {"count": 0, "total_ms": 0.0})
+            s["count"] += 1
+            s["total_ms"] += 1000 * elapsed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "decisions": self.decisions,
+                "fallback_rate": self.fallbacks / self.decisions if self.decisions else 0.0,
+                "by_source": {
+                    src: {"count": s["count"], "avg_ms": round(s["total_ms"] / s["count"], 2)}
+                    for src, s in self.by_source.items()
+                },
+            }
+
+    def _log_decision(self, question: str, route: str):
+        self.decisions_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.decisions_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"question": question, "route": route, "ts": time.time()}) + "\n")
+
+    # ---------- classifier ----------
+    def _load_classifier(self):
+        if not self.model_path.exists():
+            return None, 0.0
+        data = np.load(self.model_path)
+        return data["weights"], float(data["bias"])
+
+    def train(self, encode: Callable, epochs: int = 300, lr: float = 0.5, l2: float = 1e-3) -> Dict:
+        """Fit the classifier on logged LLM decisions. encode: list[str] → (n, dim) normalized"""
+        records = {}
+        with open(self.decisions_path, encoding="utf-8") as f:
+            for line in f:
+                r = json.loads(line)
+                records[r["question"]] = r["route"]  # latest decision per question wins
+        if len(set(records.values())) < 2:
+            raise ValueError("Need logged decisions for both RAG and DIRECT to train the router")
+
+        questions = list(records)
+        X = encode(questions)
+        y = np.array([records[q] == "rag" for q in questions], dtype=np.float32)
+
+        w = np.zeros(X.shape[1], dtype=np.float32)
+        b = 0.0
+        for _ in range(epochs):
+            p = _sigmoid(X @ w + b)
+            w -= lr * (X.T @ (p - y) / len(y) + l2 * w)
+            b -= lr * float(np.mean(p - y))
+
+        accuracy = float(np.mean((_sigmoid(X @ w + b) >= 0.5) == y))
+        self.model_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(self.model_path, weights=w, bias=b)
+        self.weights, self.bias = w, b
+        print(f"[Router] Trained on {len(y)} decisions ({int(y.sum())} RAG) — train accuracy {accuracy:.3f}")
+        return {"examples": len(y), "accuracy": accuracy}
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+# Retrain from logs/router_decisions.jsonl: python -m src.router
+if __name__ == "__main__":
+    from src.embedding import EmbeddingPipeline
+    pipeline = EmbeddingPipeline()
+    LocalRouter().train(pipeline.encode)
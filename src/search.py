@@ -1,41 +1,131 @@
-from src.vectorstore import FAISSVectorStore
-from src.embedding import EmbeddingPipeline
-from src.llm import get_llm
+from src.resources import get_vector_store, get_embedding_pipeline, get_llm_client, get_reranker
 from langchain_core.messages import HumanMessage
 from src.prompt import prompt_llm
+from src.models import RetrievalResult
+from src.sparse import fuse
+from src.context import build_context, count_tokens
+from src.logger import retrieval_logger
+from src.tracing import span, start_span, activate
+import os
 import numpy as np
+import time
+from typing import Dict, Iterator, List, Optional
 
 #retrive pipeline
 class RAGSearch:
-    def __init__(self, llm_model: str = "gpt-4o"):
-        self.vectorstore = FAISSVectorStore()
-        self.embedding_pipeline = EmbeddingPipeline()
-        self.llm = get_llm(model=llm_model)
-        print(f"[RAG] LLM ready: {llm_model}")
+    def __init__(self, llm_model: str = "gpt-4o", hybrid: bool = True, fusion: str = "rrf",
+                 fetch_multiplier: int = 4, alpha: float = 0.5,
+                 rerank: Optional[bool] = None, rerank_candidates: int = 20, context_tokens: int = 1500):
+        # Nothing is loaded here — model, index and LLM client come from the shared
+        # registry on first use (the store auto-builds from saved embeddings if needed)
+        self.llm_model = llm_model
+        # Hybrid: dense + BM25 each fetch top_k * fetch_multiplier, fused down to top_k
+        # fusion "rrf" (rank based, no tuning) or "weighted" (alpha * dense + (1 - alpha) * bm25)
+        self.hybrid = hybrid
+        self.fusion = fusion
+        self.fetch_multiplier = fetch_multiplier
+        self.alpha = alpha
+        # Rerank: over-fetch rerank_candidates, score them with a cross-encoder, keep top_k
+        self.rerank = os.getenv("RERANK", "0") == "1" if rerank is None else rerank
+        self.rerank_candidates = rerank_candidates
+        # Prompt budget for the retrieved context (after merging overlaps and dropping duplicates)
+        self.context_tokens = context_tokens
 
-        # Auto-build if no index
-        if self.vectorstore.index is None:
-            print("[RAG] Building vector store from saved embeddings...")
-            self.vectorstore.build_from_embeddings()
+    @property
+    def vectorstore(self):
+        return get_vector_store()
 
-    def get_context(self, question: str, top_k: int = 5) -> str:
-        query_emb = self.embedding_pipeline.model.encode(
-            [question], normalize_embeddings=True
-        ).astype("float32")
-        results = self.vectorstore.search(query_emb, top_k)
-        texts = [r["text"] for r in results]
-        return "\n\n".join(texts)
+    @property
+    def embedding_pipeline(self):
+        return get_embedding_pipeline()
 
+    @property
+    def reranker(self):
+        return get_reranker()
 
+    @property
+    def llm(self):
+        return get_llm_client(self.llm_model)
 
+    def encode_query(self, question: str) -> np.ndarray:
+        with span("encode_query"):
+            return self.embedding_pipeline.encode([question], query=True)
+
+    def retrieve(self, question: str, top_k: int = 5, query_vector: np.ndarray = None,
+                 filters: Optional[Dict] = None) -> RetrievalResult:
+        """Single encode + single FAISS search → chunks, scores, sources and rendered context.
+        Pass query_vector when the caller already encoded the question.
+        filters restrict the search, e.g. {"source": "data/pdf/attention.pdf"} or
+        {"file_types": [".pdf"], "added_after": ts, "metadata": {"page": 3}} — see FAISSVectorStore._filter_rows"""
+        with span("rag.retrieve", top_k=top_k, hybrid=self.hybrid, rerank=self.rerank, filtered=bool(filters)) as s:
+            query_emb = query_vector if query_vector is not None else self.encode_query(question)
+            n = self._candidates(top_k)
+            if self.hybrid:
+                dense = self.vectorstore.search(query_emb, n * self.fetch_multiplier, filters=filters)
+                results = self._fuse(question, dense, n, filters)
+            else:
+                results = self.vectorstore.search(query_emb, n, filters=filters)
+            if self.rerank:
+                with span("rerank", candidates=len(results)):
+                    results = self.reranker.rerank(question, results, top_k)
+            context, stats = self.build_context(results)
+            s.set(chunks=len(results))
+        return RetrievalResult(question=question, chunks=results, context=context, query_vector=query_emb,
+                               context_stats=stats)
+
+    def retrieve_batch(self, questions: List[str], top_k: int = 5,
+                       filters: Optional[Dict] = None) -> List[RetrievalResult]:
+        """Many questions (sharing one filter) → one encode call + one FAISS call"""
+        with span("rag.retrieve_batch", questions=len(questions), top_k=top_k, hybrid=self.hybrid,
+                  rerank=self.rerank, filtered=bool(filters)) as s:
+            with span("encode_query", questions=len(questions)):
+                query_embs = self.embedding_pipeline.encode(questions, query=True)
+            n = self._candidates(top_k)
+            if self.hybrid:
+                batch = self.vectorstore.search_batch(query_embs, n * self.fetch_multiplier, filters=filters)
+                batch = [self._fuse(q, dense, n, filters) for q, dense in zip(questions, batch)]
+            else:
+                batch = self.vectorstore.search_batch(query_embs, n, filters=filters)
+            if self.rerank:
+                with span("rerank", candidates=sum(len(results) for results in batch)):
+                    batch = [self.reranker.rerank(q, results, top_k) for q, results in zip(questions, batch)]
+            out = []
+            for i, (q, results) in enumerate(zip(questions, batch)):
+                context, stats = self.build_context(results)
+                out.append(RetrievalResult(question=q, chunks=results, context=context,
+                                           query_vector=query_embs[i:i + 1], context_stats=stats))
+            s.set(chunks=sum(len(r.chunks) for r in out))
+        return out
+
+    def _candidates(self, top_k: int) -> int:
+        """How many first-stage hits to keep — more when a reranker picks the final top_k"""
+        return max(top_k, self.rerank_candidates) if self.rerank else top_k
+
+    def _fuse(self, question: str, dense: List[dict], top_k: int, filters: Optional[Dict] = None) -> List[dict]:
+        """Add the BM25 hits for the question and fuse them with the dense ones"""
+        sparse = self.vectorstore.search_sparse(question, top_k * self.fetch_multiplier, filters=filters)
+        return fuse(dense, sparse, top_k, method=self.fusion, alpha=self.alpha)
+
+    def build_context(self, chunks: List[dict]):
+        """Merged, deduplicated, token-budgeted context → (text, stats)"""
+        with span("build_context") as s:
+            context, stats = build_context(chunks, max_tokens=self.context_tokens)
+            s.set(passages=stats["passages"], context_tokens=stats["context_tokens"],
+                  saved_tokens=stats["saved_tokens"])
+        if stats["chunks"]:
+            retrieval_logger.info(
+                f"Context: {stats['chunks']} chunks → {stats['passages']} passages "
+                f"({stats['merged']} merged, {stats['duplicates']} duplicates, {stats['dropped']} over budget) | "
+                f"{stats['context_tokens']} tokens, saved {stats['saved_tokens']}"
+            )
+        return context, stats
+
+    def get_context(self, question: str, top_k: int = 5, filters: Optional[Dict] = None) -> str:
+        return self.retrieve(question, top_k, filters=filters).context
 
     def _get_structured_context(self, question: str, top_k: int = 6):
-            """Used by agents.py for logging — returns rich results"""
-            query_emb = self.embedding_pipeline.model.encode(
-                [question], normalize_embeddings=True
-            ).astype("float32")
-            
-            return self.vectorstore.search(query_emb, top_k)  # Already returns list[dict]
+        """Used by agents.py for logging — returns rich results"""
+        return self.retrieve(question, top_k).chunks
 
     def index_file(self, file_path: str):
         """Index a new document and update the vector store"""
@@ -48,30 +138,53 @@ class RAGSearch:
         if not chunks:
             raise ValueError("No chunks generated from document")
         
-        # Generate embeddings
-        texts = [chunk.page_content for chunk in chunks]
-        embeddings = self.embedding_pipeline.model.encode(
-            texts, normalize_embeddings=True
-        ).astype("float32")
-        
-        # Add to vector store
-        self.vectorstore.add_embeddings(texts, embeddings, chunks)
+        with span("index_file", chunks=len(chunks)):
+            # Generate embeddings
+            texts = [chunk.page_content for chunk in chunks]
+            embeddings = self.embedding_pipeline.encode(texts)
+
+            # Add to vector store
+            self.vectorstore.add_embeddings(texts, embeddings, chunks)
         
         print(f"[RAG] Indexed {len(chunks)} chunks from {file_path}")
 
-    def query(self, question: str, top_k: int = 5) -> str:
-        context = self.get_context(question, top_k)
+    def query_stream(self, question: str, top_k: int = 5, filters: Optional[Dict] = None) -> Iterator[str]:
+        """Yield answer tokens as the LLM produces them"""
+        # A generator must not hold the current span across yields — the span is activated around
+        # the retrieval only, and ended explicitly
+        root = start_span("rag.query", top_k=top_k)
+        with activate(root):
+            retrieval = self.retrieve(question, top_k, filters=filters)
+        context = retrieval.context
         if not context.strip():
-            return "No relevant information found."
-
-            # using llm
+            root.end()
+            yield "No relevant information found."
+            return
 
+        # using llm
         prompt = prompt_llm.format(question=question, context=context)
 
-        response = ""
-        for chunk in self.llm.stream([HumanMessage(content=prompt)]):
-            response += chunk.content
-        return response.strip()
+        t0 = time.perf_counter()
+        first_token_at, n_tokens = None, 0
+        gen = start_span("generate_answer", parent=root, prompt_tokens=count_tokens(prompt))
+        try:
+            for chunk in self.llm.stream([HumanMessage(content=prompt)]):
+                if not chunk.content:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    gen.mark("ttft")
+                n_tokens += 1
+                yield chunk.content
+        finally:
+            gen.set(completion_tokens=n_tokens).end()
+            root.end()
+        if first_token_at is not None:
+            gen_s = max(time.perf_counter() - first_token_at, 1e-9)
+            print(f"[RAG] TTFT {1000 * (first_token_at - t0):.0f}ms | {n_tokens / gen_s:.1f} tok/s")
+
+    def query(self, question: str, top_k: int = 5, filters: Optional[Dict] = None) -> str:
+        return "".join(self.query_stream(question, top_k, filters)).strip()
 
 if __name__ == "__main__":
     rag = RAGSearch(llm_model="gpt-4.1")   # or "gpt-4o"
@@ -0,0 +1,80 @@
+# src/segments.py
+import os
+import time
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+
+class SegmentLog:
+    """
+    Append-only write-ahead segments next to the base index.
+
+    Every add_embeddings call writes one small vector segment instead of rewriting
+    faiss.index (chunk metadata is appended to the ChunkStore). Segment files are named after the row range
+    they cover (seg_<start_row>_<n_rows>), so on load we replay exactly the rows the
+    base does not already contain — no separate checkpoint file to keep in sync.
+    """
+
+    def __init__(self, segment_dir: Path):
+        self.segment_dir = Path(segment_dir)
+        self.segment_dir.mkdir(parents=True, exist_ok=True)
+
+    def _segments(self) -> List[Tuple[int, int, Path]]:
+        # a segment is committed once its .npy is renamed into place
+        segs = []
+        for npy in self.segment_dir.glob("seg_*.npy"):
+            _, start, n = npy.stem.split("_")
+            segs.append((int(start), int(n), npy))
+        return sorted(segs)
+
+    def append(self, start_row: int, embeddings: np.ndarray) -> Path:
+        """Write one segment — cost is proportional to the upload, not the corpus"""
+        npy_path = self.segment_dir / f"seg_{start_row:012d}_{len(embeddings):08d}.npy"
+        with open(f"{npy_path}.tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(embeddings, dtype="float32"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{npy_path}.tmp", npy_path)
+        return npy_path
+
+    def replay(self, base_rows: int) -> Iterator[np.ndarray]:
+        """Yield embeddings for segments not yet merged into a base of base_rows rows"""
+        rows = base_rows
+        for start, n, npy_path in self._segments():
+            if start + n <= rows:
+                continue  # already part of the base (merge finished, cleanup didn't)
+            if start != rows:
+                print(f"[Segments] Gap before {npy_path.name} (expected row {rows}) — stopping replay")
+                break
+            yield np.load(npy_path)
+            rows += n
+
+    def stats(self) -> Dict:
+        segs, sizes, mtimes = [], [], []
+        for start, n, path in self._segments():
+            try:
+                st = path.stat()
+            except FileNotFoundError:  # merged + truncated by a background merge since the glob
+                continue
+            segs.append((start, n, path))
+            sizes.append(st.st_size)
+            mtimes.append(st.st_mtime)
+        total_bytes = sum(sizes)
+        oldest = min(mtimes, default=None)
+        return {
+            "segments": len(segs),
+            "rows": sum(n for _, n, _ in segs),
+            "bytes": total_bytes,
+            "oldest_age_s": time.time() - oldest if oldest else 0.0,
+        }
+
+    def truncate(self, merged_rows: int):
+        """Delete segments fully contained in a base of merged_rows rows"""
+        for start, n, npy_path in self._segments():
+            if start + n <= merged_rows:
+                npy_path.unlink(missing_ok=True)
+
+    def clear(self):
+        for path in self.segment_dir.glob("seg_*"):
+            path.unlink(missing_ok=True)
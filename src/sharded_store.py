@@ -0,0 +1,262 @@
+# src/sharded_store.py
+import hashlib
+import threading
+import contextvars
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.vectorstore import FAISSVectorStore
+
+# Global chunk id = shard << SHARD_SHIFT | shard-local id — local ids stay consecutive within a
+# file, so "id + 1 is the next chunk" still holds for the context builder
+SHARD_SHIFT = 48
+
+
+def shard_for(source: str, n_shards: int) -> int:
+    """Stable source → shard mapping (blake2b, so it doesn't change between processes like hash() does)"""
+    digest = hashlib.blake2b(source.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % n_shards
+
+
+def _serve_shard(conn, persist_dir: str, index_type: Optional[str], index_params: Optional[Dict]):
+    """Worker process main loop: own one FAISSVectorStore, answer (method, args, kwargs) requests"""
+    store = FAISSVectorStore(persist_dir, index_type=index_type, index_params=index_params)
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        name, args, kwargs = message
+        try:
+            attr = getattr(store, name)
+            conn.send((True, attr(*args, **kwargs) if callable(attr) else attr))
+        except Exception as e:
+            conn.send((False, e))
+    conn.close()
+
+
+class _LocalShard:
+    """Shard living in this process"""
+
+    def __init__(self, persist_dir: str, index_type: Optional[str], index_params: Optional[Dict]):
+        self.store = FAISSVectorStore(persist_dir, index_type=index_type, index_params=index_params)
+
+    def call(self, name: str, *args, **kwargs):
+        attr = getattr(self.store, name)
+        return attr(*args, **kwargs) if callable(attr) else attr
+
+    def close(self):
+        pass
+
+
+class _ProcessShard:
+    """Shard served by a local worker process — same calls, arguments and results go over a pipe"""
+
+    def __init__(self, persist_dir: str, index_type: Optional[str], index_params: Optional[Dict]):
+        ctx = mp.get_context("spawn")  # no fork: FAISS / OpenMP thread pools don't survive it
+        self._conn, child = ctx.Pipe()
+        self._process = ctx.Process(target=_serve_shard, args=(child, persist_dir, index_type, index_params),
+                                    name=f"shard-{Path(persist_dir).name}", daemon=True)
+        self._process.start()
+        self._lock = threading.Lock()  # one request in flight per worker
+
+    def call(self, name: str, *args, **kwargs):
+        with self._lock:
+            self._conn.send((name, args, kwargs))
+            ok, result = self._conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.send(None)
+        self._process.join(timeout=10)
+
+
+class ShardedVectorStore:
+    """
+    N FAISSVectorStore shards under persist_dir/shard_XX, chunks placed by hash of their source.
+
+    Same interface as FAISSVectorStore for RAGSearch / EmbeddingPipeline / the apps:
+    - search / search_batch / search_sparse fan out to every shard in parallel (FAISS releases
+      the GIL; worker processes don't need it at all) and merge the per-shard top-k lists
+    - writes go to the source's shard; deletes are sent to all shards (a no-op where the
+      source isn't), so a document is always fully removed
+    - workers=True serves each shard from its own process, so corpus size and search QPS
+      scale past one interpreter
+
+    BM25 statistics (IDF, average length) are per shard, so sparse scores across shards are
+    close but not identical to a single index — fine for fusion, which is rank based.
+    """
+
+    def __init__(self, persist_dir: str = "faiss_store", n_shards: int = 4, index_type: Optional[str] = None,
+                 index_params: Optional[Dict] = None, workers: bool = False):
+        self.persist_dir = Path(persist_dir)
+        self.persist_dir.mkdir(exist_ok=True)
+        self.n_shards = n_shards
+        shard_cls = _ProcessShard if workers else _LocalShard
+        shard_dirs = [str(self.persist_dir / f"shard_{i:02d}") for i in range(n_shards)]
+        # Shards load their indexes in parallel too
+        with ThreadPoolExecutor(max_workers=n_shards) as pool:
+            self.shards = list(pool.map(lambda d: shard_cls(d, index_type, index_params), shard_dirs))
+        # Several concurrent requests can each have a query in flight on every shard
+        self._pool = ThreadPoolExecutor(max_workers=4 * n_shards, thread_name_prefix="shard-search")
+        self._lock = threading.Lock()
+        # Every write goes through here, so the parent keeps the corpus version itself
+        self.version = sum(self._fan_out("version"))
+        self._listeners = []
+        # Which shards have an index to search — kept here so queries don't ask every time
+        self._ready = self._fan_out("has_index")
+        print(f"[ShardedStore] {n_shards} shards ({'worker processes' if workers else 'in-process'}) "
+              f"under {self.persist_dir}")
+
+    # ---------- plumbing ----------
+    def _fan_out(self, name: str, *args, shards: Optional[List[int]] = None, **kwargs) -> List:
+        shards = range(self.n_shards) if shards is None else shards
+        # copy_context: searches on in-process shards report their spans under the caller's span
+        futures = [self._pool.submit(contextvars.copy_context().run, self.shards[i].call, name, *args, **kwargs)
+                   for i in shards]
+        return [f.result() for f in futures]
+
+    def _fan_out_indexed(self, name: str, *args):
+        """Like _fan_out, but each shard is told which shard it is: shard=(index, n_shards)"""
+        futures = [self._pool.submit(shard.call, name, *args, shard=(i, self.n_shards))
+                   for i, shard in enumerate(self.shards)]
+        return [f.result() for f in futures]
+
+    @staticmethod
+    def _globalize(shard: int, hits: List[Dict]) -> List[Dict]:
+        for hit in hits:
+            hit["id"] = (shard << SHARD_SHIFT) | hit["id"]
+        return hits
+
+    @staticmethod
+    def _merge(per_shard: List[List[Dict]], top_k: int) -> List[Dict]:
+        hits = [hit for shard_hits in per_shard for hit in shard_hits]
+        hits.sort(key=lambda h: h["score"], reverse=True)
+        return hits[:top_k]
+
+    def on_change(self, callback):
+        """Register callback(version) — called after every corpus change"""
+        self._listeners.append(callback)
+
+    def _bump_version(self):
+        with self._lock:
+            self.version += 1
+            version = self.version
+        for callback in self._listeners:
+            callback(version)
+
+    @property
+    def has_index(self) -> bool:
+        return any(self._ready)
+
+    # ---------- search ----------
+    def search(self, query_embedding: np.ndarray, top_k: int = 5, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None, filters: Optional[Dict] = None) -> List[Dict]:
+        return self.search_batch(query_embedding[:1], top_k, nprobe=nprobe, ef_search=ef_search, filters=filters)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5, nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None, filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """Every shard returns its own top_k per query; the global top_k is among them"""
+        shards = [i for i, ready in enumerate(self._ready) if ready]
+        if not shards:
+            raise ValueError("Index not built or loaded!")
+        per_shard = self._fan_out("search_batch", query_embeddings, top_k, shards=shards,
+                                  nprobe=nprobe, ef_search=ef_search, filters=filters)
+        per_shard = [[self._globalize(shard, hits) for hits in batch] for shard, batch in zip(shards, per_shard)]
+        return [self._merge([batch[q] for batch in per_shard], top_k) for q in range(len(query_embeddings))]
+
+    def search_sparse(self, query: str, top_k: int = 5, filters: Optional[Dict] = None) -> List[Dict]:
+        shards = [i for i, ready in enumerate(self._ready) if ready]
+        per_shard = self._fan_out("search_sparse", query, top_k, shards=shards, filters=filters)
+        return self._merge([self._globalize(i, hits) for i, hits in zip(shards, per_shard)], top_k)
+
+    def filter_ids(self, filters: Dict) -> np.ndarray:
+        per_shard = self._fan_out("filter_ids", filters)
+        return np.concatenate([(np.int64(i) << SHARD_SHIFT) | ids for i, ids in enumerate(per_shard)])
+
+    def sources(self) -> List[str]:
+        return sorted({s for shard_sources in self._fan_out("sources") for s in shard_sources})
+
+    # ---------- writes ----------
+    def add_embeddings(self, texts: List[str], embeddings: np.ndarray, chunks: List) -> np.ndarray:
+        """Split by source shard, add to the shards in parallel → global ids in input order"""
+        targets = np.array([shard_for(c.metadata.get("source", "uploaded_file"), self.n_shards) for c in chunks])
+        ids = np.empty(len(chunks), dtype=np.int64)
+        shards = [int(s) for s in np.unique(targets)]
+        futures = {}
+        for shard in shards:
+            pos = np.flatnonzero(targets == shard)
+            futures[shard] = (pos, self._pool.submit(self.shards[shard].call, "add_embeddings",
+                                                     [texts[i] for i in pos], embeddings[pos],
+                                                     [chunks[i] for i in pos]))
+        for shard, (pos, future) in futures.items():
+            ids[pos] = (np.int64(shard) << SHARD_SHIFT) | np.asarray(future.result(), dtype=np.int64)
+            self._ready[shard] = True
+        self._bump_version()
+        return ids
+
+    def remove_sources(self, sources: List[str]) -> int:
+        removed = sum(self._fan_out("remove_sources", sources))
+        if removed:
+            self._bump_version()
+        return removed
+
+    def delete_source(self, source: str) -> int:
+        return self.remove_sources([source])
+
+    def replace_source(self, source: str, texts: List[str], embeddings: np.ndarray, chunks: List) -> np.ndarray:
+        target = shard_for(source, self.n_shards)
+        others = [i for i in range(self.n_shards) if i != target]
+        if others:
+            self._fan_out("remove_sources", [source], shards=others)
+        ids = self.shards[target].call("replace_source", source, texts, embeddings, chunks)
+        self._ready[target] = True
+        self._bump_version()
+        return (np.int64(target) << SHARD_SHIFT) | np.asarray(ids, dtype=np.int64)
+
+    def replace_sources(self, sources: List[str], texts: List[str], embeddings: np.ndarray, chunks: List) -> np.ndarray:
+        """Per target shard one atomic replace (all shards in parallel) — each shard switches in one step,
+        but a search racing the commit may see one shard's documents before another's"""
+        targets = np.array([shard_for(c.metadata.get("source", "uploaded_file"), self.n_shards) for c in chunks])
+        owners = {shard_for(source, self.n_shards) for source in sources}
+        ids = np.empty(len(chunks), dtype=np.int64)
+        futures = {}
+        for shard in range(self.n_shards):
+            pos = np.flatnonzero(targets == shard)
+            if len(pos):
+                futures[shard] = (pos, self._pool.submit(self.shards[shard].call, "replace_sources", sources,
+                                                         [texts[i] for i in pos], embeddings[pos],
+                                                         [chunks[i] for i in pos]))
+            elif shard in owners:
+                # The document's new version has no chunks here — only its old ones go
+                futures[shard] = (pos, self._pool.submit(self.shards[shard].call, "remove_sources", sources))
+        for shard, (pos, future) in futures.items():
+            result = future.result()
+            if len(pos):
+                ids[pos] = (np.int64(shard) << SHARD_SHIFT) | np.asarray(result, dtype=np.int64)
+                self._ready[shard] = True
+        self._bump_version()
+        return ids
+
+    def build_from_embeddings(self, embed_dir: str = "data/embeddings"):
+        """Every shard builds from the saved embeddings of its own sources, all in parallel"""
+        self._fan_out_indexed("build_from_embeddings", embed_dir)
+        self._ready = self._fan_out("has_index")
+        self._bump_version()
+
+    def merge_segments(self):
+        self._fan_out("merge_segments")
+
+    def compact(self):
+        self._fan_out("compact")
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self._pool.shutdown(wait=False)
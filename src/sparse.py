@@ -0,0 +1,265 @@
+# src/sparse.py
+import os
+import re
+import numpy as np
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""a an and are as at be by for from has have in is it its of on or that the this to was
+were will with which we our their these those not but can also been than then there""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Sparse inverted index over the same rows as the FAISS store (row i = chunk i).
+
+    In memory: a CSR base (term → sorted doc ids + term frequencies) plus small
+    per-term delta lists for recent adds, folded into the base once they grow.
+    On disk (faiss_store/bm25/): append-only .npz segments named after the row range
+    they cover, consolidated into one when there are too many. Scoring touches only
+    the postings of the query terms, so cost is independent of corpus size for
+    selective terms (acronyms, names, equation labels).
+
+    One writer at a time (the vector store commits under its snapshot write lock); searches
+    only read, and every in-memory update is published so a concurrent search stays consistent.
+    """
+
+    MAX_SEGMENTS = 32
+
+    def __init__(self, index_dir: Path, k1: float = 1.5, b: float = 0.75, max_df: float = 0.25):
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.k1, self.b = k1, b
+        self.max_df = max_df
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.vocab = {}
+        self.terms: List[str] = []
+        self.doc_lens = np.empty(0, dtype=np.int32)
+        # CSR base (indptr, doc ids, tfs) + delta lists (term id → [(doc_ids, tfs), ...]),
+        # replaced as one tuple so a search never pairs a new base with already-folded deltas
+        self._inverted = (np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64),
+                          np.empty(0, dtype=np.float32), defaultdict(list))
+        self._delta_postings = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lens)
+
+    # ---------- persistence ----------
+    def _segments(self):
+        segs = []
+        for path in self.index_dir.glob("seg_*.npz"):
+            _, start, n = path.stem.split("_")
+            segs.append((int(start), int(n), path))
+        return sorted(segs)
+
+    def _load(self):
+        for start, n, path in self._segments():
+            if start + n <= len(self):
+                continue  # superseded by a consolidated segment
+            if start != len(self):
+                print(f"[BM25] Gap before {path.name} — stopping load at row {len(self)}")
+                break
+            with np.load(path, allow_pickle=False) as seg:
+                self._apply(list(seg["terms"]), seg["term_idx"], seg["doc_ids"], seg["tfs"], seg["doc_lens"])
+        self._compact()
+
+    def _write_segment(self, start_row: int, terms, term_idx, doc_ids, tfs, doc_lens):
+        path = self.index_dir / f"seg_{start_row:012d}_{len(doc_lens):08d}.npz"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, terms=np.array(terms, dtype=str), term_idx=term_idx, doc_ids=doc_ids, tfs=tfs, doc_lens=doc_lens)
+        os.replace(tmp, path)
+
+    def _consolidate_on_disk(self):
+        """Many small segments → one covering every row (same format)"""
+        self._compact()
+        indptr, doc_ids, tfs, _ = self._inverted
+        term_idx = np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(indptr))
+        old = self._segments()
+        self._write_segment(0, self.terms, term_idx, doc_ids, tfs, self.doc_lens)
+        for start, n, path in old:
+            if not (start == 0 and n == len(self)):
+                path.unlink(missing_ok=True)
+
+    # ---------- writes ----------
+    def add(self, start_row: int, texts: List[str]):
+        """Index rows start_row.. — O(tokens in texts)"""
+        if start_row != len(self):
+            raise ValueError(f"BM25 index has {len(self)} rows, cannot append at {start_row}")
+        terms, term_index = [], {}
+        term_idx, doc_ids, tfs = [], [], []
+        doc_lens = np.empty(len(texts), dtype=np.int32)
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lens[i] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                if term not in term_index:
+                    term_index[term] = len(terms)
+                    terms.append(term)
+                term_idx.append(term_index[term])
+                doc_ids.append(start_row + i)
+                tfs.append(tf)
+        term_idx = np.array(term_idx, dtype=np.int64)
+        doc_ids = np.array(doc_ids, dtype=np.int64)
+        tfs = np.array(tfs, dtype=np.float32)
+
+        self._write_segment(start_row, terms, term_idx, doc_ids, tfs, doc_lens)
+        self._apply(terms, term_idx, doc_ids, tfs, doc_lens)
+        if len(self._segments()) > self.MAX_SEGMENTS:
+            self._consolidate_on_disk()
+
+    def _apply(self, terms, term_idx, doc_ids, tfs, doc_lens):
+        mapping = np.empty(len(terms), dtype=np.int64)
+        for i, term in enumerate(terms):
+            tid = self.vocab.get(term)
+            if tid is None:
+                tid = self.vocab[term] = len(self.terms)
+                self.terms.append(term)
+            mapping[i] = tid
+        gids = mapping[term_idx] if len(term_idx) else term_idx
+
+        order = np.argsort(gids, kind="stable")
+        gids, doc_ids, tfs = gids[order], doc_ids[order], tfs[order]
+        # Row lengths first: a posting never names a row that doc_lens doesn't cover yet
+        self.doc_lens = np.concatenate([self.doc_lens, doc_lens.astype(np.int32)])
+        bounds = np.flatnonzero(np.diff(gids)) + 1
+        for ids, tf, g in zip(np.split(doc_ids, bounds), np.split(tfs, bounds), gids[np.r_[0, bounds]] if len(gids) else []):
+            self._inverted[3][int(g)].append((ids, tf))
+        self._delta_postings += len(doc_ids)
+
+        if self._delta_postings > max(200_000, len(self._inverted[1]) // 10):
+            self._compact()
+
+    def _compact(self):
+        """Fold delta lists into the CSR base (one stable sort by term id)"""
+        indptr, base_ids, base_tfs, delta = self._inverted
+        if not self._delta_postings and len(indptr) == len(self.terms) + 1:
+            return
+        gids = [np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))]
+        ids, tfs = [base_ids], [base_tfs]
+        for tid, parts in delta.items():
+            for part_ids, part_tfs in parts:
+                gids.append(np.full(len(part_ids), tid, dtype=np.int64))
+                ids.append(part_ids)
+                tfs.append(part_tfs)
+        gids = np.concatenate(gids)
+        order = np.argsort(gids, kind="stable")  # base before delta → doc ids stay ascending
+        counts = np.bincount(gids, minlength=len(self.terms))
+        self._inverted = (np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+                          np.concatenate(ids)[order], np.concatenate(tfs)[order], defaultdict(list))
+        self._delta_postings = 0
+
+    def rebuild(self, texts: Iterable[str], batch_size: int = 50_000):
+        """Index texts (any iterable — e.g. streamed from the chunk store) as rows 0..n-1"""
+        for _, _, path in self._segments():
+            path.unlink(missing_ok=True)
+        self._reset()
+        batch = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= batch_size:
+                self.add(len(self), batch)
+                batch = []
+        if batch:
+            self.add(len(self), batch)
+        self._consolidate_on_disk()
+
+    # ---------- search ----------
+    def _postings(self, tid: int) -> Tuple[np.ndarray, np.ndarray]:
+        parts_ids, parts_tfs = [], []
+        indptr, doc_ids, tfs, delta = self._inverted
+        if tid + 1 < len(indptr):
+            lo, hi = indptr[tid], indptr[tid + 1]
+            parts_ids.append(doc_ids[lo:hi])
+            parts_tfs.append(tfs[lo:hi])
+        for ids, tf in tuple(delta.get(tid, ())):
+            parts_ids.append(ids)
+            parts_tfs.append(tf)
+        if len(parts_ids) == 1:
+            return parts_ids[0], parts_tfs[0]
+        return np.concatenate(parts_ids), np.concatenate(parts_tfs)
+
+    def search(self, query: str, top_k: int = 10, exclude: Optional[np.ndarray] = None,
+               include: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """→ (rows, scores) best first; exclude = sorted rows to skip (tombstones), include = only these rows (filters)"""
+        doc_lens = self.doc_lens  # read once — rows appended mid-search don't change the stats
+        n_docs = len(doc_lens)
+        tids = [self.vocab[t] for t in dict.fromkeys(tokenize(query)) if t in self.vocab]
+        if not n_docs or not tids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        postings = [self._postings(tid) for tid in tids]
+        # Near-stopword terms (in > max_df of all rows) add little but dominate the cost — skip
+        # them unless nothing rarer is left
+        rare = [p for p in postings if len(p[0]) <= self.max_df * n_docs]
+        postings = rare or postings
+
+        avgdl = max(float(doc_lens.mean()), 1.0)
+        all_ids, all_scores = [], []
+        for ids, tf in postings:
+            idf = np.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_lens[ids] / avgdl)
+            all_ids.append(ids)
+            all_scores.append(idf * tf * (self.k1 + 1) / (tf + norm))
+
+        ids = np.concatenate(all_ids)
+        scores = np.concatenate(all_scores).astype(np.float32)
+        if len(postings) > 1:
+            ids, inverse = np.unique(ids, return_inverse=True)
+            scores = np.bincount(inverse, weights=scores).astype(np.float32)
+        if exclude is not None and len(exclude):
+            keep = ~np.isin(ids, exclude, assume_unique=False)
+            ids, scores = ids[keep], scores[keep]
+        if include is not None:
+            keep = np.isin(ids, include)
+            ids, scores = ids[keep], scores[keep]
+        if not len(ids):
+            return ids.astype(np.int64), scores
+
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(ids) else np.arange(len(ids))
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+
+def fuse(dense: List[dict], sparse: List[dict], top_k: int, method: str = "rrf",
+         rrf_k: int = 60, alpha: float = 0.5) -> List[dict]:
+    """
+    Merge dense and BM25 hit lists (dicts with "id" and "score") into one ranking.
+    rrf      sum of 1 / (rrf_k + rank) over both lists - scale-free, the default
+    weighted alpha * dense + (1 - alpha) * bm25, each min-max normalised per query
+    Hits keep dense_score / bm25_score (None if only one side found them);
+    "score" becomes the fused score.
+    """
+    if method not in ("rrf", "weighted"):
+        raise ValueError(f"Unknown fusion method: {method}")
+
+    merged = {}
+    fused = {}
+    for name, hits, weight in (("dense_score", dense, alpha), ("bm25_score", sparse, 1 - alpha)):
+        if not hits:
+            continue
+        scores = [h["score"] for h in hits]
+        lo, hi = min(scores), max(scores)
+        for rank, hit in enumerate(hits):
+            entry = merged.setdefault(hit["id"], {**hit, "dense_score": None, "bm25_score": None})
+            entry[name] = hit["score"]
+            if method == "rrf":
+                contrib = 1.0 / (rrf_k + rank + 1)
+            else:
+                contrib = weight * ((hit["score"] - lo) / (hi - lo) if hi > lo else 1.0)
+            fused[hit["id"]] = fused.get(hit["id"], 0.0) + contrib
+
+    ranked = sorted(merged.values(), key=lambda e: fused[e["id"]], reverse=True)[:top_k]
+    for entry in ranked:
+        entry["score"] = float(fused[entry["id"]])
+    return ranked
@@ -0,0 +1,180 @@
+# src/synthetic.py
+"""
+Offline stand-ins for benchmarking (python -m src.benchmark): a synthetic document corpus with
+known-answer queries, clustered vectors for index scale tests, a hashing embedder and a stub LLM.
+Everything is seeded, so two runs with the same arguments see exactly the same data.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+_SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vi", "zo", "pe", "sha", "tri", "gen", "bor", "dal", "fen", "qua"]
+DIRECT_QUESTIONS = [
+    "Tell me a joke about databases",
+    "What is 17 × 24?",
+    "Write a haiku about the sea",
+    "What's a good name for a cat?",
+]
+
+
+def _words(rng: np.random.Generator, n: int, min_syl: int = 2, max_syl: int = 4) -> List[str]:
+    """n distinct pseudo-words (n must stay well below the 16^max_syl possible ones)"""
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(_SYLLABLES, rng.integers(min_syl, max_syl + 1))))
+    return sorted(words)
+
+
+def generate_corpus(out_dir: str, n_docs: int = 200, paragraphs: int = 12, n_topics: int = 20,
+                    seed: int = 0) -> Tuple[List[str], List[Dict]]:
+    """
+    Write n_docs .txt/.md files under out_dir → (paths, queries).
+
+    Each document is about one topic: its sentences mix that topic's vocabulary with shared
+    background words, plus a few codes ("ZX-1042") unique to the document. Every query is
+    built from one sentence of one document, so the right source is known ({"question",
+    "source", "topic"}); a handful of general-knowledge questions (source None) exercise the
+    DIRECT route.
+    """
+    rng = np.random.default_rng(seed)
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    background = _words(rng, 400, 2, 3)
+    topic_words = [_words(rng, 40, 3, 4) for _ in range(n_topics)]
+
+    paths, queries = [], []
+    for doc in range(n_docs):
+        topic = doc % n_topics
+        codes = [f"{''.join(rng.choice(list('ABCDEFGHKMNPRSTXZ'), 2))}-{rng.integers(1000, 9999)}" for _ in range(3)]
+        sentences = []
+        for _ in range(paragraphs * 6):
+            words = list(rng.choice(background, rng.integers(8, 14))) + list(rng.choice(topic_words[topic], 4))
+            if rng.random() < 0.15:
+                words.append(rng.choice(codes))
+            rng.shuffle(words)
+            sentences.append(" ".join(words).capitalize() + ".")
+        text = "\n\n".join(" ".join(sentences[p * 6:(p + 1) * 6]) for p in range(paragraphs))
+        path = out / f"topic{topic:02d}_doc{doc:05d}{'.md' if doc % 3 == 0 else '.txt'}"
+        path.write_text(f"# Report {doc} on {topic_words[topic][0]}\n\n{text}\n", encoding="utf-8")
+        paths.append(str(path))
+
+        sentence = sentences[rng.integers(len(sentences))].rstrip(".").lower().split()
+        start = rng.integers(0, max(len(sentence) - 8, 1))
+        queries.append({"question": f"What does the report say about {' '.join(sentence[start:start + 8])}?",
+                        "source": str(path.resolve()), "topic": topic})
+
+    for question in DIRECT_QUESTIONS:
+        queries.append({"question": question, "source": None, "topic": None})
+    (out / "queries.json").write_text(json.dumps(queries, indent=1))
+    return paths, queries
+
+
+def synthetic_vectors(n: int, dim: int = 384, n_clusters: int = 256, seed: int = 0,
+                      batch_size: int = 100_000) -> Iterator[np.ndarray]:
+    """n clustered unit vectors in batches — corpus-like neighbourhoods without running a model"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    for start in range(0, n, batch_size):
+        k = min(batch_size, n - start)
+        x = centers[rng.integers(0, n_clusters, k)] + 0.8 * rng.normal(size=(k, dim)).astype(np.float32)
+        yield x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def synthetic_queries(corpus: np.ndarray, n: int = 1000, noise: float = 0.05, seed: int = 1) -> np.ndarray:
+    """Perturbed corpus vectors, so every query has true neighbours"""
+    rng = np.random.default_rng(seed)
+    q = corpus[rng.integers(0, len(corpus), n)] + noise * rng.normal(size=(n, corpus.shape[1])).astype(np.float32)
+    return (q / np.linalg.norm(q, axis=1, keepdims=True)).astype(np.float32)
+
+
+class HashEmbedder:
+    """
+    SentenceTransformer stand-in: signed feature hashing of lowercased words. Lexical, not
+    semantic — good enough to give retrieval something real to find, with no model download.
+    """
+
+    _TOKEN = re.compile(r"\w+")
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self._buckets: Dict[str, Tuple[int, float]] = {}
+
+    def _bucket(self, token: str) -> Tuple[int, float]:
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            bucket = self._buckets[token] = (h % self.dim, 1.0 if (h >> 63) else -1.0)
+        return bucket
+
+    def encode(self, texts: List[str], batch_size: int = 64, show_progress_bar: bool = False,
+               normalize_embeddings: bool = True, **_) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in self._TOKEN.findall(text.lower()):
+                j, sign = self._bucket(token)
+                out[i, j] += sign
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+
+class _Message:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class StubLLM:
+    """
+    ChatOpenAI stand-in with the calls the agents make (invoke / ainvoke / stream / astream).
+    Routing prompts get RAG (DIRECT for the generator's general-knowledge questions); answers
+    arrive after ttft_ms and then stream at tokens_per_s, so ask() timings include a
+    realistic, fixed generation cost instead of network noise.
+    """
+
+    def __init__(self, ttft_ms: float = 150.0, tokens_per_s: float = 80.0, answer_tokens: int = 60):
+        self.ttft_s = ttft_ms / 1000
+        self.token_s = 1 / tokens_per_s
+        self.answer_tokens = answer_tokens
+        self.calls = 0
+
+    def _reply(self, messages) -> List[str]:
+        self.calls += 1
+        prompt = messages[-1].content
+        if "RAG or DIRECT" in prompt:
+            direct = any(q in prompt for q in DIRECT_QUESTIONS)
+            return ["DIRECT" if direct else "RAG"]
+        words = re.findall(r"\w+", prompt)[-self.answer_tokens:] or ["ok"]
+        return [w + " " for w in words]
+
+    def invoke(self, messages):
+        tokens = self._reply(messages)
+        time.sleep(self.ttft_s + self.token_s * (len(tokens) - 1))
+        return _Message("".join(tokens))
+
+    def stream(self, messages):
+        time.sleep(self.ttft_s)
+        for i, token in enumerate(self._reply(messages)):
+            if i:
+                time.sleep(self.token_s)
+            yield _Message(token)
+
+    async def ainvoke(self, messages):
+        tokens = self._reply(messages)
+        await asyncio.sleep(self.ttft_s + self.token_s * (len(tokens) - 1))
+        return _Message("".join(tokens))
+
+    async def astream(self, messages):
+        await asyncio.sleep(self.ttft_s)
+        for i, token in enumerate(self._reply(messages)):
+            if i:
+                await asyncio.sleep(self.token_s)
+            yield _Message(token)
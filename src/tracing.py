@@ -0,0 +1,260 @@
+# src/tracing.py
+"""
+Span-based tracing + Prometheus-style metrics for the agent pipeline.
+
+    with span("retrieve_context") as s:
+        ...
+        s.set(chunks=len(chunks))
+
+Spans nest through a contextvar (asyncio tasks and asyncio.to_thread inherit it; plain thread
+pools need contextvars.copy_context().run). Every finished span feeds the metrics registry:
+
+    rag_span_duration_seconds{span}              histogram of every span
+    rag_span_errors_total{span}                  spans that raised
+    rag_span_event_seconds{span,event}           attributes named <event>_ms (e.g. ttft_ms)
+    rag_tokens_total{span,kind}                  attributes named <kind>_tokens
+    rag_cache_lookups_total{span,cache,result}   attributes named <cache>_hits / <cache>_misses
+    rag_chunks_total{span}                       the "chunks" attribute
+
+Config (env):
+    METRICS_PORT=9464                 serve /metrics over HTTP (serve_metrics(), started by the apps)
+    TRACE_JSONL=logs/traces.jsonl     append one JSON line per finished span
+    TRACE_SAMPLE=0.1                  share of traces written to the JSONL sink (metrics see all)
+"""
+import os
+import json
+import time
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics:
+    """Counters and fixed-bucket histograms keyed by (name, labels), rendered as Prometheus text"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], list] = {}  # → [bucket counts..., sum, count]
+        self._help: Dict[str, Tuple[str, str]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    @staticmethod
+    def _labels(labels: Tuple, extra: str = "") -> str:
+        parts = [f'{k}="{str(v)}"'.replace("\n", " ") for k, v in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+        lines, seen = [], set()
+
+        def header(name: str, default_kind: str):
+            if name not in seen:
+                seen.add(name)
+                kind, help_text = self._help.get(name, (default_kind, name))
+                lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{self._labels(labels)} {value:g}")
+        for (name, labels), h in sorted(histograms.items()):
+            header(name, "histogram")
+            for bound, count in zip(LATENCY_BUCKETS, h):
+                le = f'le="{bound:g}"'
+                lines.append(f"{name}_bucket{self._labels(labels, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{self._labels(labels, le)} {h[-1]}")
+            lines.append(f"{name}_sum{self._labels(labels)} {h[-2]:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {h[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("rag_span_duration_seconds", "histogram", "Wall time per pipeline span")
+metrics.describe("rag_span_errors_total", "counter", "Spans that ended with an exception")
+metrics.describe("rag_span_event_seconds", "histogram", "Time from span start to an event (e.g. first token)")
+metrics.describe("rag_tokens_total", "counter", "Tokens by span and kind (prompt, completion, context)")
+metrics.describe("rag_cache_lookups_total", "counter", "Cache lookups by cache and result")
+metrics.describe("rag_chunks_total", "counter", "Chunks returned by retrieval spans")
+
+
+class JsonlTraceSink:
+    """Append-only span log — one JSON object per line, safe to tail / ship"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+
+_sink = JsonlTraceSink(os.environ["TRACE_JSONL"]) if os.getenv("TRACE_JSONL") else None
+_sample = float(os.getenv("TRACE_SAMPLE", "1.0"))
+_current: contextvars.ContextVar = contextvars.ContextVar("rag_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(64):016x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.sampled = parent.sampled if parent else random.random() < _sample
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.attrs: Dict = dict(attrs)
+        self.error: Optional[str] = None
+        self.duration_s: Optional[float] = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def add(self, **counts):
+        """Accumulate numeric attributes (cache hits over several lookups, tokens over a stream)"""
+        for key, value in counts.items():
+            self.attrs[key] = self.attrs.get(key, 0) + value
+        return self
+
+    def mark(self, event: str):
+        """Record the time since span start as <event>_ms (first call wins)"""
+        self.attrs.setdefault(f"{event}_ms", 1000 * (time.perf_counter() - self._t0))
+        return self
+
+    def end(self):
+        if self.duration_s is not None:
+            return
+        self.duration_s = time.perf_counter() - self._t0
+        _record(self)
+
+
+def _record(s: Span):
+    metrics.observe("rag_span_duration_seconds", s.duration_s, span=s.name)
+    if s.error:
+        metrics.inc("rag_span_errors_total", span=s.name)
+    for key, value in s.attrs.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        if key.endswith("_ms"):
+            metrics.observe("rag_span_event_seconds", value / 1000, span=s.name, event=key[:-3])
+        elif key.endswith("_tokens"):
+            metrics.inc("rag_tokens_total", value, span=s.name, kind=key[:-7])
+        elif key.endswith("_hits"):
+            metrics.inc("rag_cache_lookups_total", value, span=s.name, cache=key[:-5], result="hit")
+        elif key.endswith("_misses"):
+            metrics.inc("rag_cache_lookups_total", value, span=s.name, cache=key[:-7], result="miss")
+        elif key == "chunks":
+            metrics.inc("rag_chunks_total", value, span=s.name)
+    if _sink is not None and s.sampled:
+        _sink.write({
+            "trace_id": s.trace_id, "span_id": s.span_id,
+            "parent_id": s.parent.span_id if s.parent else None,
+            "name": s.name, "start": round(s.start, 6), "duration_ms": round(1000 * s.duration_s, 3),
+            "attrs": s.attrs, "error": s.error,
+        })
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def start_span(name: str, parent: Optional[Span] = None, **attrs) -> Span:
+    """A span that is not made current — for generators, which must not hold the contextvar across
+    yields. Nest work under it with activate(); call end() when done."""
+    return Span(name, parent if parent is not None else _current.get(), **attrs)
+
+
+@contextmanager
+def activate(s: Span):
+    """Make s the parent of spans opened inside the block (without ending it)"""
+    token = _current.set(s)
+    try:
+        yield s
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    s = start_span(name, **attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+def annotate(**counts):
+    """Add counters to the current span, if any — lets caches report hits without knowing who asked"""
+    s = _current.get()
+    if s is not None:
+        s.add(**counts)
+
+
+def serve_metrics(port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """GET /metrics → Prometheus text format, from a daemon thread. Port from METRICS_PORT if not given."""
+    port = port or int(os.getenv("METRICS_PORT", "0"))
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):  # no access log on stderr for every scrape
+            pass
+
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    except OSError as e:  # second process on the same host, port taken
+        print(f"[Tracing] Metrics endpoint not started on :{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[Tracing] Metrics on http://0.0.0.0:{port}/metrics")
+    return server
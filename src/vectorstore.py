@@ -2,111 +2,741 @@
 import faiss
 import numpy as np
 import pickle
+import json
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 import os
+import threading
+import time
+import hashlib
+from collections import OrderedDict
+import shutil
+from contextlib import contextmanager
+from src.index_factory import build_index, make_index, default_params, search_params, with_ids, empty_clone, \
+    rescore, to_similarity, supports_selector, masked_search
+from src.segments import SegmentLog
+from src.chunkstore import ChunkStore
+from src.sparse import BM25Index
+from src.tracing import span
+
+# Advisory lock on the store directory (POSIX); without it only one instance per store is safe
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class _ReadWriteLock:
+    """Many readers or one writer; a waiting writer holds back new readers so commits aren't starved"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
 
 class FAISSVectorStore:
-    def __init__(self, persist_dir: str = "faiss_store"):
+    # Merge policy for append-only segments → base index
+    MERGE_MAX_SEGMENTS = 16
+    MERGE_MAX_BYTES = 256 * 1024 * 1024
+    MERGE_MAX_AGE_S = 300
+    # Filters matching at most this many rows are searched exactly over just those vectors
+    # (a throwaway sub-index) instead of an IDSelector over the whole index
+    SUBINDEX_MAX_ROWS = 20_000
+    SUBINDEX_CACHE_SIZE = 32
+    # Compact (drop tombstoned chunks for good) once this share of the rows is dead
+    COMPACT_DEAD_RATIO = 0.2
+
+    def __init__(self, persist_dir: str = "faiss_store", index_type: Optional[str] = None, index_params: Optional[Dict] = None):
         self.persist_dir = Path(persist_dir)
         self.persist_dir.mkdir(exist_ok=True)
         self.index_path = self.persist_dir / "faiss.index"
-        self.metadata_path = self.persist_dir / "metadata.pkl"
+        self.metadata_path = self.persist_dir / "metadata.pkl"  # legacy, migrated to chunks/
+        self.chunks_dir = self.persist_dir / "chunks"
+        self.tombstones_path = self.persist_dir / "tombstones.bin"
+        self.config_path = self.persist_dir / "config.json"
+        self.compact_marker = self.persist_dir / "COMPACTING"
+        self.segments = SegmentLog(self.persist_dir / "segments")
 
-        if self.index_path.exists() and self.metadata_path.exists():
+        self._lock = threading.RLock()         # guards index + chunk store mutation
+        self._merge_lock = threading.Lock()    # one background merge / compaction at a time
+        # Dense searches read the index under .read(); in-place updates (append, tombstones) commit
+        # under .write() — so a search sees a corpus version completely or not at all.
+        # Always taken before _lock, never while holding it.
+        self._snapshot = _ReadWriteLock()
+        self._merge_timer = None
+        self._subindex_cache = OrderedDict()   # filter rows → reconstructed vectors, cleared on change
+        self._subindex_lock = threading.Lock()  # concurrent searches share the cache
+
+        # Index type: explicit argument > persisted config > flat
+        config = self._load_config()
+        self.index_type = index_type or config.get("index_type", "flat")
+        self.index_params = {**config.get("index_params", {}), **(index_params or {})}
+        # What the next full build uses — a loaded index keeps the type it was built with (see _load)
+        self.build_type, self.build_params = self.index_type, self.index_params
+        # Bumped on every corpus change — caches key on it
+        self.version = config.get("kb_version", 0)
+        self._listeners = []
+
+        if self.metadata_path.exists() and not self.chunks_dir.exists():
+            self._migrate_metadata_pkl()
+        # Crash recovery only when no other instance has the store open — theirs may be mid-compaction
+        if self._lock_dir():
+            self._recover_compaction()
+            if fcntl is not None:
+                fcntl.flock(self._dir_lock, fcntl.LOCK_SH)
+        elif self.compact_marker.exists():
+            print(f"[VectorStore] {self.persist_dir} is open elsewhere with a compaction pending — left to its owner")
+        self.chunks = ChunkStore(self.chunks_dir)
+        self._load_tombstones()
+        # Keyword side of hybrid search — indexed by chunk-store row
+        self.sparse = BM25Index(self.persist_dir / "bm25")
+
+        if self.index_path.exists():
             print("[VectorStore] Loading existing FAISS index...")
             self._load()
         else:
             print("[VectorStore] No index found. Will build when you call .build()")
             self.index = None
-            self.metadata = []
+
+    def _lock_dir(self) -> bool:
+        """Hold a shared flock on persist_dir/.lock for this instance's lifetime → True (holding it
+        exclusively for now) if no other instance, in this process or another, has the store open"""
+        self._dir_lock = open(self.persist_dir / ".lock", "a")
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(self._dir_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            fcntl.flock(self._dir_lock, fcntl.LOCK_SH)  # waits out an instance that is recovering now
+            return False
+
+    def _load_config(self) -> Dict:
+        if self.config_path.exists():
+            return json.loads(self.config_path.read_text())
+        return {}
+
+    def _save_config(self):
+        self.config_path.write_text(json.dumps({
+            "index_type": self.index_type,
+            "index_params": self.index_params,
+            "kb_version": self.version,
+        }, indent=2))
+
+    @property
+    def has_index(self) -> bool:
+        return self.index is not None
+
+    @property
+    def rescore_factor(self) -> int:
+        """Compressed indexes (sq8, binary, truncate_dim) fetch this many × top_k, then rescore in float32"""
+        return int(self.index_params.get("rescore") or 0)
+
+    def _vectors_for_ids(self, ids: np.ndarray) -> np.ndarray:
+        return self.chunks.vectors(self.chunks.rows_for_ids(ids))
+
+    def on_change(self, callback):
+        """Register callback(version) — called after every corpus change"""
+        self._listeners.append(callback)
+
+    def _bump_version(self):
+        self.version += 1
+        with self._subindex_lock:
+            self._subindex_cache.clear()
+        self._save_config()
+        for callback in self._listeners:
+            callback(self.version)
+
+    def _migrate_metadata_pkl(self):
+        """One-off conversion of the old list-of-dicts pickle into the columnar chunk store"""
+        with open(self.metadata_path, "rb") as f:
+            metadata = pickle.load(f)
+        ChunkStore.rebuild(self.chunks_dir, metadata)
+        self.metadata_path.rename(self.metadata_path.with_suffix(".pkl.migrated"))
+        print(f"[VectorStore] Migrated {len(metadata)} chunks from metadata.pkl → {self.chunks_dir}")
 
     def _load(self):
         self.index = faiss.read_index(str(self.index_path))
-        with open(self.metadata_path, "rb") as f:
-            self.metadata = pickle.load(f)
-        print(f"[VectorStore] Loaded {self.index.ntotal} vectors")
+        config = self._load_config()
+        if config.get("index_type", self.index_type) != self.index_type:
+            print(f"[VectorStore] Index on disk is {config['index_type']} — {self.index_type} applies from the next build")
+            self.index_type, self.index_params = config["index_type"], config.get("index_params", {})
+        if not isinstance(self.index, faiss.IndexIDMap2):
+            # Saved before stable ids: positions become ids (the chunk store backfills the same)
+            self.index = with_ids(self.index)
+        base_rows = self.index.ntotal
+
+        # Recover base + unmerged segments — index position i is chunk-store row i
+        for embeddings in self.segments.replay(base_rows):
+            start = self.index.ntotal
+            self.index.add_with_ids(embeddings, self.chunks.ids_for_rows(np.arange(start, start + len(embeddings))))
+        # chunk rows are appended before their segment commits — drop rows the index never got
+        self.chunks.truncate(self.index.ntotal)
+        replayed = self.index.ntotal - base_rows
+        print(f"[VectorStore] Loaded {self.index.ntotal} vectors ({self.index_type}, {replayed} from segments)")
+        self._sync_sparse()
+
+    def _sync_sparse(self, batch_size: int = 50_000):
+        """Catch the BM25 index up with the chunk store (stores built before hybrid search, or a crash mid-add)"""
+        n_chunks = len(self.chunks)
+        if len(self.sparse) > n_chunks:
+            self.sparse.rebuild([self.chunks.text(i) for i in range(n_chunks)])
+            return
+        if len(self.sparse) == n_chunks:
+            return
+        start = time.time()
+        missing = n_chunks - len(self.sparse)
+        while len(self.sparse) < n_chunks:
+            lo = len(self.sparse)
+            hi = min(lo + batch_size, n_chunks)
+            self.sparse.add(lo, [self.chunks.text(i) for i in range(lo, hi)])
+        print(f"[VectorStore] BM25 index caught up on {missing} chunks in {time.time() - start:.1f}s")
+
+    def _load_tombstones(self):
+        if self.tombstones_path.exists():
+            self.tombstones = np.unique(np.fromfile(self.tombstones_path, dtype=np.int64))
+        else:
+            self.tombstones = np.empty(0, dtype=np.int64)
+        self._update_selector()
+
+    def _update_selector(self):
+        """Search-time exclusion of removed ids (the Not keeps its inner selector alive)"""
+        # BM25 and filters work on rows — keep the tombstones' rows at hand too
+        rows = self.chunks.rows_for_ids(self.tombstones)
+        self._dead_rows = rows[rows >= 0]
+        if len(self.tombstones):
+            removed = faiss.IDSelectorBatch(self.tombstones)
+            live = faiss.IDSelectorNot(removed)
+            live.referenced_objects = [removed]
+            self._live_sel = live
+        else:
+            self._live_sel = None
+
+    def _tombstone_sources(self, sources: List[str]) -> int:
+        """Tombstone every live chunk of the given sources — O(chunks removed), no index rewrite"""
+        rows = [self.chunks.rows_for_source(source) for source in sources]
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        ids = np.setdiff1d(self.chunks.ids_for_rows(rows), self.tombstones)
+        if not len(ids):
+            return 0
+        with open(self.tombstones_path, "ab") as f:
+            f.write(ids.tobytes())
+        self.tombstones = np.union1d(self.tombstones, ids)
+        self._update_selector()
+        return len(ids)
+
+    def remove_sources(self, sources: List[str]) -> int:
+        with self._snapshot.write(), self._lock:
+            removed = self._tombstone_sources(sources)
+            if removed:
+                self._bump_version()
+        if removed:
+            print(f"[VectorStore] Removed {removed} chunks from {len(sources)} source(s)")
+            self._maybe_compact()
+        return removed
+
+    def delete_source(self, source: str) -> int:
+        """Remove one document → number of chunks removed"""
+        return self.remove_sources([source])
 
-    def build_from_embeddings(self, embed_dir: str = "data/embeddings"):
-        from src.embedding import EmbeddingPipeline
-        pipeline = EmbeddingPipeline()
+    def replace_source(self, source: str, texts: List[str], embeddings: np.ndarray, chunks: List) -> np.ndarray:
+        """Swap a document's chunks for new ones in one step (one version bump) → the new chunk ids"""
+        return self.replace_sources([source], texts, embeddings, chunks)
 
-        all_embeddings = []
-        all_metadatas = []
-        embed_dir_path = Path(embed_dir)
+    def replace_sources(self, sources: List[str], texts: List[str], embeddings: np.ndarray, chunks: List) -> np.ndarray:
+        """
+        Swap several documents' chunks for new ones as one commit: searches see all of the old
+        chunks or all of the new ones, never a mix (one version bump) → the new chunk ids
+        """
+        with self._snapshot.write(), self._lock:
+            removed = self._tombstone_sources(sources)
+            ids = self._append(texts, embeddings, chunks)
+            self._bump_version()
+        self._maybe_merge()
+        self._maybe_compact()
+        label = sources[0] if len(sources) == 1 else f"{len(sources)} sources"
+        print(f"[VectorStore] Replaced {label}: {removed} chunks out, {len(ids)} in")
+        return ids
 
-        print(f"[VectorStore] Building from {embed_dir_path}")
+    def sources(self) -> List[str]:
+        """Sources with at least one live chunk"""
+        with self._snapshot.read():
+            dead = set(self._dead_rows.tolist())
+            return [s for s in self.chunks.sources
+                    if any(int(r) not in dead for r in self.chunks.rows_for_source(s))]
 
-        for pkl_file in embed_dir_path.rglob("*.pkl"):
-            with open(pkl_file, "rb") as f:
-                data = pickle.load(f)
-                embeddings = data["embeddings"].astype("float32")
-                chunks = data["chunks"]
+    # ---------- compaction ----------
+    def compact(self):
+        """
+        Drop tombstoned chunks for good: rewrite base index, chunk store and BM25 from the live rows.
+        Chunk ids don't change. The O(corpus) rewrite works from a snapshot with no lock held —
+        searches and uploads carry on — and only the swap is a short write-locked step, which
+        first replays the rows appended since the snapshot. New files are staged next to the old
+        ones and swapped in behind the COMPACTING marker, so a crash mid-way is finished (or
+        discarded) on the next load.
+        """
+        with self._merge_lock:  # merges wait too: every row added meanwhile stays in the segments
+            # 1. Snapshot — what was live at this version, read through its own chunk store handle
+            with self._snapshot.write(), self._lock:
+                if self.index is None or not len(self.tombstones):
+                    return
+                index = self.index
+                n_rows = len(self.chunks)
+                live_rows = np.setdiff1d(np.arange(n_rows), self._dead_rows)
+                dropped_ids = self.chunks.ids_for_rows(self._dead_rows)
+                has_vectors = self.chunks.has_vectors
+                if not has_vectors:
+                    ivf = faiss.try_extract_index_ivf(index)
+                    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+                        ivf.make_direct_map()  # reconstruct by id below
+                compacted = with_ids(empty_clone(faiss.downcast_index(index.index)))
+                snapshot = ChunkStore(self.chunks_dir)
 
-                # Normalize for cosine similarity
-                faiss.normalize_L2(embeddings) #euclidean distance
+            # 2. Rewrite outside the locks: same index type and training, live vectors only
+            t0 = time.perf_counter()
+            staged = self._staged_paths()
+            live_ids = snapshot.ids_for_rows(live_rows)
+            for start in range(0, len(live_ids), 65_536):
+                batch_ids = live_ids[start:start + 65_536]
+                # Re-encode from the exact vectors if we have them (compressed codes would lose more each time)
+                if has_vectors:
+                    vectors = snapshot.vectors(live_rows[start:start + 65_536])
+                else:
+                    with self._snapshot.read():
+                        vectors = index.reconstruct_batch(batch_ids)
+                compacted.add_with_ids(vectors, batch_ids)
+            staged["index"].write_bytes(faiss.serialize_index(compacted).tobytes())
+            records = ({**snapshot.get(int(r)), "added_at": snapshot.added_at(int(r)), "id": int(i),
+                        **({"vector": snapshot.vectors([r])[0]} if has_vectors else {})}
+                       for r, i in zip(live_rows, live_ids))
+            ChunkStore.write(staged["chunks"], records, next_id=snapshot.next_id)
+            snapshot.close()
+            staged_chunks = ChunkStore(staged["chunks"])
+            shutil.rmtree(staged["bm25"], ignore_errors=True)
+            sparse = BM25Index(staged["bm25"])
+            sparse.rebuild(staged_chunks.text(r) for r in range(len(staged_chunks)))
+            rewrite_s = time.perf_counter() - t0
 
-                all_embeddings.append(embeddings)
-                for chunk in chunks:
-                    all_metadatas.append({
-                        "text": chunk.page_content,
-                        "source": chunk.metadata.get("source", str(pkl_file.stem))
-                    })
+            # 3. Swap: catch the staged copy up with rows appended meanwhile, then commit
+            with self._snapshot.write(), self._lock:
+                if self.index is not index:  # rebuilt from the archive meanwhile — nothing to swap
+                    staged_chunks.close()
+                    self._discard_compaction()
+                    return
+                tail_rows = np.arange(n_rows, len(self.chunks))
+                tail_ids = self.chunks.ids_for_rows(tail_rows)
+                base_rows = len(staged_chunks)
+                tail_log = SegmentLog(staged["segments"])
+                tail_log.clear()
+                if len(tail_rows):
+                    if self.chunks.has_vectors:
+                        tail_vectors = self.chunks.vectors(tail_rows)
+                    else:
+                        tail_vectors = np.concatenate(list(self.segments.replay(n_rows)))
+                    records = [{**self.chunks.get(int(r)), "added_at": self.chunks.added_at(int(r)), "id": int(i),
+                                **({"vector": tail_vectors[k]} if self.chunks.has_vectors else {})}
+                               for k, (r, i) in enumerate(zip(tail_rows, tail_ids))]
+                    staged_chunks.append(records)
+                    tail_log.append(base_rows, tail_vectors)
+                    compacted.add_with_ids(np.ascontiguousarray(tail_vectors, dtype="float32"), tail_ids)
+                    sparse.add(base_rows, [r["text"] for r in records])
+                staged_chunks._set_next_id(self.chunks.next_id)
+                staged_chunks.close()
+                # Chunks tombstoned during the rewrite are still in the staged copy — keep them dead
+                np.setdiff1d(self.tombstones, dropped_ids).tofile(staged["tombstones"])
 
-        if not all_embeddings:
+                # Commit point: from here on a restart finishes the swap
+                self.compact_marker.touch()
+                self._recover_compaction()
+
+                self.index = compacted
+                self.chunks = ChunkStore(self.chunks_dir)
+                self._load_tombstones()
+                sparse.index_dir = self.persist_dir / "bm25"
+                self.sparse = sparse
+                with self._subindex_lock:
+                    self._subindex_cache.clear()
+            print(f"[VectorStore] Compacted {n_rows} → {len(live_ids)} chunks (+{len(tail_rows)} added meanwhile) "
+                  f"in {rewrite_s:.2f}s, swap {time.perf_counter() - t0 - rewrite_s:.3f}s")
+
+    def _staged_paths(self) -> Dict[str, Path]:
+        """Where compaction stages each file before the swap"""
+        return {
+            "index": self.index_path.with_name("faiss.index.compact"),
+            "chunks": self.chunks_dir.with_name("chunks.compact"),
+            "bm25": self.persist_dir / "bm25.compact",
+            "segments": self.persist_dir / "segments.compact",
+            "tombstones": self.tombstones_path.with_name("tombstones.compact"),
+        }
+
+    def _discard_compaction(self):
+        for path in self._staged_paths().values():
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+
+    def _recover_compaction(self):
+        """Finish a compaction that reached its commit point; throw away one that didn't.
+        Each step moves one staged file into place, so a crash during recovery just resumes."""
+        if not self.compact_marker.exists():
+            self._discard_compaction()
+            return
+        staged = self._staged_paths()
+        for name, live in (("chunks", self.chunks_dir), ("bm25", self.persist_dir / "bm25"),
+                           ("segments", self.segments.segment_dir)):
+            if staged[name].exists():
+                shutil.rmtree(live, ignore_errors=True)
+                os.replace(staged[name], live)
+        if staged["index"].exists():
+            os.replace(staged["index"], self.index_path)
+        if staged["tombstones"].exists():
+            os.replace(staged["tombstones"], self.tombstones_path)
+        self.compact_marker.unlink()
+
+    def _maybe_compact(self):
+        n_rows = len(self.chunks)
+        if n_rows and len(self.tombstones) >= self.COMPACT_DEAD_RATIO * n_rows:
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def _write_base(self, index_bytes: np.ndarray):
+        """Atomically replace faiss.index (tmp file + rename)"""
+        with open(f"{self.index_path}.tmp", "wb") as f:
+            f.write(index_bytes.tobytes())
+        os.replace(f"{self.index_path}.tmp", self.index_path)
+
+    def merge_segments(self):
+        """Fold all segments into the base index. Snapshot under the lock, write outside it."""
+        if not self._merge_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                if self.index is None:
+                    return
+                index_bytes = faiss.serialize_index(self.index)
+                rows = self.index.ntotal
+            t0 = time.perf_counter()
+            self._write_base(index_bytes)
+            self.segments.truncate(rows)
+            print(f"[VectorStore] Merged segments into base ({rows} vectors) in {time.perf_counter() - t0:.2f}s")
+        finally:
+            self._merge_lock.release()
+
+    def _maybe_merge(self):
+        """Size policy → merge now in the background; otherwise make sure a timer merges eventually"""
+        stats = self.segments.stats()
+        if stats["segments"] >= self.MERGE_MAX_SEGMENTS or stats["bytes"] >= self.MERGE_MAX_BYTES \
+                or stats["oldest_age_s"] >= self.MERGE_MAX_AGE_S:
+            threading.Thread(target=self.merge_segments, daemon=True).start()
+        elif self._merge_timer is None or not self._merge_timer.is_alive():
+            self._merge_timer = threading.Timer(self.MERGE_MAX_AGE_S, self.merge_segments)
+            self._merge_timer.daemon = True
+            self._merge_timer.start()
+
+    def build_from_embeddings(self, embed_dir: str = "data/embeddings", shard: Optional[Tuple[int, int]] = None):
+        """
+        Stream the embedding archive into a fresh index, one shard file at a time — the corpus is
+        never held in memory (only a training sample for IVF/PQ).
+        shard=(index, n_shards): keep only the sources that hash to this shard (see ShardedVectorStore)
+        """
+        from src.embedding_archive import EmbeddingArchive
+        archive = EmbeddingArchive(Path(embed_dir) / "archive", legacy_dir=embed_dir)
+        files = list(archive.meta["files"])
+        if shard is not None:
+            from src.sharded_store import shard_for
+            files = [f for f in files if shard_for(archive.meta["files"][f]["source"], shard[1]) == shard[0]]
+        n_total = sum(archive.meta["files"][f]["count"] for f in files)
+
+        print(f"[VectorStore] Building from {archive.root} ({n_total} chunks)")
+        if not n_total:
+            if shard is not None:
+                print(f"[VectorStore] No sources for shard {shard[0]}/{shard[1]} — left empty")
+                return
             raise ValueError("No embeddings found!")
 
-        embeddings_matrix = np.vstack(all_embeddings)
-        dim = embeddings_matrix.shape[1]
-        self.index = faiss.IndexFlatIP(dim)  # Inner Product = cosine
-        self.index.add(embeddings_matrix)
-        self.metadata = all_metadatas
+        # Flat = exact inner product (cosine); IVF/PQ are trained on a sample of the archive
+        index, index_type, index_params = build_index(
+            self.build_type, archive.sample(100_000, files=files), self.build_params, n_vectors=n_total
+        )
+
+        # Pass 1: chunk table → a staged chunk store (ids continue from the old store's,
+        # so no id ever names two different chunks)
+        keep_vectors = bool(index_params.get("rescore"))  # float32 copies on disk for rescoring
+
+        def records():
+            for file_path, source, texts, metadatas, vectors in archive.iter_files(files):
+                added_at = archive.added_at(file_path)  # when the file was embedded
+                vectors = np.asarray(vectors, dtype=np.float32) if keep_vectors else None
+                for row, (text, metadata) in enumerate(zip(texts, metadatas)):
+                    record = {"text": text, "source": source, "added_at": added_at,
+                              "metadata": {k: v for k, v in metadata.items() if k != "source"}}
+                    if keep_vectors:
+                        record["vector"] = vectors[row]
+                    yield record
+
+        staged_dir = self.chunks_dir.with_name(self.chunks_dir.name + ".build")
+        ChunkStore.write(staged_dir, records(), next_id=self.chunks.next_id)
+        staged = ChunkStore(staged_dir)
+        all_ids = staged.ids_for_rows(np.arange(len(staged)))
+        # Keyword index over the staged rows, also built off to the side
+        staged_bm25_dir = self.persist_dir / "bm25.build"
+        shutil.rmtree(staged_bm25_dir, ignore_errors=True)
+        sparse = BM25Index(staged_bm25_dir)
+        sparse.rebuild(staged.text(r) for r in range(len(staged)))
+        staged.close()
+
+        # Pass 2: vectors, file by file (archive vectors are already normalised)
+        index = with_ids(index)
+        row = 0
+        for _, _, _, _, vectors in archive.iter_files(files, with_chunks=False):
+            index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), all_ids[row:row + len(vectors)])
+            row += len(vectors)
+
+        # Swap in — a full rebuild replaces the base and makes every segment obsolete
+        index_bytes = faiss.serialize_index(index)
+        with self._snapshot.write(), self._lock:
+            shutil.rmtree(self.chunks_dir, ignore_errors=True)
+            os.replace(staged_dir, self.chunks_dir)
+            self.chunks = ChunkStore(self.chunks_dir)
+            self.index, self.index_type, self.index_params = index, index_type, index_params
+            shutil.rmtree(self.persist_dir / "bm25", ignore_errors=True)
+            os.replace(staged_bm25_dir, self.persist_dir / "bm25")
+            sparse.index_dir = self.persist_dir / "bm25"
+            self.sparse = sparse
+            self._write_base(index_bytes)
+            self.segments.clear()
+            self.tombstones_path.unlink(missing_ok=True)
+            self._load_tombstones()
+            self._bump_version()
 
-        # Save
-        faiss.write_index(self.index, str(self.index_path))
-        with open(self.metadata_path, "wb") as f:
-            pickle.dump(self.metadata, f)
+        print(f"[VectorStore] Built and saved {self.index_type} index with {len(self.chunks)} chunks")
 
-        print(f"[VectorStore] Built and saved index with {len(self.metadata)} chunks")
+    @staticmethod
+    def _chunk_metadata(chunk) -> Dict:
+        """Loader metadata worth filtering on (page, author, ...) — source has its own column"""
+        return {k: v for k, v in chunk.metadata.items() if k != "source"}
 
-    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Dict]:
+    def _filter_rows(self, filters: Dict) -> np.ndarray:
+        """
+        Live chunk-store rows matching a filter dict — keys as in ChunkStore.rows_where:
+        {"sources": [...], "file_types": [".pdf"], "added_after": ts, "added_before": ts, "metadata": {"page": 3}}
+        "source" / "file_type" (single values) are accepted too.
+        """
+        filters = dict(filters)
+        for single, plural in (("source", "sources"), ("file_type", "file_types")):
+            if single in filters:
+                filters[plural] = [filters.pop(single)]
+        rows = self.chunks.rows_where(**filters)
+        if len(self._dead_rows):
+            rows = np.setdiff1d(rows, self._dead_rows, assume_unique=True)
+        return rows
+
+    def filter_ids(self, filters: Dict) -> np.ndarray:
+        """Chunk ids matching a filter dict (see _filter_rows)"""
+        return self.chunks.ids_for_rows(self._filter_rows(filters))
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 5,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               filters: Optional[Dict] = None) -> List[Dict]:
+        """nprobe (IVF) / ef_search (HNSW) trade recall for latency per call; filters restrict the rows searched"""
+        return self.search_batch(query_embedding[:1], top_k, nprobe=nprobe, ef_search=ef_search, filters=filters)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5,
+                     nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                     filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """One FAISS call for many queries (one row each) → one result list per query"""
         if self.index is None:
             raise ValueError("Index not built or loaded!")
-        scores, indices = self.index.search(query_embedding, top_k)
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx != -1:
-                meta = self.metadata[idx]
-                results.append({"text": meta["text"], "source": meta["source"], "score": float(score)})
-        return results
+        with span("faiss.search", index=self.index_type, queries=len(query_embeddings), top_k=top_k,
+                  filtered=bool(filters)) as s, self._snapshot.read():
+            sel, allowed = self._live_sel, None
+            if filters:
+                ids = self.filter_ids(filters)
+                s.set(allowed=len(ids))
+                if len(ids) <= self.SUBINDEX_MAX_ROWS:
+                    # Selective filter: exact search over just those vectors — also immune to IVF/HNSW
+                    # missing the few allowed rows when they sit outside the probed lists
+                    s.set(subindex=True)
+                    scores, indices = self._search_subindex(query_embeddings, top_k, ids)
+                    return self._hits(scores, indices)
+                sel, allowed = faiss.IDSelectorBatch(ids), ids  # tombstones are already out of ids
+            factor = self.rescore_factor if self.chunks.has_vectors else 0
+            fetch = top_k * factor if factor else top_k
+            if sel is not None and not supports_selector(self.index_type):
+                scores, indices = self._search_masked(query_embeddings, fetch, allowed)
+                s.set(masked=True)
+            else:
+                params = search_params(self.index_type, self.index_params, nprobe=nprobe, ef_search=ef_search, sel=sel)
+                if params is not None:
+                    scores, indices = self.index.search(query_embeddings, fetch, params=params)
+                else:
+                    scores, indices = self.index.search(query_embeddings, fetch)
+            if factor:
+                # Compressed scores only pick the candidates; exact float32 scores rank them
+                s.set(rescored=fetch)
+                scores, indices = rescore(query_embeddings, indices, self._vectors_for_ids, top_k)
+            else:
+                scores = to_similarity(self.index_type, self.index, scores)
+            return self._hits(scores, indices)
+
+    def _search_masked(self, query_embeddings: np.ndarray, fetch: int, allowed: Optional[np.ndarray]):
+        """Selector-less indexes (binary): over-fetch, then drop tombstoned or filtered-out ids"""
+        if allowed is not None:
+            # Enough candidates that ~2 × fetch of them should pass the filter
+            start = -(-2 * fetch * self.index.ntotal // max(len(allowed), 1))
+            keep = lambda ids: np.isin(ids, allowed)
+        else:
+            start = fetch + len(self.tombstones)  # at most that many removed ids can come first
+            keep = lambda ids: ~np.isin(ids, self.tombstones)
+        return masked_search(self.index, query_embeddings, fetch, keep, start)
+
+    def _hits(self, scores: np.ndarray, ids: np.ndarray) -> List[List[Dict]]:
+        # Only the returned hits are read from the mmap'd chunk store (id → row is a binary search)
+        chunks = self.chunks
+        rows = chunks.rows_for_ids(ids.ravel()).reshape(ids.shape)
+        batch = []
+        for row_scores, row_ids, row_rows in zip(scores, ids, rows):
+            results = []
+            for score, chunk_id, row in zip(row_scores, row_ids, row_rows):
+                if chunk_id != -1 and row != -1:
+                    meta = chunks.get(row)
+                    results.append({"id": int(chunk_id), "text": meta["text"], "source": meta["source"],
+                                    "metadata": meta["metadata"], "score": float(score)})
+            batch.append(results)
+        return batch
+
+    def _subindex(self, ids: np.ndarray) -> np.ndarray:
+        """Vectors of the given chunk ids, cached per filter result — the exact ones from the chunk
+        store when it keeps them, else reconstructed from the index"""
+        # Digest of the exact id bytes (+ count) — hash() collisions would hand back another filter's vectors
+        key = (len(ids), hashlib.blake2b(ids.tobytes(), digest_size=16).digest())
+        with self._subindex_lock:
+            vectors = self._subindex_cache.get(key)
+            if vectors is not None:
+                self._subindex_cache.move_to_end(key)
+                return vectors
+        with self._lock:
+            if self.chunks.has_vectors:
+                vectors = self._vectors_for_ids(ids)
+            elif len(ids):
+                ivf = faiss.try_extract_index_ivf(self.index)
+                if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+                    ivf.make_direct_map()  # IVF can only reconstruct by id with a direct map (PQ: approximate)
+                vectors = self.index.reconstruct_batch(ids)
+            else:
+                vectors = np.empty((0, self.index.d), dtype="float32")
+        with self._subindex_lock:
+            self._subindex_cache[key] = vectors
+            while len(self._subindex_cache) > self.SUBINDEX_CACHE_SIZE:
+                self._subindex_cache.popitem(last=False)
+        return vectors
+
+    def _search_subindex(self, query_embeddings: np.ndarray, top_k: int, ids: np.ndarray):
+        n_queries = len(query_embeddings)
+        scores = np.full((n_queries, top_k), -np.inf, dtype="float32")
+        indices = np.full((n_queries, top_k), -1, dtype=np.int64)
+        if not len(ids):
+            return scores, indices
+        sims = query_embeddings @ self._subindex(ids).T
+        k = min(top_k, len(ids))
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k] if k < len(ids) else np.tile(np.arange(k), (n_queries, 1))
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1), axis=1)
+        scores[:, :k] = np.take_along_axis(sims, top, axis=1)
+        indices[:, :k] = ids[top]
+        return scores, indices
 
+    def search_sparse(self, query: str, top_k: int = 5, filters: Optional[Dict] = None) -> List[Dict]:
+        """BM25 keyword search — exact terms (acronyms, names, error codes) that embeddings blur"""
+        # Same snapshot as dense search: BM25 rows, tombstones and the chunk store only change under .write()
+        with span("bm25.search", top_k=top_k, filtered=bool(filters)), self._snapshot.read():
+            include = self._filter_rows(filters) if filters else None
+            rows, scores = self.sparse.search(query, top_k, exclude=self._dead_rows, include=include)
+            ids = self.chunks.ids_for_rows(rows)
+            metas = self.chunks.get_many(rows)
+        return [{"id": int(chunk_id), "text": meta["text"], "source": meta["source"],
+                 "metadata": meta["metadata"], "score": float(score)}
+                for chunk_id, meta, score in zip(ids, metas, scores)]
 
-    def add_embeddings(self, texts: List[str], embeddings: np.ndarray, chunks: List):
-        """Add new embeddings to existing index"""
+
+    def add_embeddings(self, texts: List[str], embeddings: np.ndarray, chunks: List) -> np.ndarray:
+        """Add new embeddings to existing index → the new chunk ids"""
+        with self._snapshot.write(), self._lock:
+            ids = self._append(texts, embeddings, chunks)
+            self._bump_version()
+        self._maybe_merge()
+        print(f"[VectorStore] Added {len(ids)} new chunks. Total: {self.index.ntotal}")
+        return ids
+
+    def _append(self, texts: List[str], embeddings: np.ndarray, chunks: List) -> np.ndarray:
         # Normalize embeddings for cosine similarity
         faiss.normalize_L2(embeddings)
         
         # Create new metadata
         new_metadata = []
+        added_at = time.time()
         for chunk in chunks:
             new_metadata.append({
                 "text": chunk.page_content,
-                "source": chunk.metadata.get("source", "uploaded_file")
+                "source": chunk.metadata.get("source", "uploaded_file"),
+                "metadata": self._chunk_metadata(chunk),
+                "added_at": added_at,
             })
         
         # Add to index
         if self.index is None:
-            # Create new index if none exists
-            dim = embeddings.shape[1]
-            self.index = faiss.IndexFlatIP(dim)
-            self.metadata = []
-        
-        self.index.add(embeddings)
-        self.metadata.extend(new_metadata)
-        
-        # Save updated index
-        faiss.write_index(self.index, str(self.index_path))
-        with open(self.metadata_path, "wb") as f:
-            pickle.dump(self.metadata, f)
-        
-        print(f"[VectorStore] Added {len(new_metadata)} new chunks. Total: {self.index.ntotal}")
+            # Create new index if none exists — trainable types need data first
+            index, self.index_type, self.index_params = build_index(
+                self.build_type, embeddings, self.build_params
+            )
+            self.index = with_ids(index)
+            self.chunks.truncate(0)
+            self.sparse.rebuild([])
+            self.tombstones_path.unlink(missing_ok=True)
+            self._load_tombstones()
+            self._write_base(faiss.serialize_index(self.index))
+            self._save_config()
+
+        if self.rescore_factor:
+            for record, vector in zip(new_metadata, embeddings):
+                record["vector"] = vector
+
+        # Persist only the new rows: chunk store append + vector segment (the commit point);
+        # the base index is merged in the background
+        start_row = self.index.ntotal
+        ids = self.chunks.append(new_metadata)
+        self.segments.append(start_row, embeddings)
+        self.index.add_with_ids(embeddings, ids)
+        # BM25 last — if we die before this, _sync_sparse backfills it from the chunk store
+        self.sparse.add(start_row, [m["text"] for m in new_metadata])
+        return ids
@@ -0,0 +1,58 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.synthetic import HashEmbedder  # noqa: E402
+from src.vectorstore import FAISSVectorStore  # noqa: E402
+
+
+class Chunk:
+    """Stand-in for a langchain Document — all the store reads is page_content + metadata"""
+
+    def __init__(self, text: str, source: str, **metadata):
+        self.page_content = text
+        self.metadata = {"source": source, **metadata}
+
+
+@pytest.fixture
+def embedder():
+    return HashEmbedder(dim=64)
+
+
+@pytest.fixture
+def add_doc(embedder):
+    """add_doc(store, source, texts, replace=True, **metadata) → new chunk ids"""
+    def add(store, source, texts, replace=True, **metadata):
+        chunks = [Chunk(t, source, **metadata) for t in texts]
+        vectors = embedder.encode(texts).astype("float32")
+        if replace:
+            return store.replace_sources([source], texts, vectors, chunks)
+        return store.add_embeddings(texts, vectors, chunks)
+    return add
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # No background merges / compactions — tests call them explicitly
+    monkeypatch.setattr(FAISSVectorStore, "_maybe_merge", lambda self: None)
+    monkeypatch.setattr(FAISSVectorStore, "_maybe_compact", lambda self: None)
+    return FAISSVectorStore(str(tmp_path / "store"))
+
+
+def reopen(store: FAISSVectorStore) -> FAISSVectorStore:
+    """Drop the instance (releasing its directory lock) and load the store again from disk"""
+    store._dir_lock.close()
+    return FAISSVectorStore(str(store.persist_dir))
+
+
+def texts_for(source: str, n: int, tag: str = "") -> list:
+    return [f"{source} {tag} paragraph {i} token{i % 7} shared words".strip() for i in range(n)]
+
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
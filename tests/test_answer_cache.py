@@ -0,0 +1,57 @@
+import numpy as np
+
+from src.answer_cache import SemanticAnswerCache
+from tests.conftest import unit
+
+
+def _vector(seed, dim=16):
+    return unit(np.random.default_rng(seed).normal(size=(1, dim)))[0].astype("float32")
+
+
+def _near(vector, scale, seed=99):
+    return unit((vector + scale * np.random.default_rng(seed).normal(size=vector.shape))[None])[0].astype("float32")
+
+
+def test_near_duplicate_questions_hit_for_the_same_corpus_version():
+    cache = SemanticAnswerCache(threshold=0.95)
+    q = _vector(0)
+    cache.store("what is attention?", q, "an answer", kb_version=3, llm_calls=2, latency_s=1.5, sources=["a.pdf"])
+
+    hit = cache.lookup(_near(q, 0.05), kb_version=3)
+    assert hit["answer"] == "an answer" and hit["sources"] == ["a.pdf"] and hit["similarity"] >= 0.95
+    assert cache.lookup(_near(q, 1.0), kb_version=3) is None      # different question
+    assert cache.lookup(q, kb_version=4) is None                   # answered against an older corpus
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["llm_calls_avoided"]) == (1, 2, 2)
+
+
+def test_entries_expire_and_invalidate_clears_everything(monkeypatch):
+    cache = SemanticAnswerCache(ttl_s=10)
+    clock = [1000.0]
+    monkeypatch.setattr("src.answer_cache.time.time", lambda: clock[0])
+    cache.store("q", _vector(0), "a", kb_version=0, llm_calls=1, latency_s=0.1)
+    cache.store("r", _vector(1), "b", kb_version=0, llm_calls=1, latency_s=0.1)
+
+    clock[0] += 11
+    assert cache.lookup(_vector(0), 0) is None
+    cache.store("q", _vector(0), "a", kb_version=0, llm_calls=1, latency_s=0.1)
+    assert cache.lookup(_vector(0), 0)["answer"] == "a"
+    cache.invalidate(1)
+    assert cache.lookup(_vector(0), 0) is None and cache.stats()["entries"] == 0
+
+
+def test_full_cache_evicts_the_least_recently_used(monkeypatch):
+    cache = SemanticAnswerCache(capacity=2)
+    clock = [0.0]
+    monkeypatch.setattr("src.answer_cache.time.time", lambda: clock[0])
+    for i in range(2):
+        clock[0] += 1
+        cache.store(f"q{i}", _vector(i), f"a{i}", kb_version=0, llm_calls=1, latency_s=0.1)
+    clock[0] += 1
+    cache.lookup(_vector(0), 0)  # q0 used more recently than q1
+    clock[0] += 1
+    cache.store("q2", _vector(2), "a2", kb_version=0, llm_calls=1, latency_s=0.1)
+
+    assert cache.lookup(_vector(1), 0) is None
+    assert cache.lookup(_vector(0), 0)["answer"] == "a0"
+    assert cache.lookup(_vector(2), 0)["answer"] == "a2"
@@ -0,0 +1,67 @@
+import numpy as np
+
+from src.chunkstore import ChunkStore
+
+
+def _records(n, source="a.pdf", start=0):
+    return [{"text": f"chunk {start + i} ü", "source": source, "metadata": {"page": (start + i) % 3}}
+            for i in range(n)]
+
+
+def test_append_and_reopen(tmp_path):
+    store = ChunkStore(tmp_path / "chunks")
+    ids = store.append(_records(4))
+    store.append(_records(2, source="b.txt", start=4))
+
+    reopened = ChunkStore(tmp_path / "chunks")
+    assert len(reopened) == 6
+    assert reopened.text(1) == "chunk 1 ü"
+    assert reopened.get(5) == {"text": "chunk 5 ü", "source": "b.txt", "metadata": {"page": 2}}
+    np.testing.assert_array_equal(reopened.ids_for_rows(np.arange(4)), ids)
+    np.testing.assert_array_equal(reopened.rows_for_source("b.txt"), [4, 5])
+
+
+def test_columns_without_offsets_are_not_committed(tmp_path):
+    store = ChunkStore(tmp_path / "chunks")
+    store.append(_records(3))
+    # Crash mid-append: every column got its bytes, offsets.bin (written last) did not
+    with open(store.text_path, "ab") as f:
+        f.write(b"torn text")
+    for path, dtype in ((store.source_ids_path, np.int32), (store.added_at_path, np.float64),
+                        (store.meta_ids_path, np.int32), (store.ids_path, np.int64)):
+        with open(path, "ab") as f:
+            f.write(np.zeros(2, dtype=dtype).tobytes())
+
+    reopened = ChunkStore(tmp_path / "chunks")
+    assert len(reopened) == 3
+
+    # The next append cuts the torn tail off first — no stray bytes end up in the new rows
+    reopened.append(_records(1, start=3))
+    again = ChunkStore(tmp_path / "chunks")
+    assert len(again) == 4
+    assert again.text(3) == "chunk 3 ü"
+    assert again.text(2) == "chunk 2 ü"
+    assert again.ids_for_rows([3])[0] == 3
+
+
+def test_truncate_keeps_ids_unique(tmp_path):
+    store = ChunkStore(tmp_path / "chunks")
+    store.append(_records(5))
+    store.truncate(3)
+    assert len(store) == 3
+    new_ids = store.append(_records(1, start=3))
+    assert new_ids[0] == 3
+    np.testing.assert_array_equal(store.rows_for_ids([0, 3, 4, 99]), [0, 3, -1, -1])
+
+
+def test_rows_where_combines_conditions(tmp_path):
+    store = ChunkStore(tmp_path / "chunks")
+    store.append(_records(6))
+    store.append(_records(3, source="notes.txt", start=6))
+
+    np.testing.assert_array_equal(store.rows_where(sources=["a.pdf"], metadata={"page": 0}), [0, 3])
+    np.testing.assert_array_equal(store.rows_where(file_types=["txt"]), [6, 7, 8])
+    np.testing.assert_array_equal(store.rows_where(metadata={"page": [1, 2]}, file_types=[".txt"]), [7, 8])
+    # Posting lists extend to rows appended after the first query
+    store.append(_records(1, source="notes.txt", start=9))
+    np.testing.assert_array_equal(store.rows_where(file_types=["txt"]), [6, 7, 8, 9])
@@ -0,0 +1,49 @@
+from src.context import build_context, count_tokens
+
+
+def _chunk(chunk_id, text, source="paper.pdf", score=1.0):
+    return {"id": chunk_id, "text": text, "source": source, "score": score}
+
+
+def test_adjacent_chunks_are_merged_without_their_overlap():
+    chunks = [
+        _chunk(11, "the loss falls steadily. After warmup the learning rate", score=0.9),
+        _chunk(10, "Training uses AdamW and the loss falls steadily.", score=0.8),
+        _chunk(40, "Unrelated passage from another file.", source="other.pdf", score=0.7),
+    ]
+    context, stats = build_context(chunks)
+
+    first, second = context.split("\n\n")
+    assert first == "Training uses AdamW and the loss falls steadily. After warmup the learning rate"
+    assert second == "Unrelated passage from another file."
+    assert stats["merged"] == 1 and stats["passages"] == 2
+
+
+def test_chunks_without_overlap_keep_a_separator():
+    context, _ = build_context([_chunk(1, "first part ends"), _chunk(2, "second begins here")])
+    assert context == "first part ends\nsecond begins here"
+
+
+def test_near_duplicates_keep_the_better_ranked_copy():
+    text = "Attention weights are computed with a scaled dot product over all keys in the sequence"
+    chunks = [_chunk(1, text, source="v2.pdf", score=0.9), _chunk(7, text + ".", source="v1.pdf", score=0.8)]
+    context, stats = build_context(chunks)
+    assert context == text
+    assert stats["duplicates"] == 1
+
+
+def test_budget_packs_best_first_and_cuts_the_overflow():
+    chunks = [_chunk(i * 10, " ".join(f"p{i}word{j}" for j in range(400)), source=f"s{i}.pdf", score=1 - i / 10)
+              for i in range(3)]
+    budget = count_tokens(chunks[0]["text"]) + 100
+    context, stats = build_context(chunks, max_tokens=budget)
+
+    assert context.startswith(chunks[0]["text"] + "\n\np1word0 ")
+    assert "p2word0" not in context
+    assert count_tokens(context) <= budget
+    assert stats["passages"] == 2 and stats["dropped"] == 1
+    assert stats["saved_tokens"] == stats["raw_tokens"] - stats["context_tokens"] > 0
+
+
+def test_empty_input():
+    assert build_context([])[0] == ""
@@ -0,0 +1,81 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from src.embedding_archive import EmbeddingArchive
+from src.manifest import EmbeddingManifest
+from tests.conftest import Chunk, unit
+
+
+def _vectors(n, seed=0, dim=16):
+    return unit(np.random.default_rng(seed).normal(size=(n, dim))).astype("float32")
+
+
+def _write_pickle(path: Path, source: str, texts, seed=0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        pickle.dump({"chunks": [Chunk(t, source, page=i) for i, t in enumerate(texts)],
+                     "embeddings": _vectors(len(texts), seed)}, f)
+
+
+def test_legacy_pickles_are_keyed_by_the_file_on_disk(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_file = Path("data/pdfs/paper.pdf")
+    data_file.parent.mkdir(parents=True)
+    data_file.write_bytes(b"%PDF fake")
+    embed_dir = Path("data/embeddings")
+    # Pickled on another machine: the source is a Windows path
+    _write_pickle(embed_dir / "pdfs/paper.pkl", "D:\\work\\data\\pdfs\\paper.pdf", ["intro", "method"])
+    _write_pickle(embed_dir / "pdfs/gone.pkl", "D:\\work\\data\\pdfs\\gone.pdf", ["old"], seed=1)
+
+    archive = EmbeddingArchive(embed_dir / "archive", legacy_dir=embed_dir)
+    source, texts, metadatas, vectors = archive.load_file(str(data_file))
+    assert source == str(data_file.resolve())
+    assert texts == ["intro", "method"] and metadatas[1] == {"page": 1, "source": source}
+    np.testing.assert_allclose(vectors, _vectors(2), atol=1e-6)
+    # A pickle without its data file stays searchable under its old source
+    assert archive.live_rows() == 3
+
+    # The next sync sees the imported file as already embedded
+    manifest = EmbeddingManifest(embed_dir / "manifest.json")
+    assert manifest.scan([str(data_file)])["unchanged"] == [str(data_file)]
+    assert manifest.files[str(data_file)]["chunk_hashes"] == [manifest.chunk_hash(t) for t in texts]
+
+
+def test_round_trip_remove_and_compact(tmp_path):
+    archive = EmbeddingArchive(tmp_path / "archive", dtype="int8")
+    archive.add_file("a.txt", "/abs/a.txt", ["a0", "a1"], [{"page": 0}, {"page": 1}], _vectors(2))
+    archive.add_file("b.txt", "/abs/b.txt", ["b0"], [{}], _vectors(1, seed=1))
+    assert archive.has_file("a.txt") and archive.live_rows() == 0  # buffered until flush
+    archive.flush()
+
+    reopened = EmbeddingArchive(tmp_path / "archive")
+    assert len(reopened.meta["shards"]) == 1  # one shard per flush, not one per file
+    source, texts, _, vectors = reopened.load_file("a.txt")
+    assert (source, texts) == ("/abs/a.txt", ["a0", "a1"])
+    np.testing.assert_allclose(vectors, _vectors(2), atol=0.02)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1, atol=1e-5)
+
+    reopened.remove_file("a.txt")
+    assert reopened.load_file("a.txt") is None
+    reopened.compact()
+    assert EmbeddingArchive(tmp_path / "archive").live_rows() == 1
+    assert [f for f, *_ in EmbeddingArchive(tmp_path / "archive").iter_files()] == ["b.txt"]
+
+    # Removing the last file drops its shard from disk too
+    reopened.remove_file("b.txt")
+    assert not list((tmp_path / "archive").glob("shard_*"))
+
+
+def test_legacy_pickles_are_imported_only_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    embed_dir = Path("data/embeddings")
+    _write_pickle(embed_dir / "notes.pkl", "/gone/notes.txt", ["n0"])
+
+    archive = EmbeddingArchive(embed_dir / "archive", legacy_dir=embed_dir)
+    (file_path,) = archive.meta["files"]
+    archive.remove_file(file_path)
+
+    # Every document deleted — the pickles still on disk must not come back
+    assert EmbeddingArchive(embed_dir / "archive", legacy_dir=embed_dir).live_rows() == 0
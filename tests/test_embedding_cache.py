@@ -0,0 +1,49 @@
+import numpy as np
+
+from src.embedding_cache import EmbeddingCache
+from src.synthetic import HashEmbedder
+
+
+class CountingModel(HashEmbedder):
+    def __init__(self):
+        super().__init__(dim=32)
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return super().encode(texts, **kwargs)
+
+
+def test_hits_skip_the_model_and_survive_a_restart(tmp_path):
+    model = CountingModel()
+    cache = EmbeddingCache("m", path=str(tmp_path / "cache.sqlite"))
+    first = cache.encode(model, ["alpha beta", "gamma", "alpha beta"])
+    assert model.encoded == ["alpha beta", "gamma"]  # duplicates encoded once
+
+    again = EmbeddingCache("m", path=str(tmp_path / "cache.sqlite")).encode(model, ["gamma", "alpha beta"])
+    np.testing.assert_array_equal(again, first[[1, 0]])
+    assert model.encoded == ["alpha beta", "gamma"]
+    # Another model name never sees these vectors
+    EmbeddingCache("other", path=str(tmp_path / "cache.sqlite")).encode(model, ["gamma"])
+    assert model.encoded[-1] == "gamma"
+
+
+def test_eviction_keeps_recent_hits(tmp_path):
+    model = CountingModel()
+    cache = EmbeddingCache("m", path=str(tmp_path / "cache.sqlite"), max_entries=10)
+    cache.encode(model, [f"old {i}" for i in range(8)])
+    cache.encode(model, ["old 0"])  # a hit — only noted in memory until the next put
+    assert cache._touched
+
+    cache.encode(model, [f"new {i}" for i in range(4)])  # 12 > 10 → down to 9
+    assert cache.stats()["entries"] == 9
+    model.encoded.clear()
+    cache.encode(model, ["old 0", "new 3"])
+    assert model.encoded == []  # the recently hit row and the new ones survived
+    cache.encode(model, ["old 1"])
+    assert model.encoded == ["old 1"]  # least recently used went first
+
+
+def test_empty_input(tmp_path):
+    cache = EmbeddingCache("m", path=str(tmp_path / "cache.sqlite"))
+    assert cache.encode(CountingModel(), []).shape == (0, 32)
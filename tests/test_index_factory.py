@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from src.index_factory import INDEX_TYPES, build_index, masked_search, with_ids
+from src.vectorstore import FAISSVectorStore
+from tests.conftest import Chunk, unit
+
+
+def _corpus(n=400, n_sources=8, dim=64):
+    vectors = unit(np.random.default_rng(0).normal(size=(n, dim))).astype("float32")
+    chunks = [Chunk(f"chunk {i}", f"doc{i % n_sources}.pdf") for i in range(n)]
+    return vectors, chunks
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_search_skips_tombstones_with_every_index_type(tmp_path, monkeypatch, index_type):
+    monkeypatch.setattr(FAISSVectorStore, "_maybe_merge", lambda self: None)
+    monkeypatch.setattr(FAISSVectorStore, "_maybe_compact", lambda self: None)
+    store = FAISSVectorStore(str(tmp_path / "store"), index_type=index_type)
+    vectors, chunks = _corpus()
+    store.add_embeddings([c.page_content for c in chunks], vectors.copy(), chunks)
+    assert store.index_type == index_type  # enough vectors to train IVF / PQ, no flat fallback
+
+    store.remove_sources(["doc0.pdf"])
+    new = [Chunk(f"new {i}", "doc1.pdf") for i in range(3)]
+    store.replace_sources(["doc1.pdf"], [c.page_content for c in new], vectors[:3].copy(), new)
+
+    # Queries sit exactly on removed vectors (rows 0, 8, … are doc0, rows 1, 9, … the old doc1)
+    queries = vectors[:16]
+    for hits in store.search_batch(queries, 5):
+        assert len(hits) == 5
+        assert not {h["source"] for h in hits} & {"doc0.pdf"}
+        assert not [h for h in hits if h["source"] == "doc1.pdf" and not h["text"].startswith("new")]
+
+    # Filter too broad for a subindex → the selector path (masked for binary)
+    monkeypatch.setattr(FAISSVectorStore, "SUBINDEX_MAX_ROWS", 0)
+    for hits in store.search_batch(queries, 5, filters={"sources": ["doc0.pdf", "doc2.pdf"]}):
+        assert [h["source"] for h in hits] == ["doc2.pdf"] * 5
+
+
+def test_masked_search_fetches_more_until_enough_hits_survive():
+    vectors, _ = _corpus(n=200)
+    index, _, _ = build_index("binary", vectors)
+    index = with_ids(index)
+    index.add_with_ids(vectors, np.arange(200, dtype=np.int64))
+
+    keep = lambda ids: ids % 10 == 0  # only 1 in 10 ids passes
+    scores, ids = masked_search(index, vectors[:4], 5, keep, fetch=5)
+    assert ids.shape == scores.shape == (4, 5)
+    assert (ids % 10 == 0).all()
+
+    # Fewer kept ids than top_k → the rest of the slots are empty
+    _, ids = masked_search(index, vectors[:1], 5, lambda ids: ids < 3, fetch=5)
+    assert sorted(ids[0][ids[0] >= 0].tolist()) == [0, 1, 2] and (ids[0] == -1).sum() == 2
@@ -0,0 +1,123 @@
+from pathlib import Path
+
+import pytest
+
+from src import indexing_queue
+from src.embedding_archive import EmbeddingArchive
+from src.indexing_queue import IndexingQueue
+from src.manifest import EmbeddingManifest
+from tests.conftest import Chunk, reopen, texts_for
+
+
+class Pipeline:
+    """The parts of EmbeddingPipeline the queue uses — hashed embeddings instead of a model"""
+
+    def __init__(self, embed_dir: Path, embedder):
+        self.archive = EmbeddingArchive(embed_dir / "archive")
+        self.manifest = EmbeddingManifest(embed_dir / "manifest.json")
+        self.encode = embedder.encode
+
+    def save_embeddings(self, file_path, chunks, embeddings):
+        source = chunks[0].metadata.get("source", file_path)
+        self.archive.add_file(file_path, source, [c.page_content for c in chunks],
+                              [dict(c.metadata) for c in chunks], embeddings)
+
+
+@pytest.fixture
+def env(tmp_path, store, embedder, monkeypatch):
+    pipeline = Pipeline(tmp_path / "embeddings", embedder)
+    monkeypatch.setattr(indexing_queue, "get_embedding_pipeline", lambda: pipeline)
+    monkeypatch.setattr(indexing_queue, "get_vector_store", lambda persist_dir: store)
+    # Chunks = the file's lines (no langchain loaders / splitter)
+    monkeypatch.setattr(IndexingQueue, "_parse", lambda self, pipeline, file_path, source: [
+        Chunk(line, source) for line in Path(file_path).read_text().splitlines()])
+    # No worker threads — tests run batches with _run_waiting
+    queue = IndexingQueue(workers=0, persist_dir=str(store.persist_dir), upload_dir=str(tmp_path / "uploads"))
+    return queue, pipeline, store
+
+
+def _run_waiting(queue):
+    queue._process(queue._take_batch())
+
+
+def _upload(tmp_path, name, lines, folder="tmp"):
+    path = tmp_path / folder / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("\n".join(lines))
+    return str(path)
+
+
+def _index_upload(queue, pipeline, store, name):
+    """An upload as a finished job leaves it: indexed, archived, in the manifest, copied to upload_dir"""
+    path = queue.upload_dir / name
+    path.write_text(name)
+    texts = texts_for(name, 3)
+    chunks = [Chunk(t, str(path.resolve())) for t in texts]
+    vectors = pipeline.encode(texts).astype("float32")
+    store.replace_sources([str(path.resolve())], texts, vectors.copy(), chunks)
+    pipeline.save_embeddings(str(path), chunks, vectors)
+    pipeline.archive.flush()
+    pipeline.manifest.record(str(path), pipeline.manifest.file_hash(str(path)),
+                             [pipeline.manifest.chunk_hash(t) for t in texts])
+    pipeline.manifest.save()
+    return path
+
+
+def test_removed_upload_stays_gone_after_a_rebuild(env, tmp_path):
+    queue, pipeline, store = env
+    keep = _index_upload(queue, pipeline, store, "keep.txt")
+    drop = _index_upload(queue, pipeline, store, "drop.txt")
+
+    assert queue.remove(str(drop.resolve())) == 3
+    assert not drop.exists()
+    assert str(drop) not in EmbeddingManifest(tmp_path / "embeddings/manifest.json").files
+    assert not EmbeddingArchive(tmp_path / "embeddings/archive").has_file(str(drop))
+
+    store.build_from_embeddings(str(tmp_path / "embeddings"))
+    assert store.sources() == [str(keep.resolve())]
+    assert reopen(store).sources() == [str(keep.resolve())]
+
+
+def test_jobs_are_indexed_archived_and_recorded_once_per_batch(env, tmp_path):
+    queue, pipeline, store = env
+    jobs = [queue.submit([_upload(tmp_path, f"doc{i}.txt", texts_for(f"doc{i}", 2))]) for i in range(3)]
+    _run_waiting(queue)
+
+    assert [job.status for job in jobs] == ["done"] * 3
+    uploads = [queue.upload_dir / f"doc{i}.txt" for i in range(3)]
+    assert store.sources() == sorted(str(p.resolve()) for p in uploads)
+    # One shard and one manifest write for the batch, not one per job
+    archive = EmbeddingArchive(tmp_path / "embeddings/archive")
+    assert len(archive.meta["shards"]) == 1 and archive.live_rows() == 6
+    manifest = EmbeddingManifest(tmp_path / "embeddings/manifest.json")
+    assert manifest.scan([str(p) for p in uploads])["unchanged"] == [str(p) for p in uploads]
+    assert not list(queue.staging_dir.iterdir())
+
+
+def test_same_name_uploads_keep_their_own_bytes(env, tmp_path):
+    queue, pipeline, store = env
+    first = queue.submit([_upload(tmp_path, "notes.txt", ["first version alpha", "first version beta"], "a")])
+    second = queue.submit([_upload(tmp_path, "notes.txt", ["second version gamma"], "b")])
+    assert first.files == second.files  # both are indexed as upload_dir/notes.txt
+
+    _run_waiting(queue)
+    assert first.results == {"notes.txt": "✓ notes.txt (2 chunks)"}
+    assert second.results == {"notes.txt": "✓ notes.txt (1 chunks)"}
+    # The later commit wins everywhere: on disk, in the index and in the archive
+    upload = queue.upload_dir / "notes.txt"
+    assert upload.read_text() == "second version gamma"
+    hits = store.search_sparse("version", 5)
+    assert [h["text"] for h in hits] == ["second version gamma"]
+    assert pipeline.archive.load_file(str(upload))[1] == ["second version gamma"]
+    assert pipeline.manifest.files[str(upload)]["sha256"] == pipeline.manifest.file_hash(str(upload))
+
+
+def test_failed_files_leave_nothing_behind(env, tmp_path):
+    queue, pipeline, store = env
+    job = queue.submit([_upload(tmp_path, "empty.txt", []), str(tmp_path / "missing.txt")])
+    _run_waiting(queue)
+
+    assert job.status == "failed" and set(job.results) == {"empty.txt", "missing.txt"}
+    assert not (queue.upload_dir / "empty.txt").exists()
+    assert not list(queue.staging_dir.iterdir())
+    assert store.index is None and pipeline.archive.live_rows() == 0
@@ -0,0 +1,50 @@
+import os
+
+from src.manifest import EmbeddingManifest
+
+
+def _write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def _record(manifest, path, chunks=("c",)):
+    manifest.record(path, manifest.file_hash(path), [manifest.chunk_hash(c) for c in chunks])
+
+
+def test_scan_classifies_changes(tmp_path):
+    manifest = EmbeddingManifest(tmp_path / "manifest.json")
+    same, edited, moved, gone = (_write(tmp_path / n, n) for n in ("same.txt", "edited.txt", "moved.txt", "gone.txt"))
+    for path in (same, edited, moved, gone):
+        _record(manifest, path)
+    manifest.save()
+
+    _write(tmp_path / "edited.txt", "new content")
+    renamed = tmp_path / "renamed.txt"
+    os.rename(moved, renamed)
+    os.remove(gone)
+    new = _write(tmp_path / "new.txt", "new")
+    changes = EmbeddingManifest(tmp_path / "manifest.json").scan([same, str(tmp_path / "edited.txt"), str(renamed), new])
+
+    assert changes["unchanged"] == [same]
+    assert changes["modified"] == [edited]
+    assert changes["renamed"] == [(moved, str(renamed))]
+    assert changes["deleted"] == [gone]
+    assert changes["new"] == [new]
+    assert same not in changes["hashes"]  # size + mtime matched — never hashed
+
+
+def test_touched_file_is_unchanged_and_failures_are_remembered(tmp_path):
+    manifest = EmbeddingManifest(tmp_path / "manifest.json")
+    path = _write(tmp_path / "a.txt", "text")
+    _record(manifest, path, ["one", "two"])
+    os.utime(path, (1, 1))
+
+    assert manifest.scan([path])["unchanged"] == [path]  # same hash, only the mtime moved
+    assert manifest.scan([path])["hashes"] == {}          # and the new mtime was noted
+
+    _write(tmp_path / "a.txt", "broken now")
+    manifest.record_failure(path, manifest.file_hash(path), "no chunks")
+    assert manifest.scan([path])["unchanged"] == [path]   # not retried until it changes again
+    assert manifest.files[path]["error"] == "no chunks"
+    assert manifest.files[path]["chunk_hashes"] == [manifest.chunk_hash(c) for c in ("one", "two")]
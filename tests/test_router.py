@@ -0,0 +1,71 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.router import LocalRouter
+from src.synthetic import HashEmbedder
+
+
+@pytest.fixture
+def router_args(tmp_path):
+    return {"decisions_path": str(tmp_path / "decisions.jsonl"), "model_path": str(tmp_path / "router.npz")}
+
+
+def _llm(route):
+    calls = []
+
+    def decide():
+        calls.append(route)
+        return route
+    return decide, calls
+
+
+def test_similarity_thresholds_decide_and_only_unsure_queries_reach_the_llm(router_args):
+    router = LocalRouter(mode="similarity", **router_args)
+    query = np.zeros(8, dtype=np.float32)
+    decide, calls = _llm("rag")
+
+    assert router.route("q1", query, 0.9, decide) == ("rag", "similarity")
+    assert router.route("q2", query, 0.1, decide) == ("direct", "similarity")
+    assert router.needs_llm(query, 0.4) and router.needs_llm(query, None)
+    assert router.route("q3", query, 0.4, decide) == ("rag", "llm")
+    assert calls == ["rag"]
+    assert router.stats()["fallback_rate"] == pytest.approx(1 / 3)
+
+    # LLM decisions are logged for training
+    logged = [json.loads(line) for line in open(router_args["decisions_path"])]
+    assert [(r["question"], r["route"]) for r in logged] == [("q3", "rag")]
+
+
+def test_classifier_trained_on_logged_decisions(router_args):
+    embedder = HashEmbedder(dim=64)
+    rag = [f"what does the paper say about attention head {i}" for i in range(10)]
+    direct = [f"hello there how are you today friend {i}" for i in range(10)]
+    with open(router_args["decisions_path"], "w") as f:
+        for q in rag:
+            f.write(json.dumps({"question": q, "route": "rag"}) + "\n")
+        for q in direct:
+            f.write(json.dumps({"question": q, "route": "direct"}) + "\n")
+
+    result = LocalRouter(mode="classifier", min_confidence=0.6, **router_args).train(embedder.encode, epochs=500, lr=2.0)
+    assert result["accuracy"] == 1.0
+
+    # The saved model is picked up by a new router
+    router = LocalRouter(mode="classifier", min_confidence=0.6, **router_args)
+    decide, calls = _llm("rag")
+    assert router.route("q", embedder.encode(["what does the paper say about attention"])[0], None, decide) == \
+        ("rag", "classifier")
+    assert router.route("q", embedder.encode(["hello how are you"])[0], None, decide) == ("direct", "classifier")
+    assert calls == []
+
+
+def test_model_is_kept_out_of_the_data_folder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    legacy = tmp_path / "data/router_classifier.npz"
+    legacy.parent.mkdir()
+    np.savez(legacy, weights=np.ones(4, dtype=np.float32), bias=0.0)
+
+    router = LocalRouter(decisions_path=str(tmp_path / "d.jsonl"))
+    assert router.model_path.parent == tmp_path.joinpath("data/embeddings").relative_to(tmp_path)
+    assert not legacy.exists() and router.weights is not None
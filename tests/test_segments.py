@@ -0,0 +1,57 @@
+import numpy as np
+
+from src.segments import SegmentLog
+
+
+def _vectors(n, start=0, dim=8):
+    return np.arange(start * dim, (start + n) * dim, dtype=np.float32).reshape(n, dim)
+
+
+def test_replay_yields_only_rows_past_the_base(tmp_path):
+    log = SegmentLog(tmp_path / "segments")
+    log.append(0, _vectors(3))
+    log.append(3, _vectors(2, start=3))
+    log.append(5, _vectors(4, start=5))
+
+    replayed = list(log.replay(base_rows=3))
+    assert [len(v) for v in replayed] == [2, 4]
+    np.testing.assert_array_equal(np.vstack(replayed), _vectors(6, start=3))
+    assert list(log.replay(base_rows=9)) == []
+
+
+def test_replay_stops_at_a_gap(tmp_path):
+    log = SegmentLog(tmp_path / "segments")
+    log.append(0, _vectors(3))
+    log.append(5, _vectors(2, start=5))  # rows 3..4 never committed
+
+    replayed = list(log.replay(base_rows=0))
+    assert [len(v) for v in replayed] == [3]
+
+
+def test_uncommitted_tmp_segment_is_ignored(tmp_path):
+    log = SegmentLog(tmp_path / "segments")
+    log.append(0, _vectors(3))
+    # A crash between writing and renaming leaves only the .tmp file
+    (log.segment_dir / "seg_000000000003_00000002.npy.tmp").write_bytes(b"torn")
+
+    assert [len(v) for v in log.replay(base_rows=0)] == [3]
+    assert log.stats()["segments"] == 1
+
+
+def test_truncate_drops_merged_segments_only(tmp_path):
+    log = SegmentLog(tmp_path / "segments")
+    log.append(0, _vectors(3))
+    log.append(3, _vectors(2, start=3))
+    log.append(5, _vectors(4, start=5))
+
+    log.truncate(merged_rows=5)
+    assert log.stats()["rows"] == 4
+    np.testing.assert_array_equal(np.vstack(list(log.replay(base_rows=5))), _vectors(4, start=5))
+
+
+def test_replay_skips_segments_a_finished_merge_did_not_clean_up(tmp_path):
+    log = SegmentLog(tmp_path / "segments")
+    log.append(0, _vectors(3))
+    log.append(3, _vectors(2, start=3))
+    # Base already holds all 5 rows, truncate never ran
+    assert list(log.replay(base_rows=5)) == []
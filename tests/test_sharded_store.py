@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from src.sharded_store import SHARD_SHIFT, ShardedVectorStore, shard_for
+from src.vectorstore import FAISSVectorStore
+from tests.conftest import texts_for, unit
+
+SOURCES = [f"doc{i}.pdf" for i in range(8)]
+
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch):
+    monkeypatch.setattr(FAISSVectorStore, "_maybe_merge", lambda self: None)
+    monkeypatch.setattr(FAISSVectorStore, "_maybe_compact", lambda self: None)
+    stores = []
+
+    def open_store(n_shards=3):
+        store = ShardedVectorStore(str(tmp_path / "sharded"), n_shards=n_shards)
+        stores.append(store)
+        return store
+    yield open_store
+    for store in stores:
+        store.close()
+
+
+def test_fan_out_search_matches_a_single_store(sharded, store, add_doc):
+    shards = sharded()
+    assert len({shard_for(s, 3) for s in SOURCES}) == 3  # every shard holds something
+    for source in SOURCES:
+        add_doc(shards, source, texts_for(source, 4))
+        add_doc(store, source, texts_for(source, 4))
+
+    queries = unit(np.random.default_rng(0).normal(size=(5, 64))).astype("float32")
+    for got, want in zip(shards.search_batch(queries, 6), store.search_batch(queries, 6)):
+        assert [(h["source"], h["text"]) for h in got] == [(h["source"], h["text"]) for h in want]
+        np.testing.assert_allclose([h["score"] for h in got], [h["score"] for h in want], rtol=1e-5)
+        # Global ids name the shard that holds the chunk
+        assert all(h["id"] >> SHARD_SHIFT == shard_for(h["source"], 3) for h in got)
+    assert shards.sources() == sorted(SOURCES)
+
+
+def test_writes_go_to_the_source_shard_and_survive_reload(sharded, add_doc):
+    shards = sharded()
+    for source in SOURCES:
+        add_doc(shards, source, texts_for(source, 3))
+    version = shards.version
+
+    shards.remove_sources(["doc0.pdf"])
+    add_doc(shards, "doc1.pdf", texts_for("doc1.pdf", 2, "v2"))
+    assert shards.version == version + 2
+    assert "doc0.pdf" not in shards.sources()
+    hits = shards.search_sparse("doc1 v2 paragraph", 10, filters={"source": "doc1.pdf"})
+    assert sorted(h["text"] for h in hits) == texts_for("doc1.pdf", 2, "v2")
+
+    for shard in shards.shards:
+        shard.store._dir_lock.close()
+    reloaded = sharded()
+    assert reloaded.sources() == sorted(SOURCES[1:])
+    assert len(reloaded.filter_ids({"source": "doc1.pdf"})) == 2
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from src.sparse import BM25Index, fuse, tokenize
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("The GPU-kernel of a CUDA stream!") == ["gpu", "kernel", "cuda", "stream"]
+
+
+def test_search_ranks_rare_terms_and_reloads(tmp_path):
+    index = BM25Index(tmp_path / "bm25")
+    index.add(0, ["cuda kernel launch", "kernel panic", "tea time"])
+    index.add(3, ["cuda cuda streams"])
+
+    rows, scores = index.search("cuda", 5)
+    assert rows.tolist() == [3, 0]
+    assert scores[0] > scores[1]
+
+    reloaded = BM25Index(tmp_path / "bm25")
+    assert len(reloaded) == 4
+    np.testing.assert_array_equal(reloaded.search("cuda", 5)[0], rows)
+    assert reloaded.search("cuda", 5, exclude=np.array([3]))[0].tolist() == [0]
+    assert reloaded.search("kernel", 5, include=np.array([1]))[0].tolist() == [1]
+
+
+def test_append_must_continue_at_the_last_row(tmp_path):
+    index = BM25Index(tmp_path / "bm25")
+    index.add(0, ["a b c"])
+    with pytest.raises(ValueError):
+        index.add(5, ["d"])
+
+
+def test_rrf_fusion_sums_reciprocal_ranks():
+    dense = [{"id": 1, "score": 0.9}, {"id": 2, "score": 0.8}, {"id": 3, "score": 0.7}]
+    sparse = [{"id": 3, "score": 12.0}, {"id": 4, "score": 3.0}]
+
+    fused = fuse(dense, sparse, top_k=4)
+    assert [h["id"] for h in fused] == [3, 1, 2, 4]
+    assert fused[0]["score"] == pytest.approx(1 / 63 + 1 / 61)
+    assert fused[1]["score"] == pytest.approx(1 / 61)
+    assert (fused[0]["dense_score"], fused[0]["bm25_score"]) == (0.7, 12.0)
+    assert fused[1]["bm25_score"] is None and fused[3]["dense_score"] is None
+    assert len(fuse(dense, sparse, top_k=2)) == 2
+
+
+def test_weighted_fusion_normalises_each_side():
+    dense = [{"id": 1, "score": 0.9}, {"id": 2, "score": 0.5}]
+    sparse = [{"id": 2, "score": 20.0}, {"id": 3, "score": 10.0}]
+
+    fused = fuse(dense, sparse, top_k=3, method="weighted", alpha=0.5)
+    assert [h["id"] for h in fused] == [1, 2, 3] or [h["id"] for h in fused] == [2, 1, 3]
+    assert {h["id"]: h["score"] for h in fused} == pytest.approx({1: 0.5, 2: 0.5, 3: 0.0})
+    with pytest.raises(ValueError):
+        fuse(dense, sparse, top_k=3, method="max")
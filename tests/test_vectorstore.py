@@ -0,0 +1,182 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src.vectorstore import FAISSVectorStore
+from tests.conftest import reopen, texts_for, unit
+
+
+def _live_ids(store):
+    rows = np.setdiff1d(np.arange(len(store.chunks)), store._dead_rows)
+    return set(store.chunks.ids_for_rows(rows).tolist())
+
+
+def test_segments_replayed_on_reload(store, add_doc, embedder):
+    add_doc(store, "a.pdf", texts_for("a", 5))
+    add_doc(store, "b.pdf", texts_for("b", 3))
+    assert store.segments.stats()["segments"] == 2  # nothing merged into faiss.index yet
+
+    loaded = reopen(store)
+    assert loaded.index.ntotal == 8
+    assert len(loaded.sparse) == 8
+    hit = loaded.search(embedder.encode(["b  paragraph 2 token2 shared words"]), 1)[0]
+    assert hit["source"] == "b.pdf" and hit["text"] == texts_for("b", 3)[2]
+
+
+def test_chunk_rows_without_a_segment_are_dropped_on_load(store, add_doc):
+    add_doc(store, "a.pdf", texts_for("a", 4))
+    # Crash after the chunk store append, before the vector segment committed
+    store.chunks.append([{"text": "orphan", "source": "x.pdf"}])
+
+    loaded = reopen(store)
+    assert len(loaded.chunks) == loaded.index.ntotal == 4
+    assert "x.pdf" not in loaded.sources()
+
+
+def test_replace_sources_is_one_commit(store, add_doc, embedder):
+    n = 12
+    add_doc(store, "doc.pdf", texts_for("doc", n, "v0"))
+    query = embedder.encode(["doc paragraph shared words"])
+    mixed, stop = [], threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            hits = store.search(query, 2 * n, filters={"source": "doc.pdf"})
+            versions = {h["text"].split()[1] for h in hits}
+            if len(hits) != n or len(versions) != 1:
+                mixed.append((len(hits), versions))
+
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    for t in readers:
+        t.start()
+    for version in range(1, 30):
+        add_doc(store, "doc.pdf", texts_for("doc", n, f"v{version}"))
+    stop.set()
+    for t in readers:
+        t.join()
+
+    assert not mixed
+    assert store.sources() == ["doc.pdf"]
+    assert len(_live_ids(store)) == n
+
+
+def test_compaction_keeps_ids_and_survives_reload(store, add_doc, embedder):
+    kept = add_doc(store, "keep.pdf", texts_for("keep", 6))
+    add_doc(store, "gone.pdf", texts_for("gone", 6))
+    store.remove_sources(["gone.pdf"])
+    query = embedder.encode([texts_for("keep", 6)[4]])
+    before = store.search(query, 3)
+
+    store.compact()
+    assert len(store.chunks) == store.index.ntotal == 6
+    assert len(store.tombstones) == 0
+    assert store.search(query, 3) == before
+    np.testing.assert_array_equal(store.chunks.ids_for_rows(np.arange(6)), kept)
+
+    # New rows after compaction get fresh ids (never reused) and survive a reload with the rest
+    new_ids = add_doc(store, "new.pdf", texts_for("new", 2))
+    assert new_ids.min() > max(kept.max(), 11)
+    loaded = reopen(store)
+    assert loaded.index.ntotal == len(loaded.chunks) == len(loaded.sparse) == 8
+    assert sorted(loaded.sources()) == ["keep.pdf", "new.pdf"]
+    assert loaded.search(query, 3) == before
+    assert loaded.search_sparse("gone", 5) == []
+
+
+def test_rows_added_during_compaction_are_carried_over(store, add_doc, monkeypatch):
+    add_doc(store, "a.pdf", texts_for("a", 5))
+    add_doc(store, "b.pdf", texts_for("b", 5))
+    store.remove_sources(["a.pdf"])
+
+    # Land an upload and a removal while compaction rewrites from its snapshot
+    rebuild = type(store.sparse).rebuild
+
+    def rebuild_with_writes(sparse, texts):
+        add_doc(store, "c.pdf", texts_for("c", 3))
+        store.remove_sources(["b.pdf"])
+        return rebuild(sparse, texts)
+
+    monkeypatch.setattr(type(store.sparse), "rebuild", rebuild_with_writes)
+    store.compact()
+    monkeypatch.undo()
+
+    assert store.sources() == ["c.pdf"]
+    assert len(store.chunks) == store.index.ntotal == len(store.sparse) == 8  # 5 of b (now dead) + 3 of c
+    assert [h["source"] for h in store.search_sparse("c paragraph", 3)] == ["c.pdf"] * 3
+
+    loaded = reopen(store)
+    assert loaded.sources() == ["c.pdf"]
+    assert loaded.index.ntotal == len(loaded.chunks) == 8
+    assert [h["source"] for h in loaded.search_sparse("c paragraph", 3)] == ["c.pdf"] * 3
+
+
+def test_compaction_interrupted_after_commit_point_is_finished_on_load(store, add_doc, monkeypatch):
+    add_doc(store, "a.pdf", texts_for("a", 4))
+    add_doc(store, "b.pdf", texts_for("b", 4))
+    store.remove_sources(["a.pdf"])
+
+    def crash(self):
+        if self.compact_marker.exists():
+            raise RuntimeError("killed after the commit point")
+
+    monkeypatch.setattr(FAISSVectorStore, "_recover_compaction", crash)
+    with pytest.raises(RuntimeError):
+        store.compact()
+    monkeypatch.undo()
+    assert store.compact_marker.exists()
+
+    loaded = reopen(store)
+    assert not loaded.compact_marker.exists()
+    assert loaded.index.ntotal == len(loaded.chunks) == len(loaded.sparse) == 4
+    assert loaded.sources() == ["b.pdf"]
+
+
+def test_staged_files_of_a_live_instance_are_left_alone(store, add_doc):
+    add_doc(store, "a.pdf", texts_for("a", 2))
+    staged = store.persist_dir / "chunks.compact"
+    staged.mkdir()  # a compaction in progress (before its commit point)
+
+    other = FAISSVectorStore(str(store.persist_dir))
+    assert staged.exists()
+    other._dir_lock.close()
+
+    store._dir_lock.close()
+    FAISSVectorStore(str(store.persist_dir))  # alone now → orphan discarded
+    assert not staged.exists()
+
+
+@pytest.mark.parametrize("filters", [
+    {"source": "b.pdf"},
+    {"sources": ["a.pdf", "c.txt"], "metadata": {"page": [0, 2]}},
+    {"file_types": [".txt"]},
+])
+def test_filtered_search_subindex_matches_id_selector(store, add_doc, embedder, monkeypatch, filters):
+    for source in ("a.pdf", "b.pdf", "c.txt"):
+        for page in range(3):
+            add_doc(store, source, texts_for(source, 4, f"p{page}"), replace=False, page=page)
+    store.remove_sources(["c.txt"])
+    add_doc(store, "c.txt", texts_for("c.txt", 4, "again"), replace=False, page=2)
+    # Random directions — text queries against hashed embeddings tie too often to compare rankings
+    queries = unit(np.random.default_rng(0).normal(size=(4, 64))).astype("float32")
+
+    monkeypatch.setattr(FAISSVectorStore, "SUBINDEX_MAX_ROWS", 10_000)
+    via_subindex = store.search_batch(queries, 5, filters=filters)
+    monkeypatch.setattr(FAISSVectorStore, "SUBINDEX_MAX_ROWS", 0)
+    via_selector = store.search_batch(queries, 5, filters=filters)
+
+    allowed = set(store.filter_ids(filters).tolist())
+    for sub, sel in zip(via_subindex, via_selector):
+        assert [h["id"] for h in sub] == [h["id"] for h in sel]
+        np.testing.assert_allclose([h["score"] for h in sub], [h["score"] for h in sel], rtol=1e-5)
+        assert {h["id"] for h in sub} <= allowed
+
+
+def test_sparse_search_skips_removed_and_filtered_rows(store, add_doc):
+    add_doc(store, "a.pdf", ["alpha zebra", "alpha"])
+    add_doc(store, "b.pdf", ["zebra crossing"])
+    add_doc(store, "c.pdf", ["zebra again"])
+    store.remove_sources(["c.pdf"])
+
+    assert {h["source"] for h in store.search_sparse("zebra", 5)} == {"a.pdf", "b.pdf"}
+    assert [h["source"] for h in store.search_sparse("zebra", 5, filters={"source": "b.pdf"})] == ["b.pdf"]